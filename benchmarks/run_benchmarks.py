@@ -0,0 +1,295 @@
+"""
+claudemol benchmark suite.
+
+Measures the socket protocol and session code against the real plugin
+``SocketServer`` running in-process with a fake ``pymol.cmd``, so it runs on
+any Linux box without PyMOL. Results are written as JSON so they can be
+compared between commits.
+
+Usage:
+    python benchmarks/run_benchmarks.py                       # all benchmarks
+    python benchmarks/run_benchmarks.py --only latency,render
+    python benchmarks/run_benchmarks.py --max-bytes 10000000 -o out.json
+    python benchmarks/run_benchmarks.py --real-pymol          # + real launch time
+
+Benchmarks:
+    latency     round-trip time of tiny commands
+    throughput  request and response payloads from 1 KB to 100 MB
+    fairness    several concurrent clients issuing tiny commands
+    launch      stub server start/stop (and real PyMOL launch/recover)
+    render      pymol_view overhead with rendering stubbed out
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol import __version__  # noqa: E402
+from claudemol.connection import PyMOLConnection  # noqa: E402
+from claudemol.stats import summarize  # noqa: E402
+from claudemol.testing import FakeCmd, stub_server  # noqa: E402
+
+PAYLOAD_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000]
+
+
+def _connect(server):
+    conn = PyMOLConnection(port=server.port)
+    conn.connect()
+    return conn
+
+
+def bench_latency(server, args):
+    """Round-trip latency of a no-op command."""
+    conn = _connect(server)
+    try:
+        for _ in range(20):  # warm up
+            conn.execute("pass")
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            conn.execute("pass")
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        conn.disconnect()
+    return {"round_trip_ms": summarize(samples)}
+
+
+def _timed_case(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def bench_throughput(server, args):
+    """Request and response payload throughput across sizes."""
+    results = []
+    conn = _connect(server)
+    try:
+        for size in PAYLOAD_SIZES:
+            if size > args.max_bytes:
+                break
+            repeats = 3 if size <= 1_000_000 else 1
+            upload = "_ = '" + "x" * size + "'"
+            download = f"_result = 'x' * {size}"
+            entry = {"bytes": size}
+            slowest = 0.0
+            for direction, code in (("request", upload), ("response", download)):
+                try:
+                    seconds = _timed_case(lambda: conn.execute(code), repeats)
+                except (TimeoutError, ConnectionError, RuntimeError) as e:
+                    entry[f"{direction}_error"] = str(e)
+                    slowest = float("inf")
+                    break
+                entry[f"{direction}_s"] = seconds
+                entry[f"{direction}_mb_per_s"] = size / seconds / 1e6
+                slowest = max(slowest, seconds)
+            results.append(entry)
+            if slowest > args.case_budget:
+                # Larger payloads would only take longer; record and stop
+                results.append({"skipped_above_bytes": size})
+                break
+    finally:
+        conn.disconnect()
+    return {"payloads": results}
+
+
+def bench_fairness(server, args):
+    """Concurrent clients hammering tiny commands for a fixed duration."""
+    counts = [0] * args.clients
+    errors = [0] * args.clients
+    latencies = [[] for _ in range(args.clients)]
+    stop = threading.Event()
+
+    def client(i):
+        conn = PyMOLConnection(port=server.port)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                if not conn.is_connected():
+                    conn.connect()
+                conn.execute("pass")
+            except Exception:
+                errors[i] += 1
+                conn.disconnect()
+                continue
+            latencies[i].append((time.perf_counter() - start) * 1000)
+            counts[i] += 1
+        conn.disconnect()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(10.0)
+
+    total = sum(counts)
+    # Jain's fairness index: 1.0 when every client got the same share
+    squares = sum(c * c for c in counts)
+    jain = (total * total) / (len(counts) * squares) if squares else 0.0
+    return {
+        "clients": args.clients,
+        "duration_s": args.duration,
+        "ops_per_client": counts,
+        "errors_per_client": errors,
+        "throughput_ops_s": total / args.duration,
+        "jain_fairness": jain,
+        "latency_ms": summarize([x for per in latencies for x in per]),
+    }
+
+
+def bench_launch(server, args):
+    """Time to bring a stub server up and to recover one after a stop."""
+    starts = []
+    recovers = []
+    for _ in range(5):
+        start = time.perf_counter()
+        with stub_server() as s:
+            conn = _connect(s)
+            conn.execute("pass")
+            starts.append(time.perf_counter() - start)
+            conn.disconnect()
+            s.stop()
+            start = time.perf_counter()
+            s.start()
+            s.ready.wait(5.0)
+            conn = PyMOLConnection(port=s.port)
+            conn.execute("pass")
+            recovers.append(time.perf_counter() - start)
+            conn.disconnect()
+    result = {
+        "stub_start_s": summarize(starts),
+        "stub_recover_s": summarize(recovers),
+    }
+    if args.real_pymol:
+        result["real"] = _bench_real_launch()
+    return result
+
+
+def _bench_real_launch():
+    """Launch and recover a real PyMOL on a spare port (needs PyMOL)."""
+    from claudemol.session import PyMOLSession
+
+    session = PyMOLSession(port=9899)
+    try:
+        start = time.perf_counter()
+        session.start(timeout=60.0)
+        session.execute("pass")
+        launched = time.perf_counter() - start
+        start = time.perf_counter()
+        session.recover(timeout=60.0)
+        session.execute("pass")
+        recovered = time.perf_counter() - start
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        session.stop()
+    return {"launch_s": launched, "recover_s": recovered}
+
+
+def bench_render(server, args):
+    """pymol_view round trip with rendering stubbed, i.e. pure overhead."""
+    from claudemol import view
+
+    scratch = tempfile.mkdtemp(prefix="claudemol-bench-")
+    original = view.SCRATCH_DIR
+    view.SCRATCH_DIR = view.Path(scratch)
+    samples = []
+    try:
+        for i in range(args.iterations // 10 or 1):
+            start = time.perf_counter()
+            view.pymol_view("pass", name=f"bench_{i}", port=server.port)
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        view.SCRATCH_DIR = original
+    return {"pymol_view_ms": summarize(samples)}
+
+
+BENCHMARKS = {
+    "latency": bench_latency,
+    "throughput": bench_throughput,
+    "fairness": bench_fairness,
+    "launch": bench_launch,
+    "render": bench_render,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="claudemol benchmark suite")
+    parser.add_argument(
+        "--only", default="", help="Comma-separated benchmarks to run (default: all)"
+    )
+    parser.add_argument("-o", "--output", default="bench_output.json")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--max-bytes", type=int, default=PAYLOAD_SIZES[-1])
+    parser.add_argument(
+        "--case-budget",
+        type=float,
+        default=30.0,
+        help="Stop growing payloads once one size takes longer than this (s)",
+    )
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument(
+        "--real-pymol", action="store_true", help="Also time a real PyMOL launch"
+    )
+    args = parser.parse_args()
+
+    selected = [b for b in args.only.split(",") if b] or list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "claudemol_version": __version__,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    with stub_server(FakeCmd()) as server:
+        for name in selected:
+            print(f"Running {name}...", flush=True)
+            start = time.perf_counter()
+            report["results"][name] = BENCHMARKS[name](server, args)
+            report["results"][name]["elapsed_s"] = time.perf_counter() - start
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Structure Analysis
+
+Client side of the plugin's analysis handlers. Queries run inside PyMOL with
+NumPy against indexes cached per selection and state (rebuilt only when the
+coordinates change) and come back as arrays, so many queries can share one
+round trip.
+
+Usage:
+    from claudemol.analysis import (
+        ensemble,
+        interface,
+        nearest,
+        residue_contacts,
+        within,
+    )
+
+    # Binding-site residues around many ligands in one call
+    pockets = residue_contacts(conn, ligands, target="polymer", radius=5.0)
+
+    hits = within(conn, "organic", target="polymer", radius=4.0)
+    hits["model"], hits["index"], hits["distance"]
+
+    # Paratope/epitope residues, contact map and buried area
+    iface = interface(conn, "chain H+L", "chain A", cutoff=4.5)
+
+    # RMSD per state, RMSF per atom and clusters of an NMR ensemble
+    stats = ensemble(conn, "2kxa and name CA", cluster=1.5, b_factors=True)
+
+Atoms are identified by object name ("model") and PyMOL atom "index", i.e.
+the selection ``model and index N``. Needs NumPy on the client.
+"""
+
+from claudemol.protocol import unpack_arrays
+
+
+def _request(conn, message):
+    conn = getattr(conn, "connection", conn)
+    if not conn.framed:
+        raise RuntimeError("Analysis queries need a newer PyMOL plugin")
+    result = conn.request(message)
+    if result.get("status") != "success":
+        raise RuntimeError(result.get("error", "Unknown error"))
+    return result
+
+
+def _spatial(conn, op, queries, target, state, **params):
+    """Run a spatial query; returns per-query results (or one if queries is
+    a single selection string)."""
+    single = isinstance(queries, str)
+    result = _request(
+        conn,
+        {
+            "type": "spatial",
+            "op": op,
+            "queries": [queries] if single else list(queries),
+            "target": target,
+            "state": state,
+            **params,
+        },
+    )
+    if op == "residues":
+        rows = result["residues"]
+    else:
+        import numpy
+
+        arrays = unpack_arrays(result["arrays"], result.get("_blob", b""))
+        models = numpy.array(result["models"] + [""], dtype=object)
+        offsets = arrays["offsets"]
+        rows = []
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            row = {
+                "model": models[arrays["model"][start:end]],
+                "index": arrays["index"][start:end],
+                "distance": arrays["distance"][start:end],
+            }
+            rows.append(row)
+    return rows[0] if single else rows
+
+
+def within(conn, query, target="all", radius=5.0, state=1):
+    """
+    Target atoms within ``radius`` of any atom of ``query``.
+
+    Args:
+        conn: Connected PyMOLConnection (or a PyMOLSession)
+        query: Selection, or a list of selections for one batched call
+        target: Selection to search (indexed and cached in PyMOL)
+        radius: Distance cutoff in Angstrom
+        state: Coordinate state
+
+    Returns:
+        Dict of arrays "model", "index" and "distance" (to the closest query
+        atom), sorted by target atom; a list of them for a list of queries
+    """
+    return _spatial(conn, "within", query, target, state, radius=radius)
+
+
+def nearest(conn, query, target="all", k=1, state=1):
+    """
+    The ``k`` nearest target atoms to each atom of ``query``.
+
+    Returns:
+        Dict of (query atoms, k) arrays "model", "index" and "distance",
+        nearest first. Missing neighbours (fewer than k target atoms) have
+        index -1 and distance inf. A list of them for a list of queries.
+    """
+    return _spatial(conn, "nearest", query, target, state, k=k)
+
+
+def residue_contacts(conn, query, target="all", radius=5.0, state=1):
+    """
+    Target residues with any atom within ``radius`` of ``query``, i.e.
+    ``byres (target within radius of query)``.
+
+    Returns:
+        List of {"model", "chain", "resi", "resn", "distance"} dicts with the
+        closest distance per residue; a list of such lists for a list of
+        queries
+    """
+    return _spatial(conn, "residues", query, target, state, radius=radius)
+
+
+def interface(conn, selection1, selection2, cutoff=4.5, state=1, area=True):
+    """
+    Residue-level interface between two selections.
+
+    Args:
+        conn: Connected PyMOLConnection (or a PyMOLSession)
+        selection1, selection2: The two sides (e.g. antibody and antigen)
+        cutoff: Atom-atom contact distance in Angstrom
+        state: Coordinate state
+        area: Also estimate the buried solvent accessible area
+
+    Returns:
+        Dict with "residues1" and "residues2" (interface residues of each
+        side as {"model", "chain", "resi", "resn"}), "counts" and
+        "min_distance" arrays of shape (len(residues1), len(residues2)),
+        "atom_contacts", and with area=True "buried_area", "sasa1" and
+        "sasa2" (A^2, over the atoms near the interface). Cached in PyMOL
+        until either side's coordinates change.
+    """
+    result = _request(
+        conn,
+        {
+            "type": "interface",
+            "selection1": selection1,
+            "selection2": selection2,
+            "cutoff": cutoff,
+            "state": state,
+            "area": area,
+        },
+    )
+    arrays = unpack_arrays(result.pop("arrays"), result.pop("_blob", b""))
+    for key in ("status", "timings", "scene_serial"):
+        result.pop(key, None)
+    result.update(arrays)
+    return result
+
+
+def ensemble(conn, selection, reference=1, fit=True, cluster=None, b_factors=False):
+    """
+    Statistics over all states of a multi-state object (NMR ensemble,
+    streamed trajectory), computed in PyMOL from one array of every state.
+
+    Args:
+        conn: Connected PyMOLConnection (or a PyMOLSession)
+        selection: Atoms to compare (e.g. "obj and name CA"); every state
+            must have the same atoms
+        reference: State (1-based) to superpose on and measure RMSD to
+        fit: Superpose each state on the reference first; False for states
+            already aligned
+        cluster: RMSD cutoff in Angstrom to also cluster the states
+        b_factors: Write the RMSF to the atoms' B-factors, for
+            ``cmd.spectrum("b", ...)``
+
+    Returns:
+        Dict with "states", "atoms", arrays "rmsd" (per state, to the
+        reference), "rmsf" (per atom, about the mean structure), "model"
+        and "index" (per atom), and with cluster "pairwise" (states x states
+        RMSD), "clusters" (label per state, 0 = largest) and "centers" (the
+        central state of each cluster, 1-based). Cached in PyMOL until the
+        coordinates change.
+    """
+    import numpy
+
+    result = _request(
+        conn,
+        {
+            "type": "ensemble",
+            "selection": selection,
+            "reference": reference,
+            "fit": fit,
+            "cluster": cluster,
+            "b_factors": b_factors,
+        },
+    )
+    arrays = unpack_arrays(result.pop("arrays"), result.pop("_blob", b""))
+    models = numpy.array(result.pop("models"), dtype=object)
+    arrays["model"] = models[arrays["model"]]
+    for key in ("status", "timings", "scene_serial"):
+        result.pop(key, None)
+    result.update(arrays)
+    return result
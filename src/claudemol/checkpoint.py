@@ -0,0 +1,111 @@
+"""
+Session Checkpoints
+
+Compressed snapshots of a PyMOL session (``cmd.get_session()``) kept by the
+client so a crashed PyMOL can be brought back with its objects, colours and
+view instead of starting blank.
+
+The plugin produces the snapshot; this module only stores it. Checkpoints
+live in a bounded in-memory store, and optionally the latest one is also
+written to disk so it survives the client process.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_KEEP = 3
+
+
+class Checkpoint:
+    """One compressed session snapshot."""
+
+    def __init__(self, data, codec, serial=None, raw_bytes=0, created_at=None):
+        self.data = data
+        self.codec = codec
+        self.serial = serial
+        self.raw_bytes = raw_bytes
+        self.created_at = created_at or time.time()
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def meta(self):
+        return {
+            "codec": self.codec,
+            "serial": self.serial,
+            "raw_bytes": self.raw_bytes,
+            "created_at": self.created_at,
+        }
+
+
+class CheckpointStore:
+    """
+    Keeps the most recent checkpoints within a count and byte budget.
+
+    The newest checkpoint is always kept, even if it alone exceeds
+    ``max_bytes``. With ``path`` set, each new checkpoint also replaces the
+    file at that path (a JSON header line followed by the compressed
+    session), which ``latest()`` falls back to when memory is empty.
+    """
+
+    def __init__(self, keep=DEFAULT_KEEP, max_bytes=DEFAULT_MAX_BYTES, path=None):
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self.path = Path(path) if path else None
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def total_bytes(self):
+        return sum(item.size for item in self._items)
+
+    def add(self, checkpoint):
+        with self._lock:
+            self._items.append(checkpoint)
+            while len(self._items) > 1 and (
+                len(self._items) > self.keep or self.total_bytes > self.max_bytes
+            ):
+                self._items.popleft()
+        if self.path:
+            self._write(checkpoint)
+
+    def latest(self):
+        """Newest checkpoint, from memory or else from disk (None if none)."""
+        with self._lock:
+            if self._items:
+                return self._items[-1]
+        if self.path:
+            return self._read()
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+        if self.path:
+            self.path.unlink(missing_ok=True)
+
+    def _write(self, checkpoint):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(checkpoint.meta()).encode("utf-8") + b"\n")
+            f.write(checkpoint.data)
+        os.replace(tmp, self.path)
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        return Checkpoint(data, **meta)
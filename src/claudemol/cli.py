@@ -8,9 +8,13 @@ Usage:
     claudemol info     # Show installation info
     claudemol launch   # Launch PyMOL or connect to existing instance
     claudemol exec     # Execute code in PyMOL
+    claudemol stats    # Show per-command latency percentiles
+    claudemol render   # Render scenes from a JSONL/YAML manifest
+    claudemol loadtest # Simulate concurrent clients against one PyMOL
 """
 
 import argparse
+import json
 import os
 import stat
 import sys
@@ -27,6 +31,9 @@ from claudemol.connection import (
     get_plugin_path,
     save_config,
 )
+from claudemol.loadtest import parse_mix, run_loadtest
+from claudemol.render import render_manifest
+from claudemol.stats import LatencyStats
 
 WRAPPER_DIR = Path.home() / ".claudemol" / "bin"
 WRAPPER_PATH = WRAPPER_DIR / "claudemol"
@@ -241,6 +248,192 @@ def do_exec(args):
         return 1
 
 
+def do_stats(args):
+    """Show server-side latency percentiles per command kind."""
+    conn = PyMOLConnection()
+    try:
+        conn.connect(timeout=2.0)
+        result = conn.get_server_stats(reset=args.reset)
+    except ConnectionError:
+        print("Error: Cannot connect to PyMOL. Is it running?", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.disconnect()
+
+    stats = LatencyStats()
+    stats.extend(result.get("samples", {}))
+
+    if args.format == "json":
+        print(stats.to_json())
+        return 0
+    if args.format == "prometheus":
+        print(stats.to_prometheus(prefix="claudemol_server"), end="")
+        return 0
+
+    summary = stats.summary()
+    print(f"PyMOL uptime: {result.get('uptime_s', 0):.0f}s")
+    if not summary:
+        print("No commands recorded yet.")
+        return 0
+    header = f"{'kind':<18} {'field':<14} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for kind, fields in summary.items():
+        for field in (
+            "total_ms",
+            "queue_ms",
+            "exec_ms",
+            "serialize_ms",
+            "bytes_in",
+            "bytes_out",
+            "wire_bytes_out",
+            "depth",
+        ):
+            if field not in fields:
+                continue
+            s = fields[field]
+            print(
+                f"{kind:<18} {field:<14} {s['count']:>6} "
+                f"{s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f}"
+            )
+    return 0
+
+
+def do_profile(args):
+    """Show the hottest functions of code profiled inside PyMOL."""
+    enable = {"on": True, "off": False}.get(args.action)
+    conn = PyMOLConnection()
+    try:
+        conn.connect(timeout=2.0)
+        result = conn.get_profile(
+            top=args.top, key=args.key, sort=args.sort, reset=args.reset, enable=enable
+        )
+    except ConnectionError:
+        print("Error: Cannot connect to PyMOL. Is it running?", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.disconnect()
+
+    if args.format == "json":
+        print(json.dumps(result, indent=2))
+        return 0
+
+    print(f"Profiling every execution: {'on' if result['enabled'] else 'off'}")
+    if not result["keys"]:
+        print("No profiles recorded yet.")
+        return 0
+    print(f"{'runs':>6} {'total_ms':>10}  key")
+    for entry in result["keys"]:
+        print(
+            f"{entry['runs']:>6} {entry['total_ms']:>10.1f}  "
+            f"{entry['key']}  {entry['label']}"
+        )
+    print()
+    header = f"{'calls':>8} {'tottime_ms':>11} {'cumtime_ms':>11}  function"
+    print(header)
+    print("-" * len(header))
+    for row in result["functions"]:
+        print(
+            f"{row['calls']:>8} {row['tottime_ms']:>11.2f} "
+            f"{row['cumtime_ms']:>11.2f}  {row['function']}"
+        )
+    return 0
+
+
+def do_render(args):
+    """Render every scene in a manifest."""
+    if args.ports:
+        try:
+            ports = [int(p) for p in args.ports.split(",") if p.strip()]
+        except ValueError:
+            print(f"Error: Invalid --ports value: {args.ports}", file=sys.stderr)
+            return 1
+    else:
+        ports = list(range(args.port, args.port + args.workers))
+
+    try:
+        results = render_manifest(
+            args.manifest, ports=ports, state_path=args.state, force=args.force
+        )
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(
+        f"Rendered {len(results['rendered'])}, "
+        f"skipped {len(results['skipped'])}, "
+        f"failed {len(results['failed'])}"
+    )
+    return 1 if results["failed"] else 0
+
+
+def do_loadtest(args):
+    """Run concurrent clients against one PyMOL and report how it held up."""
+    try:
+        mix = parse_mix(args.mix) if args.mix else None
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    try:
+        report = run_loadtest(
+            port=args.port,
+            clients=args.clients,
+            duration=args.duration,
+            mix=mix,
+            atoms=args.atoms,
+            interval=args.interval,
+            stub=args.stub,
+        )
+    except ConnectionError:
+        print("Error: Cannot connect to PyMOL. Is it running?", file=sys.stderr)
+        print("  Run: claudemol launch, or use --stub", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.format == "json":
+        print(json.dumps(report, indent=2))
+        return 1 if report["dropped"] else 0
+
+    print(
+        f"{report['clients']} clients, {report['duration_s']:.1f}s: "
+        f"{report['requests']} requests, {report['throughput_rps']:.1f}/s, "
+        f"{report['errors']} errors, {report['dropped']} dropped"
+    )
+    header = f"{'kind':<18} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+    print()
+    print(header)
+    print("-" * len(header))
+    rows = [(kind, s) for kind, s in report["latency"].items()]
+    rows += [(f"queue.{kind}", s) for kind, s in report["server"].items()]
+    for kind, s in rows:
+        print(
+            f"{kind:<18} {s['count']:>6} {s['p50']:>9.2f} {s['p95']:>9.2f} "
+            f"{s['p99']:>9.2f} {s['max']:>9.2f}"
+        )
+    print()
+    header = (
+        f"{'t':>7} {'req/s':>8} {'p95_ms':>9} {'errors':>7} "
+        f"{'dropped':>8} {'rss_mb':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in report["timeline"]:
+        rss = f"{row['rss_mb']:.0f}" if row["rss_mb"] is not None else "-"
+        print(
+            f"{row['t']:>7.1f} {row['rps']:>8.1f} {row['p95_ms']:>9.2f} "
+            f"{row['errors']:>7} {row['dropped']:>8} {rss:>8}"
+        )
+    return 1 if report["dropped"] else 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="claudemol: PyMOL integration for Claude Code",
@@ -280,6 +473,118 @@ def main():
         help="Python code to execute (or pipe via stdin)",
     )
 
+    # stats
+    stats_parser = subparsers.add_parser(
+        "stats", help="Show per-command latency percentiles from PyMOL"
+    )
+    stats_parser.add_argument(
+        "--format",
+        choices=["table", "json", "prometheus"],
+        default="table",
+        help="Output format (default: table)",
+    )
+    stats_parser.add_argument(
+        "--reset", action="store_true", help="Clear the server samples after reading"
+    )
+
+    # profile
+    profile_parser = subparsers.add_parser(
+        "profile", help="Show cProfile stats of code run inside PyMOL"
+    )
+    profile_parser.add_argument(
+        "action",
+        nargs="?",
+        choices=["show", "on", "off"],
+        default="show",
+        help="Show the profiles, or profile every execution on/off first",
+    )
+    profile_parser.add_argument(
+        "--top", type=int, default=30, help="Number of functions (default: 30)"
+    )
+    profile_parser.add_argument(
+        "--key", default=None, help="Only this procedure name or code:<hash>"
+    )
+    profile_parser.add_argument(
+        "--sort",
+        choices=["cumulative", "tottime", "calls"],
+        default="cumulative",
+        help="Sort order (default: cumulative)",
+    )
+    profile_parser.add_argument(
+        "--format",
+        choices=["table", "json"],
+        default="table",
+        help="Output format (default: table)",
+    )
+    profile_parser.add_argument(
+        "--reset", action="store_true", help="Clear the profiles after reading"
+    )
+
+    # render
+    render_parser = subparsers.add_parser(
+        "render", help="Render scenes from a JSONL/YAML manifest"
+    )
+    render_parser.add_argument("manifest", help="Scene manifest (.jsonl/.yaml)")
+    render_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of PyMOL instances on consecutive ports (default: 1)",
+    )
+    render_parser.add_argument(
+        "--port", type=int, default=9880, help="First PyMOL port (default: 9880)"
+    )
+    render_parser.add_argument(
+        "--ports", default=None, help="Explicit comma-separated PyMOL ports"
+    )
+    render_parser.add_argument(
+        "--state",
+        default=None,
+        help="State file for resuming (default: <manifest>.state.json)",
+    )
+    render_parser.add_argument(
+        "--force", action="store_true", help="Re-render up-to-date scenes"
+    )
+
+    # loadtest
+    loadtest_parser = subparsers.add_parser(
+        "loadtest", help="Simulate concurrent clients against one PyMOL"
+    )
+    loadtest_parser.add_argument(
+        "--clients", type=int, default=8, help="Concurrent connections (default: 8)"
+    )
+    loadtest_parser.add_argument(
+        "--duration", type=float, default=30.0, help="Seconds to run (default: 30)"
+    )
+    loadtest_parser.add_argument(
+        "--mix",
+        default=None,
+        help="Request weights, e.g. tiny=8,query=2,render=1 (the default)",
+    )
+    loadtest_parser.add_argument(
+        "--atoms", type=int, default=2000, help="Test object size (default: 2000)"
+    )
+    loadtest_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds per timeline row and memory sample (default: 1)",
+    )
+    loadtest_parser.add_argument(
+        "--port", type=int, default=9880, help="PyMOL port (default: 9880)"
+    )
+    loadtest_parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="Test the plugin in-process against a fake pymol.cmd",
+    )
+    loadtest_parser.add_argument(
+        "--format",
+        choices=["table", "json"],
+        default="table",
+        help="Output format (default: table)",
+    )
+
     args = parser.parse_args()
 
     if args.command is None:
@@ -298,6 +603,14 @@ def main():
         return do_launch(args)
     elif args.command == "exec":
         return do_exec(args)
+    elif args.command == "stats":
+        return do_stats(args)
+    elif args.command == "profile":
+        return do_profile(args)
+    elif args.command == "render":
+        return do_render(args)
+    elif args.command == "loadtest":
+        return do_loadtest(args)
 
 
 if __name__ == "__main__":
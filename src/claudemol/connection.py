@@ -9,13 +9,38 @@ import os
 import shutil
 import socket
 import subprocess
+import threading
 import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 
+from claudemol.protocol import (
+    CODECS,
+    COMPRESS_THRESHOLD,
+    FRAME_HEADER,
+    PROTOCOL_VERSION,
+    SHM_DIR,
+    available_codecs,
+    decode_header,
+    decode_payload,
+    encode_frame,
+    shm_available,
+    shm_read,
+    shm_unlink,
+    shm_write,
+)
+from claudemol.stats import CLIENT_STATS
+
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 9880
 CONNECT_TIMEOUT = 5.0
 RECV_TIMEOUT = 30.0
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+# Connections a pool keeps open at most, and seconds an idle one is kept
+POOL_MAX_SIZE = 8
+POOL_IDLE_TIMEOUT = 60.0
 
 CONFIG_DIR = Path.home() / ".claudemol"
 CONFIG_FILE = CONFIG_DIR / "config.json"
@@ -34,20 +59,69 @@ PYMOL_PATHS = [
 
 
 class PyMOLConnection:
-    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Socket connection to the PyMOL plugin.
+
+    On connect the client negotiates the framed protocol (see
+    ``claudemol.protocol``) and a compression codec. ``compression`` is one
+    of "auto" (compress only when talking to a non-loopback host), "on" (best
+    available codec), "none", or a codec name ("zstd", "lz4", "zlib"). It
+    defaults to $CLAUDEMOL_COMPRESSION, else "auto"; an SSH-tunnelled PyMOL
+    port looks local, so set CLAUDEMOL_COMPRESSION=on there. Only payloads
+    of at least ``compress_threshold`` bytes are compressed.
+
+    ``shared_memory`` ("auto" or "off", default $CLAUDEMOL_SHM, else "auto")
+    lets a PyMOL on the same host exchange large binary payloads through
+    shared memory segments instead of the socket (see ``claudemol.protocol``);
+    ``shm_dir`` is set when it was negotiated. Large blobs in responses then
+    arrive as read-only mmaps rather than bytes.
+
+    A connection carries one request at a time and has no locking; threads
+    should each borrow their own from a ``ConnectionPool``.
+    """
+
+    def __init__(
+        self,
+        host=DEFAULT_HOST,
+        port=DEFAULT_PORT,
+        compression=None,
+        compress_threshold=COMPRESS_THRESHOLD,
+        recv_timeout=RECV_TIMEOUT,
+        shared_memory=None,
+    ):
         self.host = host
         self.port = port
         self.socket = None
+        self.recv_timeout = recv_timeout
+        self.compression = compression or os.environ.get(
+            "CLAUDEMOL_COMPRESSION", "auto"
+        )
+        self.compress_threshold = compress_threshold
+        self.shared_memory = shared_memory or os.environ.get("CLAUDEMOL_SHM", "auto")
+        self.framed = False
+        self.codec = None
+        self.shm_dir = None
+        self.capabilities = []
+        # Plugin's scene change counter as of the last response
+        self.scene_serial = None
+        self.stats = CLIENT_STATS
+        self.last_timings = {}
+        self._connect_ms = 0.0
 
     def connect(self, timeout=CONNECT_TIMEOUT):
         """Connect to PyMOL socket server."""
         if self.socket:
             return True
         try:
+            start = time.perf_counter()
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(timeout)
             self.socket.connect((self.host, self.port))
-            self.socket.settimeout(RECV_TIMEOUT)
+            # The handshake shares the connect timeout so a busy or wedged
+            # listener fails fast instead of after RECV_TIMEOUT
+            self._negotiate()
+            self.socket.settimeout(self.recv_timeout)
+            self._connect_ms = (time.perf_counter() - start) * 1000
             return True
         except Exception as e:
             self.socket = None
@@ -55,6 +129,55 @@ class PyMOLConnection:
                 f"Cannot connect to PyMOL on {self.host}:{self.port}: {e}"
             )
 
+    def _wanted_codecs(self):
+        if self.compression == "auto" and self.host in LOOPBACK_HOSTS:
+            return []
+        if self.compression in ("auto", "on"):
+            return available_codecs()
+        if self.compression == "none":
+            return []
+        if self.compression not in CODECS:
+            raise ValueError(f"Compression codec not available: {self.compression}")
+        return [self.compression]
+
+    def _negotiate(self):
+        """Switch to the framed protocol if the plugin supports it."""
+        self.framed = False
+        self.codec = None
+        self.shm_dir = None
+        self.capabilities = []
+        self.scene_serial = None
+        hello = {
+            "type": "hello",
+            "protocol": PROTOCOL_VERSION,
+            "codecs": self._wanted_codecs(),
+            "compress_threshold": self.compress_threshold,
+        }
+        probe = None
+        if (
+            self.shared_memory != "off"
+            and self.host in LOOPBACK_HOSTS
+            and shm_available(SHM_DIR)
+        ):
+            # The plugin reads the token back, which proves it sees the same
+            # directory (not, say, a container's own /dev/shm)
+            token = uuid.uuid4().hex
+            probe = shm_write(SHM_DIR, token.encode())
+            hello["shm"] = {"dir": SHM_DIR, "probe": probe, "token": token}
+        try:
+            result = self._legacy_request(hello)[0]
+        finally:
+            if probe:
+                shm_unlink(SHM_DIR, probe)
+        # Older plugins treat every message as code and answer with an error;
+        # keep talking bare JSON to them.
+        if result.get("status") == "success" and result.get("protocol"):
+            self.framed = True
+            self.codec = result.get("codec")
+            self.capabilities = result.get("capabilities", [])
+            if probe and result.get("shm"):
+                self.shm_dir = SHM_DIR
+
     def disconnect(self):
         """Disconnect from PyMOL."""
         if self.socket:
@@ -79,43 +202,424 @@ class PyMOLConnection:
                 pass
             finally:
                 self.socket.setblocking(True)
-                self.socket.settimeout(RECV_TIMEOUT)
+                self.socket.settimeout(self.recv_timeout)
             return True
         except OSError:
             self.disconnect()
             return False
 
-    def send_command(self, code):
-        """Send Python code to PyMOL and return result."""
+    def _recv_exact(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = self.socket.recv_into(view[received:], min(size - received, 1 << 20))
+            if not n:
+                raise ConnectionError("Connection closed by PyMOL")
+            received += n
+        return buffer
+
+    def _legacy_request(self, message):
+        """Bare-JSON round trip. Returns (result, timings)."""
+        payload = json.dumps(message).encode("utf-8")
+        start = time.perf_counter()
+        self.socket.sendall(payload)
+        sent = time.perf_counter()
+        response = b""
+        while True:
+            chunk = self.socket.recv(4096)
+            if not chunk:
+                raise ConnectionError("Connection closed by PyMOL")
+            response += chunk
+            decode_start = time.perf_counter()
+            try:
+                result = json.loads(response.decode("utf-8"))
+                break
+            except json.JSONDecodeError:
+                continue
+        done = time.perf_counter()
+        return result, {
+            "send_ms": (sent - start) * 1000,
+            "wait_ms": (decode_start - sent) * 1000,
+            "decode_ms": (done - decode_start) * 1000,
+            "bytes_out": len(payload),
+            "bytes_in": len(response),
+        }
+
+    def _framed_request(self, message, blob):
+        """Framed round trip. Returns (result, timings)."""
+        frame, info = encode_frame(
+            message,
+            blob,
+            codec=self.codec,
+            threshold=self.compress_threshold,
+            shm_dir=self.shm_dir,
+        )
+        start = time.perf_counter()
+        try:
+            self.socket.sendall(frame)
+            sent = time.perf_counter()
+            result, received = self._read_frame()
+        finally:
+            if info["shm"]:
+                shm_unlink(self.shm_dir, info["shm"])
+        received.update(
+            compress_ms=info["compress_ms"],
+            send_ms=(sent - start) * 1000,
+            wait_ms=(received.pop("received_at") - sent) * 1000,
+            bytes_out=info["bytes"],
+            wire_bytes_out=info["wire_bytes"],
+        )
+        return result, received
+
+    def _read_frame(self):
+        """Read one framed response. Returns (result, timings)."""
+        codec_id, json_len, blob_len, wire_len = decode_header(
+            self._recv_exact(FRAME_HEADER.size)
+        )
+        payload = self._recv_exact(wire_len)
+        decode_start = time.perf_counter()
+        result, response_blob = decode_payload(codec_id, json_len, blob_len, payload)
+        if blob_len:
+            result["_blob"] = response_blob
+        segment = result.pop("_shm", None)
+        if segment:
+            if not self.shm_dir:
+                raise ValueError("Shared memory response without negotiating it")
+            result["_blob"] = shm_read(self.shm_dir, segment["name"], segment["size"])
+            blob_len = segment["size"]
+        return result, {
+            "received_at": decode_start,
+            "decode_ms": (time.perf_counter() - decode_start) * 1000,
+            "bytes_in": json_len + blob_len,
+            "wire_bytes_in": FRAME_HEADER.size + wire_len,
+        }
+
+    def request(self, message, blob=None):
+        """
+        Send a request dict to PyMOL and return the decoded response dict.
+
+        Args:
+            message: JSON-serializable request, e.g. {"type": "execute", ...}
+            blob: Optional binary payload (needs the framed protocol). A
+                binary payload in the response is returned under "_blob".
+
+        Client-side timings (send/wait/decode and byte counts) are stored in
+        ``self.last_timings`` together with the server timings from the
+        response, and recorded in ``self.stats`` under the request kind.
+        """
         if not self.socket:
             raise ConnectionError("Not connected to PyMOL")
+        if blob and not self.framed:
+            raise RuntimeError("Binary payloads need a newer PyMOL plugin")
         try:
-            message = json.dumps({"type": "execute", "code": code})
-            self.socket.sendall(message.encode("utf-8"))
-            response = b""
-            while True:
-                chunk = self.socket.recv(4096)
-                if not chunk:
-                    raise ConnectionError("Connection closed by PyMOL")
-                response += chunk
-                try:
-                    result = json.loads(response.decode("utf-8"))
-                    return result
-                except json.JSONDecodeError:
-                    continue
+            if self.framed:
+                result, timings = self._framed_request(message, blob)
+            else:
+                result, timings = self._legacy_request(message)
         except socket.timeout:
             raise TimeoutError("PyMOL command timed out")
         except Exception as e:
             self.disconnect()
             raise ConnectionError(f"Communication error: {e}")
 
-    def execute(self, code):
-        """Execute code, reconnecting if necessary. Returns output string or raises."""
+        timings["connect_ms"] = self._connect_ms
+        timings["total_ms"] = sum(v for k, v in timings.items() if k.endswith("_ms"))
+        self._connect_ms = 0.0
+        self.scene_serial = result.get("scene_serial", self.scene_serial)
+        self.last_timings = dict(
+            timings, codec=self.codec or "none", server=result.get("timings", {})
+        )
+        self.stats.record(message.get("kind") or message.get("type"), timings)
+        return result
+
+    def request_stream(self, message, blob=None):
+        """
+        Send a streaming request and yield each response as it arrives.
+
+        Streaming handlers (e.g. progressive renders) send intermediate
+        results marked ``"final": false`` before their final one; the
+        generator stops after the final result. Timings are recorded for the
+        first response, i.e. the time to first result.
+        """
+        result = self.request(message, blob)
+        yield result
+        while not result.get("final", True):
+            try:
+                result, _ = self._read_frame()
+            except socket.timeout:
+                raise TimeoutError("PyMOL command timed out")
+            except Exception as e:
+                self.disconnect()
+                raise ConnectionError(f"Communication error: {e}")
+            yield result
+
+    def send_command(self, code, request_id=None, profile=None, priority=None):
+        """Send Python code to PyMOL and return result."""
+        message = {"type": "execute", "code": code}
+        if request_id is not None:
+            message["request_id"] = request_id
+        if profile:
+            message["profile"] = profile
+        if priority is not None:
+            message["priority"] = priority
+        return self.request(message)
+
+    def get_server_stats(self, reset=False):
+        """Fetch the raw server-side timing samples, keyed by command kind."""
+        if not self.is_connected():
+            self.connect()
+        result = self.request({"type": "stats", "reset": reset})
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result
+
+    def get_profile(
+        self, top=30, key=None, sort="cumulative", reset=False, enable=None
+    ):
+        """
+        Fetch the aggregated cProfile stats of code run in PyMOL.
+
+        Args:
+            top: Number of functions to return
+            key: One procedure name or "code:<hash>" (default: all merged)
+            sort: "cumulative", "tottime" or "calls"
+            reset: Clear the profiles after reading
+            enable: True/False to switch profiling of every execution on or
+                off; None leaves it as is
+
+        Returns:
+            {"enabled", "keys": [{"key", "label", "runs", "total_ms"}],
+            "functions": [{"function", "calls", "tottime_ms", "cumtime_ms"}]}
+        """
+        if not self.is_connected():
+            self.connect()
+        message = {"type": "profile", "top": top, "sort": sort}
+        if key is not None:
+            message["key"] = key
+        if enable is not None:
+            message["enable"] = enable
+        if reset:
+            message["reset"] = True
+        result = self.request(message)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result
+
+    def get_memory(self, budget_mb=None, spill_dir=None):
+        """
+        Report PyMOL's memory use, optionally setting its memory budget.
+
+        Past the budget the plugin evicts the least recently used objects
+        (those no command has named for longest). With a spill directory
+        they are saved there first and reloaded when a command names them
+        again.
+
+        Args:
+            budget_mb: Budget for PyMOL's resident memory in MB; 0 disables
+                it, None leaves it as is
+            spill_dir: Directory (on PyMOL's machine) to save evicted
+                objects to; "" disables saving, None leaves it as is
+
+        Returns:
+            {"rss_bytes", "budget_bytes", "spill_dir", "objects": [{"name",
+            "atoms", "states", "estimated_bytes", "last_used"}, ...] least
+            recently used first, "evicted": [{"name", "atoms", "states",
+            "saved", "evicted_at"}, ...]}
+        """
+        if not self.is_connected():
+            self.connect()
+        if not self.framed:
+            raise RuntimeError("Memory reports need a newer PyMOL plugin")
+        message = {"type": "memory"}
+        if budget_mb is not None:
+            message["budget_mb"] = budget_mb
+        if spill_dir is not None:
+            message["spill_dir"] = str(spill_dir)
+        result = self.request(message)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result
+
+    @contextmanager
+    def batch(self, timeout=None):
+        """
+        Suspend PyMOL's scene updates and representation rebuilds while the
+        block runs; the scene is brought up to date once when it ends.
+
+        Styling recipes (show, color, set, orient, ...) otherwise make PyMOL
+        rebuild representations after every command. Ray-traced renders in
+        the block see every change. Blocks can nest, also across clients:
+        updates resume when the last open one ends. This is unrelated to
+        the "batch" scheduling priority.
+
+        Args:
+            timeout: Seconds after which PyMOL ends the batch by itself
+                (default 60), in case the client never does
+
+        Yields:
+            A dict that gets "suspended_ms" if updates resumed when the
+            block ended (not with an inner block, nor with an older plugin,
+            where the block changes nothing)
+        """
+        if not self.is_connected():
+            self.connect()
+        info = {}
+        if "suspend" not in self.capabilities:
+            yield info
+            return
+        batch = uuid.uuid4().hex
+        message = {"type": "suspend", "action": "begin", "id": batch}
+        if timeout is not None:
+            message["timeout"] = timeout
+        result = self.request(message)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        try:
+            yield info
+        finally:
+            # A dropped connection ends the batch in PyMOL
+            if self.is_connected():
+                try:
+                    result = self.request(
+                        {"type": "suspend", "action": "end", "id": batch}
+                    )
+                    if "suspended_ms" in result:
+                        info["suspended_ms"] = result["suspended_ms"]
+                except (ConnectionError, OSError):
+                    pass
+
+    def load_bytes(self, name, data, format="pdb", state=0):
+        """
+        Load a structure held in memory into PyMOL as object ``name``.
+
+        The bytes travel as a binary frame and go straight to cmd.load_raw;
+        gzip-compressed data is detected and inflated inside PyMOL.
+
+        Returns:
+            {"name", "atoms", "states"} for the loaded object
+        """
+        return self.load_many([(name, data, format)], state=state)[0]
+
+    def load_many(self, files, state=0):
+        """
+        Load several in-memory structures in one request.
+
+        Args:
+            files: Iterable of (name, data, format) tuples; data is bytes
+                (optionally gzip-compressed) or str
+            state: State to load into (0 appends, as in cmd.load)
+
+        Returns:
+            List of {"name", "atoms", "states"}, one per file
+        """
+        entries = []
+        blobs = []
+        for name, data, format in files:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            entry = {"name": name, "format": format, "size": len(data), "state": state}
+            if data[:2] == b"\x1f\x8b":
+                entry["compression"] = "gzip"
+            entries.append(entry)
+            blobs.append(data)
+        if not self.is_connected():
+            self.connect()
+        if not self.framed:
+            raise RuntimeError("Binary uploads need a newer PyMOL plugin")
+        result = self.request(
+            {"type": "upload", "files": entries}, blob=b"".join(blobs)
+        )
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result["loaded"]
+
+    def iter_rows(self, code, page_size=1000):
+        """
+        Run code that sets ``_cursor`` to an iterable and yield its rows.
+
+        The rows are produced lazily inside PyMOL and fetched a page at a
+        time, so huge results (per-atom properties of a large assembly)
+        never have to be built or sent in one piece. ``iterate_rows`` is
+        available to the code for per-atom rows:
+
+            for model, resi, b in conn.iter_rows(
+                "_cursor = iterate_rows('all', '(model, resi, b)')"
+            ):
+                ...
+
+        Rows come back as JSON values (tuples become lists). Stopping early
+        closes the cursor in PyMOL; cursors left idle expire there anyway.
+        """
+        if not self.is_connected():
+            self.connect()
+        result = self.send_command(code)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        cursor = result.get("cursor")
+        if cursor is None:
+            raise RuntimeError(
+                "No cursor returned: set _cursor in the code "
+                "(needs a newer PyMOL plugin)"
+            )
+        done = False
+        try:
+            while not done:
+                page = self.request(
+                    {"type": "fetch", "cursor": cursor, "size": page_size}
+                )
+                if page.get("status") != "success":
+                    raise RuntimeError(page.get("error", "Unknown error"))
+                done = page["done"]
+                yield from page["rows"]
+        finally:
+            if not done and self.is_connected():
+                self.request({"type": "close", "cursor": cursor})
+
+    def execute_many(self, units, priority="batch"):
+        """
+        Run a list of code units (movie frames, alignment pairs, ...) as
+        one request whose units PyMOL schedules separately, so other
+        clients' interactive requests run in between.
+
+        Returns:
+            List of the units' outputs. Raises RuntimeError at the first
+            unit that fails.
+        """
+        if not self.is_connected():
+            self.connect()
+        if not self.framed:
+            raise RuntimeError("Scheduled units need a newer PyMOL plugin")
+        message = {"type": "execute", "units": list(units), "priority": priority}
+        for result in self.request_stream(message):
+            pass
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        return result["outputs"]
+
+    def execute(self, code, request_id=None, profile=None, priority=None):
+        """
+        Execute code, reconnecting if necessary. Returns output string or raises.
+
+        Retries go out under the same request id, so if the connection
+        dropped after PyMOL ran the code, the plugin sends back the stored
+        response instead of running it again. Pass ``request_id`` to extend
+        that across calls (PyMOLSession does, across recovery).
+
+        ``profile=True`` runs the code under cProfile in PyMOL, aggregated
+        per code hash; a string aggregates under that procedure name. See
+        ``get_profile``.
+
+        ``priority`` is the scheduling class in PyMOL: "interactive" (the
+        default) runs ahead of queued "batch" work.
+        """
+        if request_id is None:
+            request_id = uuid.uuid4().hex
         for attempt in range(3):
             try:
                 if not self.is_connected():
                     self.connect()
-                result = self.send_command(code)
+                result = self.send_command(code, request_id, profile, priority)
                 if result.get("status") == "success":
                     return result.get("output", "")
                 else:
@@ -128,6 +632,203 @@ class PyMOLConnection:
         raise ConnectionError("Failed to connect after 3 attempts")
 
 
+def _reusable(conn):
+    """Connected, with nothing unread on the socket (a response left over
+    from an abandoned request, or the close of a dead PyMOL)."""
+    if not conn.socket:
+        return False
+    try:
+        conn.socket.setblocking(False)
+        try:
+            conn.socket.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            conn.socket.setblocking(True)
+            conn.socket.settimeout(conn.recv_timeout)
+    except OSError:
+        return False
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one PyMOL.
+
+    Usage:
+        pool = ConnectionPool(port=9880)
+        with pool.connection() as conn:
+            conn.execute("cmd.fetch('1ubq')")
+
+    Each thread borrows a connection of its own; borrowing again in the
+    same thread (e.g. from a helper called inside the block) returns the
+    same one. At most ``max_size`` connections are open; further threads
+    wait for one to be returned. A connection is checked on borrow and
+    reconnected if PyMOL closed it, and is dropped on return if a request
+    failed or left a response unread. Connections idle for more than
+    ``idle_timeout`` seconds are closed. Other keyword arguments are passed
+    to PyMOLConnection.
+    """
+
+    def __init__(
+        self,
+        host=DEFAULT_HOST,
+        port=DEFAULT_PORT,
+        max_size=POOL_MAX_SIZE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        **options,
+    ):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.options = options
+        self._idle = deque()  # (connection, returned_at), newest last
+        self._open = 0  # idle and borrowed
+        self._closed = False
+        self._local = threading.local()
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        """Connections open, idle or borrowed."""
+        return self._open
+
+    @property
+    def idle(self):
+        """Connections open and not borrowed."""
+        return len(self._idle)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Borrow a connected PyMOLConnection for the block.
+
+        Args:
+            timeout: Seconds to wait for a free connection when max_size
+                are borrowed (None waits indefinitely)
+
+        Raises:
+            TimeoutError: No connection was returned in time
+            ConnectionError: PyMOL could not be reached
+        """
+        local = self._local
+        if getattr(local, "conn", None) is not None:
+            local.depth += 1
+            try:
+                yield local.conn
+            finally:
+                local.depth -= 1
+            return
+        conn = self._acquire(timeout)
+        local.conn, local.depth = conn, 1
+        failed = False
+        try:
+            yield conn
+        except Exception as e:
+            # ConnectionError, TimeoutError; not PyMOL errors (RuntimeError)
+            failed = isinstance(e, OSError)
+            raise
+        except BaseException:
+            # Interrupted mid-request: the stream may be out of step
+            failed = True
+            raise
+        finally:
+            local.conn = None
+            self._release(conn, failed)
+
+    def reap(self):
+        """Close connections idle for longer than idle_timeout."""
+        with self._cond:
+            self._reap()
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned."""
+        with self._cond:
+            self._closed = True
+            self.clear()
+
+    def clear(self):
+        """Close idle connections but keep the pool usable (e.g. after
+        PyMOL was restarted)."""
+        with self._cond:
+            while self._idle:
+                self._idle.popleft()[0].disconnect()
+                self._open -= 1
+            self._cond.notify_all()
+
+    def _reap(self):
+        deadline = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < deadline:
+            self._idle.popleft()[0].disconnect()
+            self._open -= 1
+
+    def _acquire(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("ConnectionPool is closed")
+                self._reap()
+                if self._idle:
+                    conn = self._idle.pop()[0]
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(
+                        f"No PyMOL connection free in the pool ({self.max_size} "
+                        "borrowed)"
+                    )
+                self._cond.wait(remaining)
+        # Connect and validate outside the lock; connecting can be slow
+        try:
+            if conn is None:
+                conn = PyMOLConnection(self.host, self.port, **self.options)
+            elif not _reusable(conn):
+                conn.disconnect()
+            if not conn.socket:
+                conn.connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def _release(self, conn, failed):
+        keep = not failed and _reusable(conn)
+        with self._cond:
+            if keep and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                conn.disconnect()
+                self._open -= 1
+            self._cond.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host=DEFAULT_HOST, port=DEFAULT_PORT, recv_timeout=RECV_TIMEOUT):
+    """The process-wide ConnectionPool for a PyMOL instance."""
+    with _pools_lock:
+        pool = _pools.get((host, port, recv_timeout))
+        if pool is None or pool.closed:
+            pool = _pools[(host, port, recv_timeout)] = ConnectionPool(
+                host, port, recv_timeout=recv_timeout
+            )
+        return pool
+
+
 def find_pymol_command():
     """
     Find how to launch PyMOL.
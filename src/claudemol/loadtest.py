@@ -0,0 +1,289 @@
+"""
+Load Testing
+
+Simulates several agents sharing one PyMOL: N concurrent clients, each on
+its own connection, send a weighted mix of tiny commands, bulk queries and
+renders for a fixed time. Reports throughput, latency percentiles per kind
+of request, errors and dropped connections, and a timeline of throughput
+and PyMOL's resident memory, for sizing instances and catching regressions.
+
+Usage:
+    claudemol loadtest --clients 8 --duration 60
+    claudemol loadtest --stub --clients 32 --mix tiny=8,query=2,render=1
+
+    from claudemol.loadtest import run_loadtest
+    report = run_loadtest(clients=8, duration=30)
+    report["throughput_rps"], report["latency"]["tiny"]["p99"]
+
+Without ``stub`` the clients connect to a running PyMOL; with it, to a
+plugin served in-process against the FakeCmd stand-in for ``pymol.cmd``
+(its memory is then the load test's own).
+"""
+
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from claudemol.connection import DEFAULT_HOST, DEFAULT_PORT, PyMOLConnection
+from claudemol.stats import LatencyStats, summarize
+
+# Relative weights of each kind of request
+DEFAULT_MIX = {"tiny": 8, "query": 2, "render": 1}
+# Name of the object the clients query and render
+OBJECT = "_loadtest"
+RENDER_SIZE = (320, 240)
+# Ray-tracing cost the stub simulates
+STUB_RAY_SECONDS_PER_MPIXEL = 1.0
+REQUEST_TIMEOUT = 60.0
+
+
+def parse_mix(text):
+    """Parse "tiny=8,query=2,render=1" into a dict of weights."""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request kind: {kind} ({', '.join(DEFAULT_MIX)})")
+        try:
+            mix[kind] = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"Invalid weight for {kind}: {weight}")
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one positive weight")
+    return mix
+
+
+def _structure(atoms):
+    """PDB text of a grid of CA atoms, 3.8 A apart."""
+    lines = []
+    for i in range(atoms):
+        x, y, z = 3.8 * (i % 20), 3.8 * (i // 20 % 20), 3.8 * (i // 400)
+        lines.append(
+            f"ATOM  {(i + 1) % 100000:5d}  CA  ALA A{(i + 1) % 10000:4d}    "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00           C\n"
+        )
+    return "".join(lines)
+
+
+def _connection(host, port):
+    conn = PyMOLConnection(host, port, recv_timeout=REQUEST_TIMEOUT)
+    # Keep load-test traffic out of this process's client statistics
+    conn.stats = LatencyStats()
+    return conn
+
+
+def _check(result):
+    if result.get("status") != "success":
+        raise RuntimeError(result.get("error", "Unknown error"))
+
+
+def _tiny(conn, scratch):
+    _check(
+        conn.request(
+            {"type": "execute", "code": f"_result = cmd.count_atoms('{OBJECT}')"}
+        )
+    )
+
+
+def _query(conn, scratch):
+    # All coordinates, paged through a cursor
+    for _ in conn.iter_rows(f"_cursor = cmd.get_coords('{OBJECT}').tolist()"):
+        pass
+
+
+def _render(conn, scratch):
+    width, height = RENDER_SIZE
+    _check(
+        conn.request(
+            {
+                "type": "render",
+                "path": scratch,
+                "width": width,
+                "height": height,
+                "ray": True,
+                "priority": "batch",
+            }
+        )
+    )
+
+
+OPERATIONS = {"tiny": _tiny, "query": _query, "render": _render}
+
+
+def _client(index, host, port, mix, deadline, scratch, samples):
+    """Send requests until the deadline, reconnecting after a drop."""
+    rng = random.Random(index)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    conn = _connection(host, port)
+    image = f"{scratch}/client{index}.png"
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                if not conn.is_connected():
+                    conn.connect(timeout=5.0)
+                OPERATIONS[kind](conn, image)
+                outcome = "ok"
+            except (ConnectionError, OSError):  # includes TimeoutError
+                outcome = "dropped"
+                conn.disconnect()
+            except RuntimeError:
+                outcome = "error"
+            end = time.perf_counter()
+            samples.append((end, kind, (end - start) * 1000, outcome))
+            if outcome == "dropped":
+                time.sleep(0.1)
+    finally:
+        conn.disconnect()
+
+
+def _monitor(host, port, interval, stop, memory):
+    """Sample PyMOL's resident memory every interval seconds."""
+    conn = _connection(host, port)
+    try:
+        while True:
+            try:
+                rss = conn.get_memory()["rss_bytes"]
+                memory.append((time.perf_counter(), rss / (1024 * 1024)))
+            except (ConnectionError, OSError, RuntimeError):
+                conn.disconnect()
+            if stop.wait(interval):
+                break
+    finally:
+        conn.disconnect()
+
+
+def _timeline(samples, memory, start, duration, interval):
+    """Per-interval throughput, p95 latency, failures and memory."""
+    rows = []
+    for i in range(max(1, round(duration / interval))):
+        low, high = start + i * interval, start + (i + 1) * interval
+        window = [s for s in samples if low <= s[0] < high]
+        rss = [mb for t, mb in memory if t < high]
+        latencies = [ms for _, _, ms, outcome in window if outcome == "ok"]
+        rows.append(
+            {
+                "t": round((i + 1) * interval, 3),
+                "requests": len(window),
+                "rps": len(window) / interval,
+                "p95_ms": summarize(latencies)["p95"],
+                "errors": sum(1 for s in window if s[3] == "error"),
+                "dropped": sum(1 for s in window if s[3] == "dropped"),
+                "rss_mb": rss[-1] if rss else None,
+            }
+        )
+    return rows
+
+
+def run_loadtest(
+    host=DEFAULT_HOST,
+    port=DEFAULT_PORT,
+    clients=8,
+    duration=30.0,
+    mix=None,
+    atoms=2000,
+    interval=1.0,
+    stub=False,
+):
+    """
+    Run concurrent clients against one PyMOL and report how it held up.
+
+    Args:
+        host, port: PyMOL to test (ignored with stub=True)
+        clients: Number of concurrent connections
+        duration: Seconds to keep sending requests
+        mix: Weights per request kind: "tiny" (count atoms), "query" (page
+            through all coordinates) and "render" (small ray trace, batch
+            priority); default DEFAULT_MIX
+        atoms: Size of the test object the queries and renders use
+        interval: Seconds per timeline row and memory sample
+        stub: Serve the plugin in-process against a fake ``pymol.cmd``
+
+    Returns:
+        Dict with "clients", "duration_s", "requests", "errors", "dropped",
+        "throughput_rps", "latency" (count/mean/p50/p95/p99/max in ms per
+        kind, successful requests only), "server" (PyMOL's queue_ms
+        percentiles per priority class; its samples are cleared first) and
+        "timeline"
+    """
+    mix = dict(DEFAULT_MIX if mix is None else mix)
+    if stub:
+        from claudemol.testing import FakeCmd, stub_server
+
+        fake = FakeCmd(ray_seconds_per_mpixel=STUB_RAY_SECONDS_PER_MPIXEL)
+        with stub_server(fake) as server:
+            return run_loadtest(
+                "localhost", server.port, clients, duration, mix, atoms, interval
+            )
+
+    scratch = tempfile.mkdtemp(prefix="claudemol-loadtest-")
+    setup = _connection(host, port)
+    setup.connect()
+    try:
+        setup.load_bytes(OBJECT, _structure(atoms).encode(), "pdb")
+        # Spheres only: PyMOL's default cartoon of a CA-only grid is slow to
+        # ray trace and not representative
+        setup.execute(
+            f"cmd.hide('everything', '{OBJECT}'); cmd.show('spheres', '{OBJECT}'); "
+            f"cmd.zoom('{OBJECT}')"
+        )
+        # Server queue times below cover the test only
+        setup.get_server_stats(reset=True)
+
+        samples = []
+        memory = []
+        stop = threading.Event()
+        monitor = threading.Thread(
+            target=_monitor, args=(host, port, interval, stop, memory), daemon=True
+        )
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [
+            threading.Thread(
+                target=_client,
+                args=(i, host, port, mix, deadline, scratch, samples),
+                daemon=True,
+            )
+            for i in range(clients)
+        ]
+        monitor.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(duration + REQUEST_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        monitor.join(REQUEST_TIMEOUT)
+
+        server_samples = setup.get_server_stats()["samples"]
+        setup.execute(f"cmd.delete('{OBJECT}')")
+    finally:
+        setup.disconnect()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    latency = {}
+    for kind in mix:
+        values = [ms for _, k, ms, outcome in samples if k == kind and outcome == "ok"]
+        if values:
+            latency[kind] = summarize(values)
+    server = {
+        kind.split(".", 1)[1]: summarize([s["queue_ms"] for s in entries])
+        for kind, entries in server_samples.items()
+        if kind.startswith("queue.")
+    }
+    return {
+        "clients": clients,
+        "duration_s": elapsed,
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[3] == "error"),
+        "dropped": sum(1 for s in samples if s[3] == "dropped"),
+        "throughput_rps": sum(1 for s in samples if s[3] == "ok") / elapsed,
+        "latency": latency,
+        "server": server,
+        "timeline": _timeline(samples, memory, start, duration, interval),
+    }
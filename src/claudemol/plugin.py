@@ -9,35 +9,934 @@ Usage:
     claude_status             # Check connection status
     claude_stop               # Stop listener
     claude_start              # Restart listener
+    claude_profile on         # Profile every execution (off/clear/print)
 """
 
+import ast
+import cProfile
+import os
 import socket
+import gzip
+import heapq
 import json
+import pickle
+import pstats
+import re
+import struct
+import sys
 import threading
+import time
 import traceback
+import types
 import io
+import itertools
+import math
+import mmap
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import redirect_stdout
 
 from pymol import cmd
 
+try:
+    import numpy
+except ImportError:  # PyMOL ships NumPy; only the analysis handlers need it
+    numpy = None
+
+try:
+    from PIL import Image
+except ImportError:  # only JPEG/WebP feedback images need Pillow
+    Image = None
+
 # Global state
 _server = None
-_port = 9880
+# CLAUDEMOL_PORT lets several PyMOL instances listen side by side
+_port = int(os.environ.get("CLAUDEMOL_PORT", 9880))
+
+# Number of timing samples kept per command kind
+STATS_WINDOW = 2048
+# Scheduling classes, most urgent first. Requests run one at a time on a
+# single executor thread; a streaming handler (progressive render, a list
+# of code units) is put back in the queue after each step, so interactive
+# requests run between the steps of batch work.
+PRIORITIES = {"interactive": 0, "batch": 1}
+# Responses kept for replay to retried request ids, bounded by count and
+# by total output and blob bytes. A response larger than REPLAY_MAX_ENTRY
+# is kept as a tombstone, so its retry is an error instead of a re-run
+REPLAY_CACHE_SIZE = 64
+REPLAY_MAX_BYTES = 64 * 1024 * 1024
+REPLAY_MAX_ENTRY = 4 * 1024 * 1024
+
+# Framed protocol, mirrored by claudemol/protocol.py on the client side.
+# This file runs inside PyMOL's interpreter and must stay self-contained.
+PROTOCOL_VERSION = 1
+FRAME_MAGIC = b"CM"
+FRAME_HEADER = struct.Struct(">2sBBIII")
+COMPRESS_THRESHOLD = 64 * 1024
+MIN_COMPRESSION_GAIN = 0.1
+CODEC_IDS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+# Same-host shared memory segments for large blobs; see the ownership rules
+# in claudemol/protocol.py
+SHM_THRESHOLD = 1024 * 1024
+SHM_NAME = re.compile(r"claudemol-(\d+)-[0-9a-f]{32}")
+
+
+def _load_codecs():
+    """Return {name: (compress, decompress)} for every importable codec."""
+    codecs = {"zlib": (lambda data: zlib.compress(data, 1), zlib.decompress)}
+    try:
+        from compression import zstd  # Python 3.14+
+
+        codecs["zstd"] = (lambda data: zstd.compress(data, 3), zstd.decompress)
+    except ImportError:
+        try:
+            import zstandard
+
+            codecs["zstd"] = (
+                lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                lambda data: zstandard.ZstdDecompressor().decompress(data),
+            )
+        except ImportError:
+            pass
+    try:
+        import lz4.frame
+
+        codecs["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+    except ImportError:
+        pass
+    return codecs
+
+
+CODECS = _load_codecs()
+
+# Longest side of the quick first image in progressive renders
+PREVIEW_MAX_DIM = 320
+# Rough ray-tracing cost multiplier per antialias level
+ANTIALIAS_COST = {0: 1.0, 1: 1.0, 2: 4.0, 3: 7.0, 4: 10.0}
+# Planned renders: candidate (antialias, ray_shadow, resolution scale)
+# settings, best first, and the candidate each quality level maps to
+RENDER_CANDIDATES = [
+    (2, 1, 1.0),
+    (1, 1, 1.0),
+    (0, 1, 1.0),
+    (0, 0, 1.0),
+    (0, 0, 0.75),
+    (0, 0, 0.5),
+]
+QUALITY_LEVELS = {"high": 0, "normal": 1, "draft": 3}
+# Weight kept by past timings on each new one, so the model follows drift
+RENDER_MODEL_DECAY = 0.9
+RENDER_MODEL_PATH = os.path.join(
+    os.path.expanduser("~"), ".claudemol", "render_model.json"
+)
+CALIBRATION_OBJECT = "_cm_calibrate"
+# Compact feedback images: formats the rendered PNG can be re-encoded to
+# (with Pillow), and named JPEG/WebP quality levels
+IMAGE_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+IMAGE_QUALITY = {"low": 50, "medium": 75, "high": 90}
+# Returned by a job step that handed work to another thread; the job is
+# queued again when that work is done
+_WAITING = object()
+
+# Memory budget (MB of process RSS; unset or 0 means none). Past it, the
+# least recently used objects are evicted, and saved to the spill directory
+# for reloading on next use when one is set. RSS barely drops when PyMOL
+# frees an object (the allocator keeps the pages for reuse), so how many to
+# evict is judged from an estimated cost per atom and per atom per state.
+MEMORY_BUDGET_MB = float(os.environ.get("CLAUDEMOL_MEMORY_BUDGET_MB") or 0)
+SPILL_DIR = os.environ.get("CLAUDEMOL_SPILL_DIR") or None
+ATOM_BYTES = 1600
+COORD_BYTES = 16
+# Command fields that name objects, for tracking which were used
+SELECTION_FIELDS = (
+    "code",
+    "selection",
+    "selection1",
+    "selection2",
+    "target",
+    "object",
+    "queries",
+)
+# cmd functions that only read the scene. Code calling nothing else of cmd
+# (and importing nothing) leaves the scene serial alone, so queries and
+# health checks do not make clients take checkpoints
+READ_ONLY_CALLS = frozenset(
+    {
+        "count_atoms",
+        "count_states",
+        "get",
+        "get_angle",
+        "get_chains",
+        "get_coords",
+        "get_dihedral",
+        "get_distance",
+        "get_extent",
+        "get_fastastr",
+        "get_model",
+        "get_names",
+        "get_object_list",
+        "get_pdbstr",
+        "get_position",
+        "get_session",
+        "get_setting_boolean",
+        "get_setting_float",
+        "get_setting_int",
+        "get_setting_text",
+        "get_title",
+        "get_type",
+        "get_view",
+        "identify",
+        "index",
+        "iterate",
+        "iterate_state",
+    }
+)
+# Builtins that run code of their own, which cannot be checked
+OPAQUE_BUILTINS = frozenset({"exec", "eval", "compile", "__import__", "globals"})
+# cmd calls that load a new object or delete one, with their leading
+# parameters: an evicted copy of the name is dropped rather than reloaded
+# (loading into an existing object would append to it). A load with an
+# explicit state adds to the object, so it is reloaded as for any other use
+CREATING_CALLS = {
+    "load": ("filename", "object", "state"),
+    "load_raw": ("content", "format", "object", "state"),
+    "fetch": ("code", "name", "state"),
+    "delete": ("name",),
+}
+
+# Profiles kept, one per procedure name or code hash
+PROFILE_KEYS = 256
+
+# Result cursors: idle ones are dropped after CURSOR_TTL seconds, at most
+# MAX_CURSORS are open, and a page holds at most MAX_PAGE_SIZE rows
+CURSOR_TTL = 300.0
+MAX_CURSORS = 64
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 100000
+# Atoms per cmd.iterate call in iterate_rows
+ROW_CHUNK = 10000
+
+# Cell edge of the spatial index (Angstrom) and indexes kept per server
+INDEX_CELL = 5.0
+INDEX_CACHE_SIZE = 32
+# Analysis results kept per server, keyed on their inputs' coordinates
+ANALYSIS_CACHE_SIZE = 64
+# Atoms further than this from the partner cannot change buried area, so
+# surface areas are computed on the interface neighbourhood only
+AREA_NEIGHBOURHOOD = 10.0
+# Settings held while a client's batch is open (see _suspend_command);
+# batches not ended within their timeout, BATCH_TTL by default, are ended
+BATCH_SETTINGS = {"suspend_updates": 1}
+BATCH_TTL = 60.0
+# Pairwise RMSD entries computed per NumPy step when clustering states
+RMSD_BLOCK = 1 << 20
+
+
+def _has_gui():
+    """True when PyMOL has an OpenGL viewport, i.e. cmd.draw can render."""
+    try:
+        import pymol
+
+        return not pymol.invocation.options.no_gui
+    except AttributeError:
+        return False
+
+
+class _Job:
+    """A request waiting for, or between steps on, the executor."""
+
+    def __init__(self, sock, channel, command, framed, timings, priority):
+        self.sock = sock
+        self.channel = channel
+        self.command = command
+        self.framed = framed
+        self.timings = timings
+        self.priority = priority
+        self.queued_at = time.perf_counter()
+        self.sequence = None
+        # Generator of a streaming handler, once it has started
+        self.steps = None
+        self.replayed = False
+        self.serial = None
+        self.words = set()
+        self.done = threading.Event()
+
+
+class _Channel:
+    """Per-connection protocol state: receive buffer and negotiated codec."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.codec = None
+        self.threshold = COMPRESS_THRESHOLD
+        # Shared memory directory, once negotiated, and the segments sent
+        # that the client may not have unlinked yet
+        self.shm_dir = None
+        self.segments = set()
+        # Batches begun on this connection and not yet ended
+        self.batches = set()
+
+    def next_message(self):
+        """
+        Pop one complete request off the buffer.
+
+        Returns (command, framed, info) or None if more bytes are needed.
+        Frames start with FRAME_MAGIC; anything else is a bare JSON object.
+        A binary payload is attached to the command as "_blob".
+        """
+        if self.buffer[:2] == FRAME_MAGIC:
+            if len(self.buffer) < FRAME_HEADER.size:
+                return None
+            _, version, codec_id, json_len, blob_len, wire_len = (
+                FRAME_HEADER.unpack_from(self.buffer)
+            )
+            end = FRAME_HEADER.size + wire_len
+            if len(self.buffer) < end:
+                return None
+            payload = bytes(self.buffer[FRAME_HEADER.size : end])
+            del self.buffer[:end]
+            if version != PROTOCOL_VERSION:
+                raise ValueError(f"Unsupported protocol version {version}")
+            start = time.perf_counter()
+            if codec_id:
+                payload = CODECS[CODEC_NAMES[codec_id]][1](payload)
+            decompress_ms = (time.perf_counter() - start) * 1000
+            command = json.loads(payload[:json_len].decode("utf-8"))
+            if blob_len:
+                command["_blob"] = payload[json_len:]
+            # A new request means the client is done with earlier responses
+            self.release()
+            segment = command.pop("_shm", None)
+            if segment is not None:
+                if not self.shm_dir:
+                    raise ValueError("Shared memory was not negotiated")
+                blob_len = int(segment["size"])
+                command["_blob"] = _shm_read(self.shm_dir, segment["name"], blob_len)
+            info = {
+                "bytes_in": json_len + blob_len,
+                "wire_bytes_in": end,
+                "decompress_ms": decompress_ms,
+            }
+            return command, True, info
+        try:
+            command = json.loads(self.buffer.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        info = {"bytes_in": len(self.buffer), "wire_bytes_in": len(self.buffer)}
+        self.buffer.clear()
+        return command, False, info
+
+    def frame(self, body, blob, timings):
+        """Wrap an encoded JSON body (and blob) in a frame, compressing it
+        when a codec was negotiated and the payload is large enough. A large
+        blob goes into a shared memory segment when that was negotiated."""
+        if self.shm_dir and len(blob) >= SHM_THRESHOLD:
+            name = _shm_write(self.shm_dir, blob)
+            self.segments.add(name)
+            spec = json.dumps({"name": name, "size": len(blob)}).encode("utf-8")
+            body = body[:-1] + b', "_shm": ' + spec + b"}"
+            timings["shm_bytes_out"] = len(blob)
+            blob = b""
+        payload = body + blob
+        codec_id = 0
+        if self.codec and len(payload) >= self.threshold:
+            start = time.perf_counter()
+            compressed = CODECS[self.codec][0](payload)
+            timings["compress_ms"] = (time.perf_counter() - start) * 1000
+            if len(compressed) <= len(payload) * (1 - MIN_COMPRESSION_GAIN):
+                payload = compressed
+                codec_id = CODEC_IDS[self.codec]
+        header = FRAME_HEADER.pack(
+            FRAME_MAGIC, PROTOCOL_VERSION, codec_id, len(body), len(blob), len(payload)
+        )
+        return header + payload
+
+    def release(self):
+        """Unlink segments sent on this connection that are still there."""
+        for name in self.segments:
+            _shm_unlink(self.shm_dir, name)
+        self.segments.clear()
+
+
+def _shm_write(directory, data):
+    name = f"claudemol-{os.getpid()}-{uuid.uuid4().hex}"
+    fd = os.open(
+        os.path.join(directory, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600
+    )
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return name
+
+
+def _shm_read(directory, name, size):
+    """Map a client's segment read-only and unlink it; the mmap is the blob."""
+    if not SHM_NAME.fullmatch(name):
+        raise ValueError(f"Invalid shared memory segment: {name}")
+    path = os.path.join(directory, name)
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != size:
+                raise ValueError("Shared memory segment size mismatch")
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+    finally:
+        _shm_unlink(directory, name)
+
+
+def _shm_unlink(directory, name):
+    try:
+        os.unlink(os.path.join(directory, name))
+    except FileNotFoundError:
+        pass
+
+
+def _shm_probe(shm):
+    """Whether the client's probe segment is visible here with its token,
+    i.e. client and plugin share the directory."""
+    name = shm.get("probe") or ""
+    if not SHM_NAME.fullmatch(name):
+        return False
+    try:
+        with open(os.path.join(shm["dir"], name), "rb") as f:
+            return f.read(64) == str(shm.get("token")).encode()
+    except (OSError, TypeError, KeyError):
+        return False
+
+
+def _sweep_segments(directory):
+    """Remove segments left behind by processes that no longer exist."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        match = SHM_NAME.fullmatch(name)
+        if not match:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            _shm_unlink(directory, name)
+        except OSError:
+            pass  # alive, but another user's
+
+
+def _rss_bytes():
+    """Resident set size of this process in bytes, or None if unknown.
+
+    Without /proc (macOS) this is the peak RSS, which never goes down.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _referenced_names(command):
+    """Words in a command's code and selections that may be object names."""
+    texts = [command.get(field) for field in SELECTION_FIELDS]
+    texts += [entry.get("name") for entry in command.get("files", ())]
+    words = set()
+    for text in texts:
+        for text in text if isinstance(text, list) else [text]:
+            if isinstance(text, str):
+                words.update(re.findall(r"[\w.+-]+", text))
+                words.update(re.findall(r"\w+", text))
+    return words
+
+
+def _changes_scene(code):
+    """False only for code that certainly leaves the scene as it was: it
+    uses cmd solely through READ_ONLY_CALLS, imports nothing and runs no
+    code of its own through OPAQUE_BUILTINS."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+    allowed = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            return True
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            if node.value.id == "cmd" and node.attr in READ_ONLY_CALLS:
+                allowed.add(id(node.value))
+    return any(
+        isinstance(node, ast.Name)
+        and (node.id in OPAQUE_BUILTINS or node.id == "cmd")
+        and id(node) not in allowed
+        for node in ast.walk(tree)
+    )
+
+
+def _created_names(command):
+    """Object names a command loads anew or deletes ("all" for every one).
+
+    Code is searched for CREATING_CALLS with literal arguments; calls whose
+    names are computed are not recognised, so those objects are reloaded.
+    """
+    names = {
+        entry.get("name")
+        for entry in command.get("files", ())
+        if not entry.get("state")
+    }
+    code = command.get("code")
+    for text in code if isinstance(code, list) else [code]:
+        try:
+            tree = ast.parse(text) if isinstance(text, str) else None
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree) if tree else ():
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func
+            call = getattr(func, "attr", None) or getattr(func, "id", None)
+            if call not in CREATING_CALLS:
+                continue
+            bound = dict(zip(CREATING_CALLS[call], node.args))
+            bound.update((kw.arg, kw.value) for kw in node.keywords if kw.arg)
+            if not all(isinstance(v, ast.Constant) for v in bound.values()):
+                continue
+            args = {key: value.value for key, value in bound.items()}
+            if call == "delete":
+                names.update(str(args.get("name", "")).split())
+            elif args.get("state"):
+                continue
+            elif call == "fetch":
+                names.update(str(args.get("name") or args.get("code", "")).split())
+            elif args.get("object"):
+                names.add(str(args["object"]))
+            elif call == "load" and args.get("filename"):
+                base = os.path.basename(str(args["filename"]))
+                if base.endswith(".gz"):
+                    base = base[:-3]
+                names.add(os.path.splitext(base)[0])
+    names.discard(None)
+    if names & {"all", "*"}:
+        return {"all"}
+    return names
+
+
+def _rekey_cache(entries):
+    """Recompute the keys of PyMOL cache entries (stored surfaces) from a
+    session. PyMOL keys them on hash() of each input, which for strings
+    differs between processes, so they would not be found otherwise."""
+    for entry in entries:
+        key = list(entry[1])
+        for i, value in enumerate(entry[2]):
+            try:
+                key[i] = hash(value) & 0x7FFFFFFF
+            except TypeError:
+                # Lists, which PyMOL cannot hash either
+                pass
+        entry[1] = tuple(key)
+
+
+def _reply_size(result):
+    """Bytes a response holds in its output, blob and other text fields."""
+    return sum(
+        len(value) for value in result.values() if isinstance(value, (str, bytes))
+    )
+
+
+def _to_json(value):
+    """json.dumps fallback for NumPy values and other stray types."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def iterate_rows(selection, expression, chunk=ROW_CHUNK):
+    """Lazily yield one row per atom, like cmd.iterate with a result.
+
+    Meant for cursors in agent code, e.g.
+        _cursor = iterate_rows("all", "(model, chain, resi, name, b)")
+    Atoms are visited one index range of `chunk` atoms at a time, so only
+    that many rows exist at once.
+    """
+    for name in cmd.get_object_list(f"({selection})"):
+        count = cmd.count_atoms(f"%{name}")
+        for low in range(1, count + 1, chunk):
+            rows = []
+            cmd.iterate(
+                f"({selection}) and %{name} and index {low}-{low + chunk - 1}",
+                f"_rows.append({expression})",
+                space={"_rows": rows},
+            )
+            yield from rows
+
+
+class _Cursor:
+    """Rows of a result that the client fetches page by page."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.touched = time.monotonic()
+
+
+class _RenderModel:
+    """
+    Predicts ray-tracing time as setup + per_pixel * work, where work is
+    pixels times the host's antialias and shadow cost factors.
+
+    A calibration run on a small reference scene gives the factors and a
+    first estimate; after that, setup and per_pixel are fitted from the
+    timings of real renders, separately per scene size bucket (atom count
+    and whether surfaces are shown). Stored per host in a JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.host = socket.gethostname()
+        self.calibration = None
+        # bucket -> decayed [n, sum x, sum t, sum x*x, sum x*t]
+        self.buckets = {}
+        try:
+            with open(path) as f:
+                saved = json.load(f).get(self.host, {})
+        except (OSError, ValueError):
+            saved = {}
+        self.calibration = saved.get("calibration")
+        self.buckets = saved.get("buckets", {})
+
+    def save(self):
+        try:
+            with open(self.path) as f:
+                hosts = json.load(f)
+        except (OSError, ValueError):
+            hosts = {}
+        hosts[self.host] = {"calibration": self.calibration, "buckets": self.buckets}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        partial = f"{self.path}.partial"
+        with open(partial, "w") as f:
+            json.dump(hosts, f)
+        os.replace(partial, self.path)
+
+    def work(self, width, height, antialias, shadow):
+        factors = self.calibration["antialias"]
+        return (
+            width
+            * height
+            * factors.get(str(antialias), 1.0)
+            * (1.0 if shadow else self.calibration["no_shadow"])
+        )
+
+    def predict(self, bucket, work):
+        setup, per_pixel = self._fit(bucket)
+        return setup + per_pixel * work
+
+    def observe(self, bucket, work, seconds):
+        stats = self.buckets.setdefault(bucket, [0.0] * 5)
+        for i, value in enumerate((1.0, work, seconds, work * work, work * seconds)):
+            stats[i] = stats[i] * RENDER_MODEL_DECAY + value
+
+    def _fit(self, bucket):
+        """(setup, per_pixel) for a bucket: a least-squares fit when its
+        renders varied enough, else the nearest estimate scaled to them."""
+        stats = self.buckets.get(bucket)
+        if stats:
+            n, sx, st, sxx, sxt = stats
+            spread = n * sxx - sx * sx
+            if n >= 1.5 and spread > (0.05 * sx) ** 2:
+                per_pixel = (n * sxt - sx * st) / spread
+                setup = (st - per_pixel * sx) / n
+                if per_pixel > 0 and setup >= 0:
+                    return setup, per_pixel
+        setup, per_pixel = self._nearest(bucket)
+        if stats:
+            n, sx, st = stats[:3]
+            scale = st / max(setup * n + per_pixel * sx, 1e-9)
+            return setup * scale, per_pixel * scale
+        return setup, per_pixel
+
+    def _nearest(self, bucket):
+        """Estimate from the closest size bucket with the same surface flag,
+        or from the calibration scene."""
+        size, surface = bucket.split(":")
+        best = None
+        for other, stats in self.buckets.items():
+            other_size, other_surface = other.split(":")
+            if other == bucket or other_surface != surface or not stats[0]:
+                continue
+            distance = abs(int(other_size) - int(size))
+            if best is None or distance < best[0]:
+                best = (distance, stats)
+        setup = self.calibration["setup"]
+        per_pixel = self.calibration["per_pixel"]
+        if best is not None:
+            n, sx, st = best[1][:3]
+            scale = st / max(setup * n + per_pixel * sx, 1e-9)
+            return setup * scale, per_pixel * scale
+        return setup, per_pixel
+
+
+def _encode_image(source, path, fmt, quality):
+    """Re-encode a rendered PNG and atomically move it to path. Runs on the
+    encoder threads; returns milliseconds taken."""
+    start = time.perf_counter()
+    root, ext = os.path.splitext(path)
+    partial = f"{root}.partial{ext}"
+    with Image.open(source) as image:
+        if fmt == "JPEG":
+            image = image.convert("RGB")  # JPEG has no alpha channel
+        # WebP method 2 encodes about twice as fast as the default, for
+        # files some 15% larger
+        image.save(partial, format=fmt, quality=quality, method=2)
+    os.replace(partial, path)
+    os.remove(source)
+    return (time.perf_counter() - start) * 1000
+
+
+def _pack_arrays(arrays):
+    """Concatenate NumPy arrays into one blob plus JSON-able specs."""
+    specs = []
+    parts = []
+    offset = 0
+    for name, array in arrays.items():
+        array = numpy.ascontiguousarray(array)
+        data = array.tobytes()
+        specs.append(
+            {
+                "name": name,
+                "dtype": array.dtype.newbyteorder("<").str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+        )
+        parts.append(data)
+        offset += len(data)
+    return specs, b"".join(parts)
+
+
+def _superpose(coords, reference):
+    """Fit every state of coords (states, atoms, 3) onto reference
+    (atoms, 3) by least-squares rotation and translation (Kabsch)."""
+    center = reference.mean(axis=0)
+    moving = coords - coords.mean(axis=1, keepdims=True)
+    h = moving.transpose(0, 2, 1) @ (reference - center)
+    u, _, vt = numpy.linalg.svd(h)
+    # No reflections
+    u[:, :, 2] *= numpy.sign(numpy.linalg.det(u @ vt))[:, None]
+    return moving @ (u @ vt) + center
+
+
+def _pairwise_rmsd(coords, fit=True):
+    """(states, states) RMSD matrix, after optimal superposition of each
+    pair when fit is set. Only the singular values of each pair's
+    correlation matrix are needed, computed for blocks of rows at once."""
+    states, atoms, _ = coords.shape
+    if fit:
+        coords = coords - coords.mean(axis=1, keepdims=True)
+    flat = coords.reshape(states, -1).astype(numpy.float64)
+    norms = (flat**2).sum(axis=1)
+    if not fit:
+        msd = norms[:, None] + norms[None, :] - 2 * flat @ flat.T
+        return numpy.sqrt(numpy.maximum(msd, 0) / atoms).astype(numpy.float32)
+    # (atoms, states * 3), so each block of correlation matrices is one
+    # matrix product
+    columns = flat.reshape(states, atoms, 3).transpose(1, 0, 2).reshape(atoms, -1)
+    rmsd = numpy.empty((states, states), dtype=numpy.float32)
+    block = max(1, RMSD_BLOCK // (states * 9))
+    for first in range(0, states, block):
+        rows = columns[:, first * 3 : (first + block) * 3]
+        h = (rows.T @ columns).reshape(-1, 3, states, 3).transpose(0, 2, 1, 3)
+        sv = numpy.linalg.svd(h, compute_uv=False)
+        sv[:, :, 2] *= numpy.sign(numpy.linalg.det(h))
+        msd = norms[first : first + block, None] + norms[None, :] - 2 * sv.sum(axis=2)
+        rmsd[first : first + block] = numpy.sqrt(numpy.maximum(msd, 0) / atoms)
+    return rmsd
+
+
+def _cluster_states(rmsd, cutoff):
+    """Greedy clustering (Daura et al.): the state with the most neighbours
+    within cutoff and those neighbours form a cluster, repeated on the
+    rest. Returns a cluster label per state and each cluster's central
+    state, largest cluster first."""
+    neighbours = rmsd <= cutoff
+    labels = numpy.full(len(rmsd), -1, dtype=numpy.int32)
+    remaining = numpy.ones(len(rmsd), dtype=bool)
+    centers = []
+    while remaining.any():
+        counts = numpy.where(remaining, (neighbours & remaining).sum(axis=1), -1)
+        center = int(counts.argmax())
+        members = neighbours[center] & remaining
+        labels[members] = len(centers)
+        centers.append(center)
+        remaining &= ~members
+    return labels, centers
+
+
+class _SpatialIndex:
+    """Cell list over a fixed set of coordinates.
+
+    Atoms are sorted by grid cell; a query visits the cells within the
+    search radius of each query point, all queries at once with NumPy.
+    """
+
+    def __init__(self, coords, atoms, digest, cell=INDEX_CELL):
+        self.coords = coords
+        self.atoms = atoms  # (model, index, chain, resi, resn, name) per atom
+        self.digest = digest
+        self.models = sorted({atom[0] for atom in atoms})
+        model_ids = {model: i for i, model in enumerate(self.models)}
+        self.atom_model = numpy.array(
+            [model_ids[atom[0]] for atom in atoms], dtype=numpy.int16
+        )
+        self.atom_index = numpy.array([atom[1] for atom in atoms], dtype=numpy.int32)
+        self._residues = None
+        self.cell = cell
+        keys = numpy.floor(coords / cell).astype(numpy.int64)
+        self.origin = keys.min(axis=0)
+        keys -= self.origin
+        self.dims = keys.max(axis=0) + 1
+        flat = numpy.ravel_multi_index(keys.T, self.dims)
+        self.order = numpy.argsort(flat, kind="stable")
+        self.cells, self.starts, counts = numpy.unique(
+            flat[self.order], return_index=True, return_counts=True
+        )
+        self.ends = self.starts + counts
+
+    def residues(self):
+        """(model, chain, resi, resn) per residue, and each atom's residue."""
+        if self._residues is None:
+            ids = {}
+            codes = [
+                ids.setdefault(atom[:1] + atom[2:5], len(ids)) for atom in self.atoms
+            ]
+            self._residues = list(ids), numpy.array(codes, dtype=numpy.int64)
+        return self._residues
+
+    def pairs(self, points, radius):
+        """All (query point, atom, distance) with distance <= radius."""
+        points = numpy.asarray(points, dtype=numpy.float32).reshape(-1, 3)
+        shell = int(numpy.ceil(radius / self.cell))
+        steps = numpy.arange(-shell, shell + 1)
+        offsets = numpy.stack(numpy.meshgrid(steps, steps, steps), -1).reshape(-1, 3)
+        keys = numpy.floor(points / self.cell).astype(numpy.int64) - self.origin
+        neighbours = keys[:, None, :] + offsets[None, :, :]
+        inside = ((neighbours >= 0) & (neighbours < self.dims)).all(axis=2)
+        query = numpy.nonzero(inside)[0]
+        flat = numpy.ravel_multi_index(neighbours[inside].T, self.dims)
+        pos = numpy.searchsorted(self.cells, flat)
+        pos[pos == len(self.cells)] = 0
+        hit = self.cells[pos] == flat
+        query, pos = query[hit], pos[hit]
+        lengths = self.ends[pos] - self.starts[pos]
+        # Expand every visited cell into its atoms
+        query = numpy.repeat(query, lengths)
+        before = numpy.cumsum(lengths) - lengths
+        first = numpy.repeat(self.starts[pos] - before, lengths)
+        atoms = self.order[first + numpy.arange(lengths.sum())]
+        distance = numpy.linalg.norm(points[query] - self.coords[atoms], axis=1)
+        keep = distance <= radius
+        return query[keep], atoms[keep], distance[keep]
+
+    def nearest(self, points, k):
+        """Indices and distances of the k nearest atoms to each point."""
+        points = numpy.asarray(points, dtype=numpy.float32).reshape(-1, 3)
+        k = min(k, len(self.coords))
+        span = float(numpy.linalg.norm(self.dims * self.cell)) + self.cell
+        radius = self.cell
+        while True:
+            query, atoms, distance = self.pairs(points, radius)
+            counts = numpy.bincount(query, minlength=len(points))
+            if counts.min(initial=k) >= k or radius > span:
+                break
+            radius *= 2
+        order = numpy.lexsort((distance, query))
+        query, atoms, distance = query[order], atoms[order], distance[order]
+        rank = numpy.arange(len(query)) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts
+        )
+        keep = rank < k
+        indices = numpy.full((len(points), k), -1, dtype=numpy.int64)
+        distances = numpy.full((len(points), k), numpy.inf, dtype=numpy.float32)
+        indices[query[keep], rank[keep]] = atoms[keep]
+        distances[query[keep], rank[keep]] = distance[keep]
+        return indices, distances
 
 
 class SocketServer:
-    def __init__(self, host='localhost', port=9880):
+    def __init__(self, host="localhost", port=9880):
         self.host = host
         self.port = port
         self.socket = None
-        self.client = None
+        self.clients = set()
         self.running = False
         self.thread = None
+        self.executor = None
+        # Heap of (priority, sequence, job); sequence keeps FIFO order
+        # within a class, and a requeued step keeps its place
+        self.queue = []
+        self.queue_depth = dict.fromkeys(PRIORITIES, 0)
+        self._queue_cond = threading.Condition()
+        self._sequence = itertools.count()
+        self.ready = threading.Event()
+        self.started_at = time.time()
+        self.stats = defaultdict(lambda: deque(maxlen=STATS_WINDOW))
+        # Bumped whenever agent code that may change the scene runs, so
+        # clients can tell when a checkpoint is worth taking
+        self.scene_serial = 0
+        self.indexes = OrderedDict()
+        self.analysis_cache = OrderedDict()
+        self.cursors = OrderedDict()
+        # Open batch id -> deadline; settings to restore when all have ended
+        self.batches = {}
+        self._batch_saved = None
+        self._batch_started = 0.0
+        self.replies = OrderedDict()
+        self._reply_bytes = 0
+        self.memory_budget = MEMORY_BUDGET_MB * 1024 * 1024 or None
+        self.spill_dir = SPILL_DIR
+        # Object name -> last time a command referred to it, oldest first
+        self.object_use = OrderedDict()
+        # Object name -> {"atoms", "states", "path", "codec", "evicted_at"};
+        # path is None when the object was not saved
+        self.evicted = {}
+        # RSS after the last eviction; evict again only once it grows
+        self._rss_floor = 0
+        self.render_model = None
+        self.encoder = None
+        # Profile every execution, not just those that ask for it
+        self.profile_all = False
+        # key -> {"label", "runs", "total_ms", "stats": pstats.Stats}
+        self.profiles = OrderedDict()
+        self._cursor_ids = itertools.count(1)
+        self.handlers = {
+            "execute": self._execute_command,
+            "stats": self._stats_command,
+            "render": self._render_command,
+            "checkpoint": self._checkpoint_command,
+            "restore": self._restore_command,
+            "coordsets": self._coordsets_command,
+            "spatial": self._spatial_command,
+            "interface": self._interface_command,
+            "ensemble": self._ensemble_command,
+            "upload": self._upload_command,
+            "fetch": self._fetch_command,
+            "close": self._close_command,
+            "profile": self._profile_command,
+            "memory": self._memory_command,
+            "suspend": self._suspend_command,
+        }
 
     def start(self):
         if self.running:
             return False
         self.running = True
+        self.ready.clear()
+        self.executor = threading.Thread(target=self._run_executor, daemon=True)
+        self.executor.start()
         self.thread = threading.Thread(target=self._run_server, daemon=True)
         self.thread.start()
         return True
@@ -49,20 +948,20 @@ class SocketServer:
             self.socket.bind((self.host, self.port))
             self.socket.listen(5)
             self.socket.settimeout(1.0)
+            # Port 0 asks the OS for a free port; report the one we got
+            self.port = self.socket.getsockname()[1]
+            self.ready.set()
 
             print(f"Claude socket listener active on port {self.port}")
 
             while self.running:
                 try:
-                    new_client, address = self.socket.accept()
-                    if self.client:
-                        try:
-                            self.client.close()
-                        except:
-                            pass
-                    self.client = new_client
-                    self.client.settimeout(1.0)
-                    self._handle_client(address)
+                    client, address = self.socket.accept()
+                    client.settimeout(1.0)
+                    self.clients.add(client)
+                    threading.Thread(
+                        target=self._handle_client, args=(client,), daemon=True
+                    ).start()
                 except socket.timeout:
                     continue
                 except Exception as e:
@@ -73,56 +972,1543 @@ class SocketServer:
             traceback.print_exc()
         finally:
             self._cleanup()
+            self.ready.set()
 
-    def _handle_client(self, address):
-        buffer = b''
-        while self.running and self.client:
+    def _handle_client(self, client):
+        """Read one connection's requests and queue them for the executor.
+
+        The handshake is answered here, so connecting never waits behind
+        queued work. Each request is finished before the next is read,
+        which keeps a connection's responses in order.
+        """
+        channel = _Channel(client)
+        while self.running:
             try:
-                data = self.client.recv(4096)
+                data = client.recv(65536)
                 if not data:
                     break
-                buffer += data
-                try:
-                    command = json.loads(buffer.decode('utf-8'))
-                    buffer = b''
-                    result = self._execute_command(command)
-                    response = json.dumps(result)
-                    self.client.sendall(response.encode('utf-8'))
-                except json.JSONDecodeError:
-                    continue
+                channel.buffer += data
+                while True:
+                    message = channel.next_message()
+                    if message is None:
+                        break
+                    command, framed, timings = message
+                    if command.get("type") == "hello":
+                        result = self._hello(channel, command)
+                        timings["queue_ms"] = 0.0
+                        client.sendall(
+                            self._encode_response(
+                                command, result, timings, channel, framed
+                            )
+                        )
+                        continue
+                    priority = command.get("priority", "interactive")
+                    if priority not in PRIORITIES:
+                        result = {
+                            "status": "error",
+                            "error": f"Unknown priority: {priority}",
+                        }
+                        client.sendall(
+                            self._encode_response(
+                                command, result, timings, channel, framed
+                            )
+                        )
+                        continue
+                    if command.get("type") == "suspend":
+                        if command.get("action") == "begin":
+                            channel.batches.add(command.get("id"))
+                        else:
+                            channel.batches.discard(command.get("id"))
+                    job = _Job(client, channel, command, framed, timings, priority)
+                    self._submit(job)
+                    while not job.done.wait(1.0):
+                        if not self.running:
+                            break
             except socket.timeout:
                 continue
             except Exception as e:
                 if self.running:
                     print(f"Client error: {e}")
                 break
-        if self.client:
+        channel.release()
+        # End the batches a client left open, so its scene gets updated
+        for batch in channel.batches:
+            command = {"type": "suspend", "action": "end", "id": batch}
+            self._submit(_Job(client, channel, command, True, {}, "interactive"))
+        self.clients.discard(client)
+        try:
+            client.close()
+        except OSError:
+            pass
+
+    def _submit(self, job):
+        with self._queue_cond:
+            if not self.running:
+                job.done.set()
+                return
+            job.queued_at = time.perf_counter()
+            if job.sequence is None:
+                job.sequence = next(self._sequence)
+            heapq.heappush(self.queue, (PRIORITIES[job.priority], job.sequence, job))
+            self.queue_depth[job.priority] += 1
+            self._queue_cond.notify()
+
+    def _run_executor(self):
+        """Run queued requests, most urgent class first, one step at a time."""
+        while True:
+            with self._queue_cond:
+                if self.running and not self.queue:
+                    self._queue_cond.wait(1.0)
+                if not self.running:
+                    break
+                job = heapq.heappop(self.queue)[2] if self.queue else None
+                if job is not None:
+                    self.queue_depth[job.priority] -= 1
+                    depth = self.queue_depth[job.priority]
+            if job is None:
+                # Idle: end batches a client has held open too long
+                self._expire_batches()
+                continue
+            wait_ms = (time.perf_counter() - job.queued_at) * 1000
+            job.timings["queue_ms"] = job.timings.get("queue_ms", 0.0) + wait_ms
+            self.stats[f"queue.{job.priority}"].append(
+                {"queue_ms": wait_ms, "depth": depth}
+            )
             try:
-                self.client.close()
-            except:
+                result = self._step(job)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"status": "error", "error": str(e)}
+            if result is None:
+                self._submit(job)
+            elif result is not _WAITING:
+                self._finish(job, result)
+        # Release connections still waiting on work that will not run
+        with self._queue_cond:
+            for _, _, job in self.queue:
+                job.done.set()
+            self.queue.clear()
+        if self.batches:
+            self.batches.clear()
+            self._resume_updates()
+
+    def _step(self, job):
+        """Start a job or advance its streaming handler by one result.
+
+        Returns the final result, None when the job should be queued again
+        for its next step, or _WAITING when a step yielded a Future (work
+        handed off the executor thread); the job is queued again once the
+        Future is done.
+        """
+        if job.steps is None:
+            replay = self._replay(job.command, job.timings)
+            if replay is not None:
+                job.replayed = True
+                return replay
+            job.serial = self.scene_serial
+            job.words = _referenced_names(job.command)
+            created = _created_names(job.command)
+            for name in list(self.evicted):
+                if name in created or "all" in created:
+                    self._forget_evicted(name)
+            self._reload_evicted(job.words, job.timings)
+            result = self._dispatch(job.command, job.timings)
+            if not isinstance(result, types.GeneratorType):
+                return result
+            job.steps = result
+        result = next(
+            job.steps, {"status": "error", "error": "Handler produced no result"}
+        )
+        if isinstance(result, Future):
+            result.add_done_callback(lambda _: self._submit(job))
+            return _WAITING
+        if result.get("final", True):
+            return result
+        # Bare-JSON clients can only take one reply per request, so they
+        # just get the final result
+        if job.framed:
+            blob = result.pop("_blob", b"")
+            body = json.dumps(result, default=_to_json).encode("utf-8")
+            job.sock.sendall(job.channel.frame(body, blob, {}))
+        return None
+
+    def _finish(self, job, result):
+        """Track object use, remember and send the final result."""
+        if not job.replayed:
+            if job.words or self.scene_serial != job.serial:
+                self._track_objects(job.words, job.timings)
+            self._remember(job.command, result)
+        try:
+            job.sock.sendall(
+                self._encode_response(
+                    job.command, result, job.timings, job.channel, job.framed
+                )
+            )
+        except OSError:
+            # The client went away; a retry under the same request id will
+            # be answered from the replay cache
+            pass
+        finally:
+            job.done.set()
+
+    def _hello(self, channel, command):
+        """Negotiate the framed protocol and a compression codec."""
+        codec = next((c for c in command.get("codecs", []) if c in CODECS), None)
+        channel.codec = codec
+        channel.threshold = command.get("compress_threshold", COMPRESS_THRESHOLD)
+        shm = command.get("shm")
+        if isinstance(shm, dict) and _shm_probe(shm):
+            channel.shm_dir = shm["dir"]
+            _sweep_segments(channel.shm_dir)
+        return {
+            "status": "success",
+            "protocol": PROTOCOL_VERSION,
+            "codec": codec or "none",
+            "codecs": sorted(CODECS),
+            "capabilities": sorted(self.handlers),
+            "shm": channel.shm_dir is not None,
+        }
+
+    def _replay(self, command, timings):
+        """The stored response to a retried request id, if there is one.
+
+        Clients resend a request under the same id when the connection drops
+        before the response arrives; the work already ran, so the stored
+        response is sent again instead of running it twice.
+        """
+        request_id = command.get("request_id")
+        if request_id is None or request_id not in self.replies:
+            return None
+        self.replies.move_to_end(request_id)
+        timings["queue_ms"] = 0.0
+        timings["replayed"] = 1
+        return dict(self.replies[request_id])
+
+    def _remember(self, command, result):
+        request_id = command.get("request_id")
+        if request_id is None:
+            return
+        size = _reply_size(result)
+        if size > REPLAY_MAX_ENTRY:
+            result = {
+                "status": "error",
+                "error": "The request already ran; its response was too large "
+                "to keep for replay",
+            }
+            size = _reply_size(result)
+        if request_id in self.replies:
+            self._reply_bytes -= _reply_size(self.replies.pop(request_id))
+        self.replies[request_id] = dict(result)
+        self._reply_bytes += size
+        while len(self.replies) > REPLAY_CACHE_SIZE or (
+            self._reply_bytes > REPLAY_MAX_BYTES
+        ):
+            _, dropped = self.replies.popitem(last=False)
+            self._reply_bytes -= _reply_size(dropped)
+
+    def _track_objects(self, words, timings):
+        """Mark the objects a command used, then enforce the memory budget."""
+        now = time.time()
+        names = cmd.get_names("objects")
+        live = set(names)
+        for name in [n for n in self.object_use if n not in live]:
+            del self.object_use[name]
+        for name in names:
+            if name in words or name not in self.object_use:
+                self.object_use[name] = now
+                self.object_use.move_to_end(name)
+                # A new object under an evicted name replaces the saved one
+                self._forget_evicted(name)
+        if self.memory_budget:
+            self._enforce_budget(words, timings)
+
+    def _enforce_budget(self, keep, timings):
+        """Evict least recently used objects (except those in keep) until
+        their estimated size covers the RSS over budget, or, once objects
+        have been evicted, the growth since (freed memory stays with the
+        process, so evicting does not bring RSS down)."""
+        rss = _rss_bytes()
+        if rss is None or rss <= self.memory_budget:
+            self._rss_floor = 0
+            return
+        if rss <= self._rss_floor:
+            # Still over, but not growing: loads are reusing freed memory
+            self._rss_floor = rss
+            return
+        start = time.perf_counter()
+        excess = rss - max(self.memory_budget, self._rss_floor)
+        evicted = 0
+        for name in list(self.object_use):
+            if excess <= 0:
+                break
+            if name in keep:
+                continue
+            try:
+                excess -= self._evict(name)
+            except Exception as e:
+                print(f"Could not evict {name}: {e}")
+                continue
+            evicted += 1
+        self._rss_floor = _rss_bytes() or 0
+        if evicted:
+            timings["evict_ms"] = (time.perf_counter() - start) * 1000
+            timings["evicted"] = evicted
+
+    def _evict(self, name):
+        """Delete an object, saving it first if there is a spill directory.
+        Returns its estimated size in bytes."""
+        atoms = cmd.count_atoms(f"%{name}")
+        states = cmd.count_states(f"%{name}")
+        entry = {
+            "atoms": atoms,
+            "states": states,
+            "path": None,
+            "codec": None,
+            "evicted_at": time.time(),
+        }
+        if self.spill_dir:
+            data = pickle.dumps(
+                cmd.get_session(name, partial=1), protocol=pickle.HIGHEST_PROTOCOL
+            )
+            codec = next(c for c in ("zstd", "lz4", "zlib") if c in CODECS)
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"{name}.session")
+            with open(path, "wb") as f:
+                f.write(CODECS[codec][0](data))
+            entry.update(path=path, codec=codec)
+        cmd.delete(name)
+        del self.object_use[name]
+        self.evicted[name] = entry
+        return atoms * ATOM_BYTES + atoms * states * COORD_BYTES
+
+    def _reload_evicted(self, words, timings):
+        """Bring back saved objects that a command is about to use."""
+        names = [n for n in words if n in self.evicted and self.evicted[n]["path"]]
+        if not names:
+            return
+        start = time.perf_counter()
+        for name in names:
+            entry = self.evicted[name]
+            try:
+                with open(entry["path"], "rb") as f:
+                    data = CODECS[entry["codec"]][1](f.read())
+                cmd.set_session(pickle.loads(data), partial=1)
+            except Exception as e:
+                print(f"Could not reload {name}: {e}")
+                continue
+            self._forget_evicted(name)
+            self.object_use[name] = time.time()
+        if self._rss_floor:
+            # Memory a reload takes is not new work: evicting others for it
+            # would only make them reload in turn
+            self._rss_floor = max(self._rss_floor, _rss_bytes() or 0)
+        timings["reload_ms"] = (time.perf_counter() - start) * 1000
+
+    def _forget_evicted(self, name):
+        entry = self.evicted.pop(name, None)
+        if entry and entry["path"]:
+            try:
+                os.remove(entry["path"])
+            except OSError:
                 pass
-            self.client = None
 
-    def _execute_command(self, command):
+    def _memory_command(self, command, timings):
+        """Report RSS and per-object sizes; optionally set the budget (MB,
+        0 to disable) and spill directory ("" to disable) first."""
+        if "budget_mb" in command:
+            self.memory_budget = float(command["budget_mb"] or 0) * 1024 * 1024 or None
+            self._rss_floor = 0
+        if "spill_dir" in command:
+            self.spill_dir = command["spill_dir"] or None
+        self._track_objects(set(), timings)
+        objects = []
+        for name, used in self.object_use.items():
+            atoms = cmd.count_atoms(f"%{name}")
+            states = cmd.count_states(f"%{name}")
+            objects.append(
+                {
+                    "name": name,
+                    "atoms": atoms,
+                    "states": states,
+                    "estimated_bytes": atoms * ATOM_BYTES
+                    + atoms * states * COORD_BYTES,
+                    "last_used": used,
+                }
+            )
+        return {
+            "status": "success",
+            "rss_bytes": _rss_bytes(),
+            "budget_bytes": self.memory_budget,
+            "spill_dir": self.spill_dir,
+            "objects": objects,
+            "evicted": [
+                {
+                    "name": name,
+                    "atoms": entry["atoms"],
+                    "states": entry["states"],
+                    "saved": entry["path"] is not None,
+                    "evicted_at": entry["evicted_at"],
+                }
+                for name, entry in self.evicted.items()
+            ],
+        }
+
+    def _dispatch(self, command, timings):
+        """Route a decoded request to the handler for its type."""
+        handler = self.handlers.get(command.get("type", "execute"))
+        self._expire_cursors()
+        self._expire_batches()
+        if handler is None:
+            return {
+                "status": "error",
+                "error": f"Unknown command type: {command.get('type')}",
+            }
+        return handler(command, timings)
+
+    def _encode_response(self, command, result, timings, channel, framed):
+        """Serialize a result, attach server timings and record them.
+
+        Compression happens after the timings are spliced in, so
+        compress_ms and wire_bytes_out only appear in the recorded stats.
+        """
+        blob = result.pop("_blob", b"")
+        if framed:
+            result["scene_serial"] = self.scene_serial
+        if blob and not framed:
+            result = {
+                "status": "error",
+                "error": "Binary response needs the framed protocol",
+            }
+            blob = b""
+        start = time.perf_counter()
+        body = json.dumps(result, default=_to_json).encode("utf-8")
+        timings["serialize_ms"] = (time.perf_counter() - start) * 1000
+        timings["bytes_out"] = len(body) + len(blob)
+        timings["total_ms"] = sum(v for k, v in timings.items() if k.endswith("_ms"))
+        # Splice timings into the already-encoded object rather than
+        # serializing the (possibly large) result a second time
+        extra = b', "timings": ' + json.dumps(timings).encode("utf-8")
+        body = body[:-1] + extra + b"}"
+        if framed:
+            response = channel.frame(body, blob, timings)
+        else:
+            response = body
+        timings["wire_bytes_out"] = len(response)
+        kind = command.get("kind") or command.get("type", "execute")
+        self.stats[kind].append(timings)
+        return response
+
+    def _run_code(self, code, timings, exec_globals=None, profile=None):
+        """Execute agent code with `cmd` in scope and return its output
+        (or str(_result) if the code sets one). Exceptions propagate.
+        Pass exec_globals to inspect the namespace afterwards, and profile
+        (True, or a procedure name) to run it under cProfile."""
+        start = time.perf_counter()
+        compiled = compile(code, "<claude>", "exec")
+        timings["compile_ms"] = (time.perf_counter() - start) * 1000
+        if _changes_scene(code):
+            self.scene_serial += 1
+        if exec_globals is None:
+            exec_globals = {}
+        exec_globals.update(
+            cmd=cmd, iterate_rows=iterate_rows, __builtins__=__builtins__
+        )
+        if profile is None and self.profile_all:
+            profile = True
+        profiler = cProfile.Profile() if profile else None
+        output_buffer = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with redirect_stdout(output_buffer):
+                if profiler is None:
+                    exec(compiled, exec_globals)
+                else:
+                    profiler.runcall(exec, compiled, exec_globals)
+        finally:
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+            if profiler is not None:
+                self._record_profile(profile, code, profiler, timings["exec_ms"])
+        output = output_buffer.getvalue()
+        if "_result" in exec_globals:
+            output = str(exec_globals["_result"])
+        return output
+
+    def _execute_command(self, command, timings):
+        if "units" in command:
+            return self._execute_units(command["units"], timings, command)
         code = command.get("code", "")
         if not code:
             return {"status": "error", "error": "No code provided"}
+        namespace = {}
         try:
-            exec_globals = {"cmd": cmd, "__builtins__": __builtins__}
-            output_buffer = io.StringIO()
-            with redirect_stdout(output_buffer):
-                exec(code, exec_globals)
-            output = output_buffer.getvalue()
-            if '_result' in exec_globals:
-                output = str(exec_globals['_result'])
-            return {"status": "success", "output": output or "OK"}
+            output = self._run_code(
+                code, timings, namespace, profile=command.get("profile")
+            )
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        result = {"status": "success", "output": output or "OK"}
+        if "_cursor" in namespace:
+            # Rows are produced lazily as the client fetches pages
+            result["cursor"] = self._open_cursor(namespace["_cursor"])
+        return result
+
+    def _record_profile(self, profile, code, profiler, exec_ms):
+        """Fold one run's profile into the aggregate for its key."""
+        if isinstance(profile, str):
+            key = label = profile
+        else:
+            key = f"code:{zlib.crc32(code.encode('utf-8')):08x}"
+            label = code.strip().splitlines()[0][:80] if code.strip() else ""
+        entry = self.profiles.get(key)
+        if entry is None:
+            entry = self.profiles[key] = {
+                "label": label,
+                "runs": 0,
+                "total_ms": 0.0,
+                "stats": pstats.Stats(profiler),
+            }
+        else:
+            entry["stats"].add(profiler)
+        entry["runs"] += 1
+        entry["total_ms"] += exec_ms
+        self.profiles.move_to_end(key)
+        while len(self.profiles) > PROFILE_KEYS:
+            self.profiles.popitem(last=False)
+
+    def profile_report(self, key=None, top=30, sort="cumulative"):
+        """Top functions of the aggregated profiles, all keys or one."""
+        keys = [key] if key is not None else list(self.profiles)
+        entries = [self.profiles[k] for k in keys if k in self.profiles]
+        functions = []
+        if entries:
+            merged = pstats.Stats()
+            for entry in entries:
+                merged.add(entry["stats"])
+            column = {"cumulative": 3, "tottime": 2, "calls": 1}[sort]
+            rows = sorted(
+                merged.stats.items(), key=lambda item: item[1][column], reverse=True
+            )
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows[:top]:
+                functions.append(
+                    {
+                        "function": f"{os.path.basename(filename)}:{line}({name})",
+                        "calls": calls,
+                        "tottime_ms": tottime * 1000,
+                        "cumtime_ms": cumtime * 1000,
+                    }
+                )
+        return {
+            "enabled": self.profile_all,
+            "keys": [
+                {
+                    "key": k,
+                    "label": self.profiles[k]["label"],
+                    "runs": self.profiles[k]["runs"],
+                    "total_ms": self.profiles[k]["total_ms"],
+                }
+                for k in keys
+                if k in self.profiles
+            ],
+            "functions": functions,
+        }
+
+    def _profile_command(self, command, timings):
+        """Report the profiles; optionally switch profile-everything on or
+        off first and clear them after reading."""
+        if "enable" in command:
+            self.profile_all = bool(command["enable"])
+        sort = command.get("sort", "cumulative")
+        if sort not in ("cumulative", "tottime", "calls"):
+            return {"status": "error", "error": f"Unknown sort key: {sort}"}
+        report = self.profile_report(
+            command.get("key"), int(command.get("top", 30)), sort
+        )
+        if command.get("reset"):
+            self.profiles.clear()
+        return {"status": "success", **report}
+
+    def _execute_units(self, units, timings, command):
+        """Run code units one per step, so the scheduler can run other
+        requests between them; each unit's output is a partial result."""
+        outputs = []
+        for i, code in enumerate(units):
+            unit_timings = {}
+            try:
+                output = self._run_code(
+                    code, unit_timings, profile=command.get("profile")
+                )
+            except Exception as e:
+                yield {"status": "error", "error": f"Unit {i}: {e}", "outputs": outputs}
+                return
+            for key, value in unit_timings.items():
+                timings[key] = timings.get(key, 0.0) + value
+            outputs.append(output)
+            if i < len(units) - 1:
+                yield {"status": "success", "final": False, "unit": i, "output": output}
+        yield {"status": "success", "outputs": outputs}
+
+    def _open_cursor(self, rows):
+        cursor_id = str(next(self._cursor_ids))
+        self.cursors[cursor_id] = _Cursor(rows)
+        while len(self.cursors) > MAX_CURSORS:
+            self.cursors.popitem(last=False)
+        return cursor_id
+
+    def _suspend_command(self, command, timings):
+        """Begin or end a batch: scene updates and representation rebuilds
+        are suspended while any batch is open.
+
+        "action" is "begin" or "end" and "id" names the batch. The first
+        begin saves and applies BATCH_SETTINGS, the last end restores them,
+        so PyMOL brings the scene up to date once for the whole batch.
+        A batch not ended within "timeout" seconds is ended here, and one
+        whose connection closes is ended for it.
+        """
+        action = command.get("action")
+        batch = command.get("id")
+        if action not in ("begin", "end") or not batch:
+            return {"status": "error", "error": "Need action begin/end and an id"}
+        if action == "begin":
+            if not self.batches:
+                self._batch_saved = {name: cmd.get(name) for name in BATCH_SETTINGS}
+                self._batch_started = time.perf_counter()
+                for name, value in BATCH_SETTINGS.items():
+                    cmd.set(name, value)
+            timeout = float(command.get("timeout") or BATCH_TTL)
+            self.batches[batch] = time.monotonic() + timeout
+            return {"status": "success", "open": len(self.batches)}
+        result = {"status": "success", "ended": batch in self.batches}
+        self.batches.pop(batch, None)
+        if result["ended"] and not self.batches:
+            result["suspended_ms"] = self._resume_updates()
+        return dict(result, open=len(self.batches))
+
+    def _resume_updates(self):
+        """Restore the settings saved when the first batch began; returns
+        how long updates were suspended (ms)."""
+        for name, value in (self._batch_saved or {}).items():
+            cmd.set(name, value)
+        self._batch_saved = None
+        return (time.perf_counter() - self._batch_started) * 1000
+
+    def _expire_batches(self):
+        """End batches past their deadline."""
+        now = time.monotonic()
+        expired = [batch for batch, end in self.batches.items() if end < now]
+        for batch in expired:
+            del self.batches[batch]
+        if expired and not self.batches:
+            self._resume_updates()
+
+    def _expire_cursors(self):
+        """Drop cursors nobody has fetched from for CURSOR_TTL seconds."""
+        deadline = time.monotonic() - CURSOR_TTL
+        while self.cursors:
+            cursor_id, cursor = next(iter(self.cursors.items()))
+            if cursor.touched > deadline:
+                break
+            del self.cursors[cursor_id]
+
+    def _fetch_command(self, command, timings):
+        """Return the next page of a cursor's rows; "done" once exhausted."""
+        cursor_id = command.get("cursor")
+        cursor = self.cursors.get(cursor_id)
+        if cursor is None:
+            return {
+                "status": "error",
+                "error": f"Unknown or expired cursor: {cursor_id}",
+            }
+        size = max(1, min(int(command.get("size", PAGE_SIZE)), MAX_PAGE_SIZE))
+        start = time.perf_counter()
+        try:
+            rows = list(itertools.islice(cursor.rows, size))
+        except Exception as e:
+            del self.cursors[cursor_id]
+            return {"status": "error", "error": str(e)}
+        finally:
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+        done = len(rows) < size
+        if done:
+            del self.cursors[cursor_id]
+        else:
+            cursor.touched = time.monotonic()
+            self.cursors.move_to_end(cursor_id)
+        return {"status": "success", "rows": rows, "done": done}
+
+    def _close_command(self, command, timings):
+        """Drop a cursor before it is exhausted."""
+        self.cursors.pop(command.get("cursor"), None)
+        return {"status": "success"}
+
+    def _render_command(self, command, timings):
+        """Run optional setup code, then render the scene to command["path"].
+
+        ray=False draws with OpenGL when PyMOL has a viewport and falls back
+        to ray tracing when headless. With progressive=True a quick preview
+        comes first, followed by full-size and antialiased refinements for
+        as long as each is predicted to finish within budget_s. Every stage
+        atomically replaces the image at path and is streamed back as a
+        non-final result.
+
+        For compact feedback images, max_dim caps the longer side (the
+        scene is rendered at that size rather than scaled down afterwards)
+        and format "jpeg" or "webp" re-encodes each image at image_quality
+        on the encoder threads, off the executor. Without Pillow the image
+        stays a PNG, with its path changed to match.
+        """
+        path = command.get("path")
+        width = int(command.get("width", 800))
+        height = int(command.get("height", 600))
+        budget = command.get("budget_s")
+        if not path:
+            yield {"status": "error", "error": "No output path provided"}
+            return
+        try:
+            path, fmt, quality = self._image_encoding(command, path)
+        except ValueError as e:
+            yield {"status": "error", "error": str(e)}
+            return
+        max_dim = command.get("max_dim")
+        if max_dim and max(width, height) > max_dim:
+            scale = max_dim / max(width, height)
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        # With re-encoding, PyMOL's PNG is written next to the final image
+        rendered = f"{os.path.splitext(path)[0]}.render.png" if fmt else path
+        try:
+            output = self._run_code(command.get("code") or "pass", timings)
+        except Exception as e:
+            yield {"status": "error", "error": str(e)}
+            return
+
+        if not command.get("progressive") and (
+            command.get("quality") or command.get("target_s") is not None
+        ):
+            try:
+                result = self._planned_render(rendered, width, height, command, timings)
+            except Exception as e:
+                yield {"status": "error", "error": str(e)}
+                return
+            if fmt:
+                yield from self._encode(rendered, path, fmt, quality, timings)
+            yield dict(
+                result,
+                path=path,
+                format=self._format_name(fmt),
+                bytes=os.path.getsize(path),
+                output=output or "OK",
+            )
+            return
+
+        stages = self._plan_stages(
+            width, height, command.get("ray", True), command.get("progressive", False)
+        )
+        start = time.perf_counter()
+        done = []
+        per_pixel = None  # seconds per antialias-weighted ray-traced pixel
+        for i, (name, w, h, mode, antialias) in enumerate(stages):
+            cost = w * h * ANTIALIAS_COST.get(antialias, 1.0)
+            if done and budget is not None and mode == "ray":
+                if per_pixel:
+                    predicted = per_pixel * cost
+                else:
+                    # The first ray stage after a drawn preview
+                    predicted = self._predict_ray(w, h, antialias, timings)
+                if predicted is None or (
+                    time.perf_counter() - start + predicted > budget
+                ):
+                    break
+            try:
+                seconds = self._render_stage(rendered, w, h, mode, antialias)
+            except Exception as e:
+                yield {"status": "error", "error": str(e), "stages": done}
+                return
+            if fmt:
+                yield from self._encode(rendered, path, fmt, quality, timings)
+            if mode == "ray":
+                per_pixel = seconds / cost
+            done.append(
+                {
+                    "stage": name,
+                    "width": w,
+                    "height": h,
+                    "mode": mode,
+                    "antialias": antialias,
+                    "seconds": seconds,
+                }
+            )
+            if i < len(stages) - 1:
+                yield dict(done[-1], status="success", final=False, path=path)
+        timings["render_ms"] = (time.perf_counter() - start) * 1000
+        yield {
+            "status": "success",
+            "final": True,
+            "path": path,
+            "stage": done[-1]["stage"],
+            "stages": done,
+            "format": self._format_name(fmt),
+            "bytes": os.path.getsize(path),
+            "output": output or "OK",
+        }
+
+    def _image_encoding(self, command, path):
+        """The path, Pillow format and quality of a render's image; no
+        format for the PNG PyMOL writes itself."""
+        fmt = (command.get("format") or "png").lower()
+        if fmt == "png":
+            return path, None, None
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {fmt} (png, jpeg, webp)")
+        if Image is None:
+            return f"{os.path.splitext(path)[0]}.png", None, None
+        quality = command.get("image_quality") or "medium"
+        quality = IMAGE_QUALITY.get(quality, quality)
+        if not isinstance(quality, int) or not 1 <= quality <= 100:
+            raise ValueError(
+                f"image_quality must be 1-100 or {', '.join(IMAGE_QUALITY)}"
+            )
+        return path, IMAGE_FORMATS[fmt], quality
+
+    @staticmethod
+    def _format_name(fmt):
+        return fmt.lower() if fmt else "png"
+
+    def _encode(self, rendered, path, fmt, quality, timings):
+        """Re-encode a rendered PNG on the encoder threads. Yields the
+        Future, so the executor runs other requests in the meantime."""
+        if self.encoder is None:
+            self.encoder = ThreadPoolExecutor(2, thread_name_prefix="claudemol-encode")
+        future = self.encoder.submit(_encode_image, rendered, path, fmt, quality)
+        yield future
+        timings["encode_ms"] = timings.get("encode_ms", 0.0) + future.result()
+
+    def _planned_render(self, path, width, height, command, timings):
+        """Ray trace with antialias, shadows, resolution and threads chosen
+        for a quality level or to fit a target time, and learn from how
+        long it took."""
+        quality = command.get("quality")
+        target = command.get("target_s")
+        if quality is not None and quality not in QUALITY_LEVELS:
+            raise ValueError(
+                f"Unknown quality: {quality} ({', '.join(QUALITY_LEVELS)})"
+            )
+        start = time.perf_counter()
+        model = self._render_model()
+        if model.calibration is None or command.get("calibrate"):
+            model.calibration = self._calibrate_render()
+            timings["calibrate_ms"] = (time.perf_counter() - start) * 1000
+        bucket = self._render_bucket()
+
+        def predicted(candidate):
+            antialias, shadow, scale = candidate
+            w, h = max(1, round(width * scale)), max(1, round(height * scale))
+            return model.predict(bucket, model.work(w, h, antialias, shadow))
+
+        if quality is not None:
+            choice = RENDER_CANDIDATES[QUALITY_LEVELS[quality]]
+        else:
+            choice = next(
+                (c for c in RENDER_CANDIDATES if predicted(c) <= target),
+                RENDER_CANDIDATES[-1],
+            )
+        antialias, shadow, scale = choice
+        w, h = max(1, round(width * scale)), max(1, round(height * scale))
+        threads = max(1, min(os.cpu_count() or 1, 64))
+        prediction = predicted(choice)
+        timings["plan_ms"] = (time.perf_counter() - start) * 1000
+
+        saved = {name: cmd.get(name) for name in ("ray_shadow", "max_threads")}
+        cmd.set("ray_shadow", shadow)
+        cmd.set("max_threads", threads)
+        try:
+            seconds = self._render_stage(path, w, h, "ray", antialias)
+        finally:
+            for name, value in saved.items():
+                cmd.set(name, value)
+        model.observe(bucket, model.work(w, h, antialias, shadow), seconds)
+        try:
+            model.save()
+        except OSError as e:
+            print(f"Could not save render model: {e}")
+        timings["render_ms"] = seconds * 1000
+        plan = {
+            "quality": quality,
+            "target_s": target,
+            "antialias": antialias,
+            "ray_shadow": bool(shadow),
+            "max_threads": threads,
+            "width": w,
+            "height": h,
+            "bucket": bucket,
+            "predicted_s": prediction,
+            "actual_s": seconds,
+        }
+        return {
+            "status": "success",
+            "final": True,
+            "path": path,
+            "stage": "final",
+            "stages": [
+                {
+                    "stage": "final",
+                    "width": w,
+                    "height": h,
+                    "mode": "ray",
+                    "antialias": antialias,
+                    "seconds": seconds,
+                }
+            ],
+            "plan": plan,
+        }
+
+    def _render_model(self):
+        if self.render_model is None:
+            model_path = os.environ.get("CLAUDEMOL_RENDER_MODEL") or RENDER_MODEL_PATH
+            self.render_model = _RenderModel(model_path)
+        return self.render_model
+
+    @staticmethod
+    def _render_bucket():
+        """The render model's bucket for the scene: atom count and surfaces."""
+        atoms = cmd.count_atoms("visible")
+        surface = cmd.count_atoms("rep surface") > 0
+        return f"{int(math.log2(atoms + 1))}:{'surface' if surface else '-'}"
+
+    def _predict_ray(self, width, height, antialias, timings):
+        """Seconds a ray trace of the scene should take, from the render
+        model when this host is calibrated, else from a small probe trace
+        scaled up (setup included, so on the high side). None if the probe
+        fails."""
+        if antialias < 0:
+            antialias = int(float(cmd.get("antialias") or 0))
+        model = self._render_model()
+        if model.calibration is not None:
+            # Assumes shadows, the costlier case
+            work = model.work(width, height, antialias, True)
+            return model.predict(self._render_bucket(), work)
+        scale = min(1.0, PREVIEW_MAX_DIM / max(width, height))
+        w, h = max(1, round(width * scale)), max(1, round(height * scale))
+        start = time.perf_counter()
+        try:
+            cmd.ray(w, h, antialias=0)
+        except Exception as e:
+            print(f"Could not time a probe ray trace: {e}")
+            return None
+        seconds = time.perf_counter() - start
+        timings["probe_ms"] = seconds * 1000
+        return seconds * width * height * ANTIALIAS_COST.get(antialias, 1.0) / (w * h)
+
+    def _calibrate_render(self):
+        """Time ray traces of a small reference scene, with the user's
+        objects hidden, to get this host's cost factors."""
+        enabled = cmd.get_names("objects", enabled_only=1)
+        view = cmd.get_view()
+        saved = cmd.get("ray_shadow")
+
+        def ray(width, height, antialias, shadow):
+            cmd.set("ray_shadow", shadow)
+            start = time.perf_counter()
+            cmd.ray(width, height, antialias=antialias)
+            return time.perf_counter() - start
+
+        try:
+            cmd.disable("all")
+            cmd.fragment("trp", CALIBRATION_OBJECT)
+            cmd.show("surface", CALIBRATION_OBJECT)
+            cmd.zoom(CALIBRATION_OBJECT)
+            ray(80, 60, 0, 1)  # builds the surface
+            small = ray(160, 120, 0, 1)
+            large = ray(320, 240, 0, 1)
+            per_pixel = max((large - small) / (320 * 240 - 160 * 120), 1e-12)
+            setup = max(small - per_pixel * 160 * 120, 0.0)
+            base = max(large - setup, 1e-9)
+            factors = {"0": 1.0}
+            for antialias in (1, 2):
+                factors[str(antialias)] = max(
+                    (ray(320, 240, antialias, 1) - setup) / base, 1.0
+                )
+            no_shadow = min(max((ray(320, 240, 0, 0) - setup) / base, 0.1), 1.0)
+        finally:
+            cmd.delete(CALIBRATION_OBJECT)
+            cmd.set("ray_shadow", saved)
+            for name in enabled:
+                cmd.enable(name)
+            cmd.set_view(view)
+        return {
+            "setup": setup,
+            "per_pixel": per_pixel,
+            "antialias": factors,
+            "no_shadow": no_shadow,
+        }
+
+    def _plan_stages(self, width, height, ray, progressive):
+        """List (name, width, height, mode, antialias) render stages."""
+        gui = _has_gui()
+        mode = "ray" if ray or not gui else "draw"
+        if not progressive:
+            return [("final", width, height, mode, -1)]
+        if gui:
+            preview = ("preview", width, height, "draw", 0)
+        else:
+            scale = min(1.0, PREVIEW_MAX_DIM / max(width, height))
+            preview = (
+                "preview",
+                max(1, round(width * scale)),
+                max(1, round(height * scale)),
+                "ray",
+                0,
+            )
+        stages = [
+            preview,
+            ("full", width, height, mode, 0),
+            ("antialiased", width, height, mode, 2),
+        ]
+        # Drop stages identical to the one before (e.g. draw preview == full)
+        return [s for i, s in enumerate(stages) if i == 0 or s[1:] != stages[i - 1][1:]]
+
+    def _render_stage(self, path, width, height, mode, antialias):
+        """Render one image and atomically move it to path.
+
+        Uses draw/ray followed by cmd.png(path) WITHOUT dimensions: passing
+        width/height to cmd.png corrupts the view matrix over repeated
+        reinitialize/fetch/png cycles, while ray/draw render off-screen.
+        """
+        start = time.perf_counter()
+        root, ext = os.path.splitext(path)
+        partial = f"{root}.partial{ext or '.png'}"
+        # The viewport shows changes made in a batch only after an update
+        # (ray tracing always builds what it needs)
+        resume = mode == "draw" and bool(self.batches)
+        if resume:
+            cmd.set("suspend_updates", 0)
+        try:
+            if mode == "draw":
+                cmd.draw(width, height, antialias=antialias)
+            else:
+                cmd.ray(width, height, antialias=antialias)
+            cmd.png(partial)
+        finally:
+            if resume:
+                cmd.set("suspend_updates", 1)
+        # cmd.png can complete asynchronously in GUI sessions
+        deadline = time.time() + 10.0
+        while not os.path.exists(partial) and time.time() < deadline:
+            time.sleep(0.01)
+        os.replace(partial, path)
+        return time.perf_counter() - start
+
+    def _coords(self, selection, state):
+        """Coordinates of a selection and a digest that changes with them."""
+        coords = cmd.get_coords(selection, state)
+        if coords is None or not len(coords):
+            raise ValueError(f"No atoms in selection: {selection}")
+        coords = numpy.ascontiguousarray(coords, dtype=numpy.float32)
+        return coords, (len(coords), zlib.crc32(coords))
+
+    def _index(self, selection, state, timings):
+        """Spatial index over a selection, rebuilt only when its
+        coordinates (or atom count) have changed since it was cached."""
+        start = time.perf_counter()
+        coords, digest = self._coords(selection, state)
+        key = (selection, state)
+        index = self.indexes.get(key)
+        if index is not None and index.digest == digest:
+            self.indexes.move_to_end(key)
+            timings["index_ms"] = (time.perf_counter() - start) * 1000
+            return index
+        atoms = []
+        cmd.iterate(
+            selection,
+            "atoms.append((model, index, chain, resi, resn, name))",
+            space={"atoms": atoms},
+        )
+        index = _SpatialIndex(coords, atoms, digest)
+        self.indexes[key] = index
+        while len(self.indexes) > INDEX_CACHE_SIZE:
+            self.indexes.popitem(last=False)
+        timings["index_build_ms"] = (time.perf_counter() - start) * 1000
+        return index
+
+    def _spatial_command(self, command, timings):
+        """Neighbourhood queries of "queries" (selections) against a cached
+        index of "target" atoms.
+
+        op "within" returns the target atoms within radius of each query,
+        "nearest" the k nearest target atoms to each query atom, and
+        "residues" the target residues with an atom within radius. Atom
+        results come back as arrays: per-query rows are delimited by
+        "offsets", atoms are identified by "model" (into "models") and
+        PyMOL "index".
+        """
+        if numpy is None:
+            return {"status": "error", "error": "Spatial queries need NumPy"}
+        op = command.get("op", "within")
+        state = int(command.get("state", 1))
+        radius = float(command.get("radius", 5.0))
+        queries = command.get("queries") or []
+        if op not in ("within", "nearest", "residues"):
+            return {"status": "error", "error": f"Unknown spatial query: {op}"}
+        if not queries:
+            return {"status": "error", "error": "No query selections provided"}
+        try:
+            index = self._index(command.get("target", "all"), state, timings)
+            start = time.perf_counter()
+            results = [
+                self._spatial_query(index, op, query, state, radius, command)
+                for query in queries
+            ]
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
         except Exception as e:
             return {"status": "error", "error": str(e)}
+        if op == "residues":
+            return {"status": "success", "residues": results}
+
+        atoms = numpy.concatenate([atoms for atoms, _ in results])
+        distances = numpy.concatenate([d for _, d in results])
+        rows = [len(atoms) for atoms, _ in results]
+        valid = atoms >= 0
+        safe = numpy.where(valid, atoms, 0)
+        specs, blob = _pack_arrays(
+            {
+                "offsets": numpy.concatenate([[0], numpy.cumsum(rows)]).astype(
+                    numpy.int64
+                ),
+                "model": numpy.where(valid, index.atom_model[safe], -1).astype(
+                    numpy.int16
+                ),
+                "index": numpy.where(valid, index.atom_index[safe], -1),
+                "distance": distances.astype(numpy.float32),
+            }
+        )
+        return {
+            "status": "success",
+            "models": index.models,
+            "arrays": specs,
+            "_blob": blob,
+        }
+
+    def _spatial_query(self, index, op, query, state, radius, command):
+        points, _ = self._coords(query, state)
+        if op == "nearest":
+            atoms, distances = index.nearest(points, int(command.get("k", 1)))
+            return atoms, distances
+        _, atoms, distances = index.pairs(points, radius)
+        # Closest distance per target atom, sorted by atom
+        order = numpy.lexsort((distances, atoms))
+        atoms, distances = atoms[order], distances[order]
+        first = numpy.ones(len(atoms), dtype=bool)
+        first[1:] = atoms[1:] != atoms[:-1]
+        atoms, distances = atoms[first], distances[first]
+        if op == "within":
+            return atoms, distances
+        residues = {}
+        for atom, distance in zip(atoms.tolist(), distances.tolist()):
+            model, _, chain, resi, resn, _ = index.atoms[atom]
+            key = (model, chain, resi, resn)
+            residues[key] = min(distance, residues.get(key, distance))
+        return [
+            {
+                "model": model,
+                "chain": chain,
+                "resi": resi,
+                "resn": resn,
+                "distance": distance,
+            }
+            for (model, chain, resi, resn), distance in residues.items()
+        ]
+
+    def _cached_analysis(self, key, compute, timings):
+        """Return compute() for key, reusing the result while key (which
+        includes the inputs' coordinate digests) is unchanged."""
+        if key in self.analysis_cache:
+            self.analysis_cache.move_to_end(key)
+            timings["cache_hit"] = 1
+            return self.analysis_cache[key]
+        result = compute()
+        self.analysis_cache[key] = result
+        while len(self.analysis_cache) > ANALYSIS_CACHE_SIZE:
+            self.analysis_cache.popitem(last=False)
+        return result
+
+    def _interface_command(self, command, timings):
+        """Residue contacts between "selection1" and "selection2".
+
+        Returns the interface residues of each side, residue-residue
+        contact counts and minimum distances (rows: residues1, columns:
+        residues2) as arrays, and, with area=True, the buried solvent
+        accessible area. Results are cached until either side moves.
+        """
+        if numpy is None:
+            return {"status": "error", "error": "Interface analysis needs NumPy"}
+        selection1 = command.get("selection1")
+        selection2 = command.get("selection2")
+        if not selection1 or not selection2:
+            return {"status": "error", "error": "Need selection1 and selection2"}
+        state = int(command.get("state", 1))
+        cutoff = float(command.get("cutoff", 4.5))
+        area = bool(command.get("area", True))
+        try:
+            index1 = self._index(selection1, state, timings)
+            index2 = self._index(selection2, state, timings)
+            start = time.perf_counter()
+            key = (
+                "interface",
+                index1.digest,
+                index2.digest,
+                selection1,
+                selection2,
+                state,
+                cutoff,
+                area,
+            )
+            result = self._cached_analysis(
+                key,
+                lambda: self._interface(
+                    index1, index2, selection1, selection2, state, cutoff, area
+                ),
+                timings,
+            )
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        specs, blob = _pack_arrays(result["arrays"])
+        response = {k: v for k, v in result.items() if k != "arrays"}
+        return dict(response, status="success", arrays=specs, _blob=blob)
+
+    def _interface(self, index1, index2, selection1, selection2, state, cutoff, area):
+        residues1, codes1 = index1.residues()
+        residues2, codes2 = index2.residues()
+        atoms1, atoms2, distance = index2.pairs(index1.coords, cutoff)
+        res1, res2 = codes1[atoms1], codes2[atoms2]
+        rows, row_of = numpy.unique(res1, return_inverse=True)
+        cols, col_of = numpy.unique(res2, return_inverse=True)
+        counts = numpy.zeros((len(rows), len(cols)), dtype=numpy.int32)
+        numpy.add.at(counts, (row_of, col_of), 1)
+        min_distance = numpy.full(counts.shape, numpy.inf, dtype=numpy.float32)
+        numpy.minimum.at(min_distance, (row_of, col_of), distance)
+
+        def describe(residues, codes):
+            return [
+                dict(zip(("model", "chain", "resi", "resn"), residues[code]))
+                for code in codes.tolist()
+            ]
+
+        result = {
+            "residues1": describe(residues1, rows),
+            "residues2": describe(residues2, cols),
+            "atom_contacts": int(len(atoms1)),
+            "arrays": {"counts": counts, "min_distance": min_distance},
+        }
+        if area:
+            result.update(self._buried_area(selection1, selection2, state))
+        return result
+
+    def _buried_area(self, selection1, selection2, state):
+        """Solvent accessible area buried by the interface, computed on
+        copies of the atoms near it (boundary effects cancel out)."""
+        near = AREA_NEIGHBOURHOOD
+        # Fix both atom sets before any copies exist to match them
+        cmd.select("_cm_near1", f"({selection1}) within {near} of ({selection2})")
+        cmd.select("_cm_near2", f"({selection2}) within {near} of ({selection1})")
+        parts = {
+            "_cm_part1": "_cm_near1",
+            "_cm_part2": "_cm_near2",
+            "_cm_complex": "_cm_near1 or _cm_near2",
+        }
+        saved = {name: cmd.get(name) for name in ("dot_solvent", "dot_density")}
+        areas = {}
+        try:
+            cmd.set("dot_solvent", 1)
+            cmd.set("dot_density", 2)
+            for name, selection in parts.items():
+                if not cmd.count_atoms(selection):
+                    areas[name] = 0.0
+                    continue
+                cmd.create(name, selection, state, 1, zoom=0)
+                areas[name] = cmd.get_area(name, 1)
+        finally:
+            for name in list(parts) + ["_cm_near1", "_cm_near2"]:
+                cmd.delete(name)
+            for name, value in saved.items():
+                cmd.set(name, value)
+        return {
+            "buried_area": areas["_cm_part1"]
+            + areas["_cm_part2"]
+            - areas["_cm_complex"],
+            "sasa1": areas["_cm_part1"],
+            "sasa2": areas["_cm_part2"],
+        }
+
+    def _ensemble_command(self, command, timings):
+        """Statistics over all states of "selection", from one
+        (states, atoms, 3) array.
+
+        Each state is superposed on the "reference" state (1-based) unless
+        fit=False. Returns per-state "rmsd" to the reference and per-atom
+        "rmsf" about the mean structure as arrays, with atoms identified by
+        "model" (into "models") and "index". With "cluster" (an RMSD cutoff
+        in Angstrom) also the pairwise RMSD matrix, a cluster label per
+        state and each cluster's central state ("centers", 1-based).
+        b_factors=True writes the RMSF to the atoms' B-factors.
+        """
+        if numpy is None:
+            return {"status": "error", "error": "Ensemble analysis needs NumPy"}
+        selection = command.get("selection")
+        if not selection:
+            return {"status": "error", "error": "No selection provided"}
+        reference = int(command.get("reference", 1))
+        fit = bool(command.get("fit", True))
+        cutoff = command.get("cluster")
+        try:
+            start = time.perf_counter()
+            states = cmd.count_states(selection)
+            atoms = []
+            cmd.iterate(
+                selection, "atoms.append((model, index))", space={"atoms": atoms}
+            )
+            coords = cmd.get_coords(selection, 0)
+            if not atoms or coords is None:
+                raise ValueError(f"No atoms in selection: {selection}")
+            if len(coords) != states * len(atoms):
+                raise ValueError(
+                    "Every state must have the same atoms "
+                    f"({len(coords)} coordinates for {states} states of "
+                    f"{len(atoms)} atoms)"
+                )
+            if not 1 <= reference <= states:
+                raise ValueError(f"Reference state {reference} not in 1-{states}")
+            coords = numpy.ascontiguousarray(coords, dtype=numpy.float32).reshape(
+                states, len(atoms), 3
+            )
+            timings["coords_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            key = (
+                "ensemble",
+                coords.shape,
+                zlib.crc32(coords),
+                reference,
+                fit,
+                cutoff,
+            )
+            result = self._cached_analysis(
+                key, lambda: self._ensemble(coords, reference, fit, cutoff), timings
+            )
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+            if command.get("b_factors"):
+                self.scene_serial += 1
+                cmd.alter(
+                    selection,
+                    "b = next(values)",
+                    space={"values": iter(result["rmsf"].tolist()), "next": next},
+                )
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        models = sorted({model for model, _ in atoms})
+        model_ids = {model: i for i, model in enumerate(models)}
+        arrays = {
+            "model": numpy.array(
+                [model_ids[model] for model, _ in atoms], dtype=numpy.int16
+            ),
+            "index": numpy.array([index for _, index in atoms], dtype=numpy.int32),
+            "rmsd": result["rmsd"],
+            "rmsf": result["rmsf"],
+        }
+        response = {"states": states, "atoms": len(atoms), "models": models}
+        if cutoff is not None:
+            arrays.update(pairwise=result["pairwise"], clusters=result["clusters"])
+            response["centers"] = result["centers"]
+        specs, blob = _pack_arrays(arrays)
+        return dict(response, status="success", arrays=specs, _blob=blob)
+
+    def _ensemble(self, coords, reference, fit, cutoff):
+        if fit:
+            coords = _superpose(coords, coords[reference - 1])
+        deviation = coords - coords[reference - 1]
+        rmsd = numpy.sqrt((deviation**2).sum(axis=2).mean(axis=1))
+        fluctuation = coords - coords.mean(axis=0)
+        rmsf = numpy.sqrt((fluctuation**2).sum(axis=2).mean(axis=0))
+        result = {
+            "rmsd": rmsd.astype(numpy.float32),
+            "rmsf": rmsf.astype(numpy.float32),
+        }
+        if cutoff is not None:
+            pairwise = _pairwise_rmsd(coords, fit)
+            labels, centers = _cluster_states(pairwise, float(cutoff))
+            result.update(
+                pairwise=pairwise,
+                clusters=labels,
+                centers=[center + 1 for center in centers],
+            )
+        return result
+
+    def _upload_command(self, command, timings):
+        """Load structure files sent as the blob with cmd.load_raw.
+
+        "files" lists {"name", "format", "size", "state", "compression"} in
+        blob order; compression is "gzip" or a protocol codec name.
+        """
+        files = command.get("files") or []
+        blob = command.get("_blob") or b""
+        if not files:
+            return {"status": "error", "error": "No files provided"}
+        if sum(int(f.get("size", 0)) for f in files) != len(blob):
+            return {"status": "error", "error": "File sizes do not match the data"}
+        view = memoryview(blob)
+        offset = 0
+        loaded = []
+        start = time.perf_counter()
+        self.scene_serial += 1
+        try:
+            for entry in files:
+                size = int(entry["size"])
+                data = view[offset : offset + size]
+                offset += size
+                compression = entry.get("compression")
+                if compression == "gzip":
+                    data = gzip.decompress(data)
+                elif compression:
+                    if compression not in CODECS:
+                        raise ValueError(f"Codec {compression} not available")
+                    data = CODECS[compression][1](bytes(data))
+                name = entry["name"]
+                cmd.load_raw(
+                    bytes(data), entry.get("format", "pdb"), name, entry.get("state", 0)
+                )
+                loaded.append(
+                    {
+                        "name": name,
+                        "atoms": cmd.count_atoms(name),
+                        "states": cmd.count_states(name),
+                    }
+                )
+        except Exception as e:
+            return {"status": "error", "error": str(e), "loaded": loaded}
+        finally:
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+        return {"status": "success", "loaded": loaded}
+
+    def _coordsets_command(self, command, timings):
+        """Load float32 (frames, atoms, 3) coordinates from the blob as
+        states of an existing object, appending unless "state" is given."""
+        if numpy is None:
+            return {"status": "error", "error": "Coordinate uploads need NumPy"}
+        name = command.get("object")
+        n_atoms = int(command.get("atoms", 0))
+        blob = command.get("_blob")
+        if not name or not n_atoms or not blob:
+            return {"status": "error", "error": "Need object, atoms and coordinates"}
+        if len(blob) % (n_atoms * 12):
+            return {"status": "error", "error": "Coordinate data size mismatch"}
+        coords = numpy.frombuffer(blob, dtype="<f4").reshape(-1, n_atoms, 3)
+        state = int(command.get("state", 0))
+        start = time.perf_counter()
+        self.scene_serial += 1
+        try:
+            for i, frame in enumerate(coords):
+                cmd.load_coordset(frame, name, state + i if state else 0)
+            states = cmd.count_states(name)
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        finally:
+            timings["exec_ms"] = (time.perf_counter() - start) * 1000
+        return {"status": "success", "frames": len(coords), "states": states}
+
+    def _checkpoint_command(self, command, timings):
+        """Return the pickled, compressed session as a blob.
+
+        Skipped (unchanged=True) when no code that may change the scene has
+        run since the serial the client passes as "since". With "names",
+        only those objects are stored. With "surfaces", computed surfaces
+        are stored in the session (PyMOL's cache), so loading it does not
+        compute them again.
+        """
+        serial = self.scene_serial
+        if command.get("since") == serial:
+            return {"status": "success", "unchanged": True, "serial": serial}
+        names = " ".join(command.get("names") or ())
+        try:
+            start = time.perf_counter()
+            if command.get("surfaces"):
+                mode = int(cmd.get("cache_mode"))
+                try:
+                    # Surfaces are stored as they are computed, so compute
+                    # them again with caching on
+                    if cmd.count_atoms("rep surface"):
+                        cmd.cache("optimize")
+                    session = cmd.get_session(names)
+                finally:
+                    cmd.set("cache_mode", mode)
+                    if not mode:
+                        # The session keeps the surfaces; PyMOL need not
+                        cmd.cache("clear")
+            else:
+                session = cmd.get_session(names)
+            data = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+            timings["snapshot_ms"] = (time.perf_counter() - start) * 1000
+            codec = next(c for c in ("zstd", "lz4", "zlib") if c in CODECS)
+            start = time.perf_counter()
+            blob = CODECS[codec][0](data)
+            timings["pack_ms"] = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        return {
+            "status": "success",
+            "serial": serial,
+            "codec": codec,
+            "bytes": len(data),
+            "_blob": blob,
+        }
+
+    def _restore_command(self, command, timings):
+        """Replace the scene with a session blob from _checkpoint_command,
+        or with "partial", add its objects (and view) to the scene."""
+        blob = command.get("_blob")
+        codec = command.get("codec", "zlib")
+        if not blob:
+            return {"status": "error", "error": "No checkpoint provided"}
+        if codec not in CODECS:
+            return {"status": "error", "error": f"Codec {codec} not available"}
+        try:
+            start = time.perf_counter()
+            session = pickle.loads(CODECS[codec][1](bytes(blob)))
+            partial = 1 if command.get("partial") else 0
+            mode = None
+            if session.get("cache"):
+                # set_session loads stored surfaces only after building the
+                # objects, which computes them again; load them first
+                _rekey_cache(session["cache"])
+                cmd._pymol._cache = session["cache"]
+                if partial:
+                    # Settings are not loaded, cache_mode included; the
+                    # surfaces should be read all the same
+                    mode = int(cmd.get("cache_mode"))
+                    cmd.set("cache_mode", max(mode, 1))
+            try:
+                cmd.set_session(session, partial=partial)
+            finally:
+                if mode is not None:
+                    cmd.set("cache_mode", mode)
+            timings["restore_ms"] = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        self.scene_serial += 1
+        return {"status": "success", "serial": self.scene_serial}
+
+    def _stats_command(self, command, timings):
+        """Return the raw timing samples collected per command kind."""
+        # Connection threads may add kinds (handshakes) meanwhile
+        samples = {kind: list(window) for kind, window in list(self.stats.items())}
+        if command.get("reset"):
+            self.stats.clear()
+        return {
+            "status": "success",
+            "uptime_s": time.time() - self.started_at,
+            "samples": samples,
+        }
 
     def _cleanup(self):
-        if self.client:
+        for client in list(self.clients):
             try:
-                self.client.close()
+                client.close()
             except:
                 pass
         if self.socket:
@@ -131,13 +2517,27 @@ class SocketServer:
             except:
                 pass
         self.socket = None
-        self.client = None
+        self.clients.clear()
         self.running = False
 
     def stop(self):
         self.running = False
+        # Wake the threads from accept()/recv()/wait() rather than waiting
+        # for their timeouts to expire
+        for sock in [self.socket, *self.clients]:
+            if sock:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        with self._queue_cond:
+            self._queue_cond.notify_all()
         if self.thread:
             self.thread.join(2.0)
+        if self.executor:
+            self.executor.join(2.0)
+        if self.encoder:
+            self.encoder.shutdown(wait=False, cancel_futures=True)
         self._cleanup()
 
     @property
@@ -149,7 +2549,8 @@ def claude_status():
     """Print Claude socket listener status."""
     global _server
     if _server and _server.is_running:
-        connected = "connected" if _server.client else "waiting"
+        clients = len(_server.clients)
+        connected = f"{clients} connected" if clients else "waiting"
         print(f"Claude socket listener: running on port {_port} ({connected})")
     else:
         print("Claude socket listener: not running")
@@ -166,21 +2567,58 @@ def claude_stop():
         print("Claude socket listener was not running")
 
 
-def claude_start(port=9880):
+def claude_start(port=None):
     """Start the Claude socket listener."""
     global _server, _port
     if _server and _server.is_running:
         print(f"Claude socket listener already running on port {_port}")
         return
-    _port = port
-    _server = SocketServer(port=port)
+    if port is not None:
+        _port = int(port)
+    _server = SocketServer(port=_port)
     _server.start()
 
 
+def claude_profile(action="print", top=30):
+    """
+    Profile code run through the Claude socket listener.
+
+    claude_profile on       # profile every execution
+    claude_profile off      # only executions that ask for it
+    claude_profile clear    # drop the collected profiles
+    claude_profile [print [, top]]
+    """
+    if not _server:
+        print("Claude socket listener: not running")
+        return
+    if action in ("on", "off"):
+        _server.profile_all = action == "on"
+        print(f"Claude profiling {action}")
+    elif action == "clear":
+        _server.profiles.clear()
+    elif action == "print":
+        report = _server.profile_report(top=int(top))
+        for entry in report["keys"]:
+            print(
+                f"{entry['runs']:>5} runs {entry['total_ms']:>10.1f} ms  "
+                f"{entry['key']}  {entry['label']}"
+            )
+        for row in report["functions"]:
+            print(
+                f"{row['calls']:>8} {row['tottime_ms']:>10.1f} "
+                f"{row['cumtime_ms']:>10.1f}  {row['function']}"
+            )
+    else:
+        print(f"Unknown action: {action} (on, off, clear, print)")
+
+
 # Register commands with PyMOL
 cmd.extend("claude_status", claude_status)
 cmd.extend("claude_stop", claude_stop)
 cmd.extend("claude_start", claude_start)
+cmd.extend("claude_profile", claude_profile)
 
-# Auto-start on load
-claude_start()
+# Auto-start on load (CLAUDEMOL_NO_AUTOSTART=1 lets tests and benchmarks
+# import the server without binding the default port)
+if not os.environ.get("CLAUDEMOL_NO_AUTOSTART"):
+    claude_start()
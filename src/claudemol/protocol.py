@@ -0,0 +1,238 @@
+"""
+Wire Protocol
+
+Client side of the framed protocol spoken by the socket plugin.
+
+A connection starts in legacy mode: one bare UTF-8 JSON object per request
+and per response. The client then sends a ``hello`` request listing the
+compression codecs it supports; a plugin that understands framing answers
+with the codec it picked and both sides switch to frames:
+
+    +------+---------+-------+----------+----------+----------+
+    | "CM" | version | codec | json_len | blob_len | wire_len |
+    |  2B  |   1B    |  1B   |    4B    |    4B    |    4B    |
+    +------+---------+-------+----------+----------+----------+
+    | wire_len bytes: (json + blob), compressed if codec != 0  |
+    +----------------------------------------------------------+
+
+``blob`` carries raw binary data (images, coordinates, structure files)
+next to the JSON message so it never has to be escaped into a string.
+
+Same-host shared memory: when client and plugin can both see a shared
+memory directory (``/dev/shm``, checked in the hello with a probe file),
+blobs of ``SHM_THRESHOLD`` bytes or more skip the socket. The sender writes
+the blob to a new file (a "segment") there and sends a frame with no blob
+and ``"_shm": {"name", "size"}`` in the message. Ownership:
+
+- the sender creates the segment, readable only by its user;
+- the receiver maps it and unlinks it as soon as the frame arrives; the
+  mapping, which is the received blob, lives until it is garbage collected;
+- the sender unlinks whatever is left after the exchange, so a receiver
+  that never reads the frame leaks nothing; the plugin does this when the
+  next request arrives or the connection closes, and also removes the
+  segments of dead processes when it starts.
+
+The plugin mirrors this module; it must stay self-contained because it runs
+inside PyMOL's own interpreter.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import uuid
+import zlib
+
+PROTOCOL_VERSION = 1
+FRAME_MAGIC = b"CM"
+FRAME_HEADER = struct.Struct(">2sBBIII")
+COMPRESS_THRESHOLD = 64 * 1024
+
+# Skip compression when it saves less than this fraction (e.g. PNG payloads)
+MIN_COMPRESSION_GAIN = 0.1
+
+# Shared memory segments: where they live, the smallest blob sent as one
+# and the names they may have
+SHM_DIR = os.environ.get("CLAUDEMOL_SHM_DIR", "/dev/shm")
+SHM_THRESHOLD = 1024 * 1024
+SHM_NAME = re.compile(r"claudemol-(\d+)-[0-9a-f]{32}")
+
+CODEC_IDS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+
+
+def _load_codecs():
+    """Return {name: (compress, decompress)} for every importable codec."""
+    codecs = {"zlib": (lambda data: zlib.compress(data, 1), zlib.decompress)}
+    try:
+        from compression import zstd  # Python 3.14+
+
+        codecs["zstd"] = (lambda data: zstd.compress(data, 3), zstd.decompress)
+    except ImportError:
+        try:
+            import zstandard
+
+            codecs["zstd"] = (
+                lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                lambda data: zstandard.ZstdDecompressor().decompress(data),
+            )
+        except ImportError:
+            pass
+    try:
+        import lz4.frame
+
+        codecs["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+    except ImportError:
+        pass
+    return codecs
+
+
+CODECS = _load_codecs()
+
+
+def available_codecs():
+    """Names of the codecs usable in this interpreter, best first."""
+    return [name for name in ("zstd", "lz4", "zlib") if name in CODECS]
+
+
+def shm_available(directory=SHM_DIR):
+    """Whether segments can be created in directory."""
+    return os.path.isdir(directory) and os.access(directory, os.W_OK)
+
+
+def shm_write(directory, data):
+    """Write data to a new segment in directory and return its name."""
+    name = f"claudemol-{os.getpid()}-{uuid.uuid4().hex}"
+    fd = os.open(
+        os.path.join(directory, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600
+    )
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return name
+
+
+def shm_read(directory, name, size):
+    """
+    Map a segment read-only and unlink it.
+
+    Returns:
+        The data as an mmap (or b"" if empty), which stays valid after the
+        unlink until it is garbage collected
+    """
+    if not SHM_NAME.fullmatch(name):
+        raise ValueError(f"Invalid shared memory segment: {name}")
+    path = os.path.join(directory, name)
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != size:
+                raise ValueError("Shared memory segment size mismatch")
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+    finally:
+        shm_unlink(directory, name)
+
+
+def shm_unlink(directory, name):
+    """Remove a segment if it is still there."""
+    try:
+        os.unlink(os.path.join(directory, name))
+    except FileNotFoundError:
+        pass
+
+
+def encode_frame(
+    message, blob=b"", codec=None, threshold=COMPRESS_THRESHOLD, shm_dir=None
+):
+    """
+    Encode a message dict (and optional binary blob) as one frame.
+
+    With shm_dir, a blob of SHM_THRESHOLD bytes or more goes into a shared
+    memory segment instead of the frame.
+
+    Returns:
+        (frame_bytes, info) where info has raw/wire sizes, compress_ms and
+        "shm", the name of the segment the caller must unlink after the
+        exchange (or None)
+    """
+    segment = None
+    shm_bytes = 0
+    if shm_dir and blob and len(blob) >= SHM_THRESHOLD:
+        segment = shm_write(shm_dir, blob)
+        shm_bytes = len(blob)
+        message = dict(message, _shm={"name": segment, "size": shm_bytes})
+        blob = b""
+    body = json.dumps(message).encode("utf-8")
+    blob = bytes(blob or b"")
+    raw_len = len(body) + len(blob)
+    payload = body + blob
+    codec_id = 0
+    compress_ms = 0.0
+    if codec and codec != "none" and raw_len >= threshold:
+        start = time.perf_counter()
+        compressed = CODECS[codec][0](payload)
+        compress_ms = (time.perf_counter() - start) * 1000
+        if len(compressed) <= raw_len * (1 - MIN_COMPRESSION_GAIN):
+            payload = compressed
+            codec_id = CODEC_IDS[codec]
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC, PROTOCOL_VERSION, codec_id, len(body), len(blob), len(payload)
+    )
+    info = {
+        "bytes": raw_len + shm_bytes,
+        "wire_bytes": FRAME_HEADER.size + len(payload),
+        "compress_ms": compress_ms,
+        "codec": CODEC_NAMES[codec_id],
+        "shm": segment,
+    }
+    return header + payload, info
+
+
+def decode_header(header):
+    """Unpack a frame header into (codec_id, json_len, blob_len, wire_len)."""
+    magic, version, codec_id, json_len, blob_len, wire_len = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a claudemol frame")
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    return codec_id, json_len, blob_len, wire_len
+
+
+def decode_payload(codec_id, json_len, blob_len, payload):
+    """Decompress a frame payload and split it into (message, blob)."""
+    if codec_id:
+        name = CODEC_NAMES.get(codec_id)
+        if name not in CODECS:
+            raise ValueError(f"Codec {name or codec_id} not available")
+        payload = CODECS[name][1](bytes(payload))
+    if len(payload) != json_len + blob_len:
+        raise ValueError("Frame length mismatch")
+    view = memoryview(payload)
+    message = json.loads(bytes(view[:json_len]).decode("utf-8"))
+    blob = bytes(view[json_len:]) if blob_len else b""
+    return message, blob
+
+
+def unpack_arrays(specs, blob):
+    """
+    Rebuild the NumPy arrays a handler packed into a response blob.
+
+    Args:
+        specs: The response's "arrays" list of {name, dtype, shape, offset}
+        blob: The response's "_blob"
+
+    Returns:
+        {name: ndarray}
+    """
+    import numpy
+
+    arrays = {}
+    for spec in specs:
+        dtype = numpy.dtype(spec["dtype"])
+        count = int(numpy.prod(spec["shape"], dtype=numpy.int64))
+        if count:
+            array = numpy.frombuffer(blob, dtype, count, spec["offset"])
+        else:
+            array = numpy.empty(0, dtype)
+        arrays[spec["name"]] = array.reshape(spec["shape"])
+    return arrays
@@ -0,0 +1,263 @@
+"""
+Manifest-driven batch rendering.
+
+Renders many scenes described in a JSONL (or YAML) manifest, one scene per
+line/entry:
+
+    {"structure": "1ubq.pdb", "recipe": "cmd.show_as('cartoon', obj)",
+     "view": "obj", "width": 800, "height": 600, "ray": true,
+     "output": "figures/1ubq_cartoon.png"}
+
+Fields:
+    structure  Path to a structure file (relative to the manifest)
+    output     Image path to write (relative to the manifest)
+    recipe     Python code, or a list of lines, run inside PyMOL with ``obj``
+               bound to the scene's object name (optional)
+    view       18-float view matrix, or a selection to orient on
+               (optional, default: orient on the whole object)
+    width, height, ray   Image size and ray tracing (default 800x600, true)
+
+Each structure is loaded once per PyMOL instance and copied for every scene
+that uses it, so only the recipe travels per image. Scenes are spread over
+one or more PyMOL instances, and a state file records a hash of every
+rendered scene so re-runs skip outputs that are already up to date.
+
+Usage:
+    claudemol render scenes.jsonl
+    claudemol render scenes.yaml --workers 4
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from claudemol.connection import DEFAULT_PORT
+from claudemol.session import PyMOLSession
+from claudemol.sessioncache import file_digest
+
+# Bump when the generated scene code changes in a way that alters images
+RECIPE_VERSION = 1
+
+SCENE_DEFAULTS = {"recipe": "", "view": None, "width": 800, "height": 600, "ray": True}
+SCENE_OBJECT = "scene"
+
+
+def load_manifest(path):
+    """
+    Read scenes from a .jsonl, .json or .yaml/.yml manifest.
+
+    Relative structure and output paths are resolved against the manifest's
+    directory.
+
+    Returns:
+        List of scene dicts with defaults filled in
+    """
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError(
+                "YAML manifests need PyYAML: pip install pyyaml "
+                "(or use a .jsonl manifest)"
+            )
+        entries = yaml.safe_load(text) or []
+    elif path.suffix == ".json":
+        entries = json.loads(text)
+    else:
+        entries = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: invalid JSON: {e}")
+    if isinstance(entries, dict):
+        entries = entries.get("scenes", [])
+
+    scenes = []
+    for i, entry in enumerate(entries, 1):
+        missing = [key for key in ("structure", "output") if not entry.get(key)]
+        if missing:
+            raise ValueError(f"{path}: scene {i} is missing {', '.join(missing)}")
+        scene = dict(SCENE_DEFAULTS, **entry)
+        scene["structure"] = str((path.parent / scene["structure"]).resolve())
+        scene["output"] = str((path.parent / scene["output"]).resolve())
+        if isinstance(scene["recipe"], list):
+            scene["recipe"] = "\n".join(scene["recipe"])
+        scenes.append(scene)
+    return scenes
+
+
+def scene_hash(scene):
+    """Hash of everything that determines a scene's image."""
+    key = {
+        "version": RECIPE_VERSION,
+        "structure": file_digest(scene["structure"]),
+        **{k: scene[k] for k in ("recipe", "view", "width", "height", "ray")},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def structure_object(scene):
+    """Name of the (hidden) object holding a scene's loaded structure."""
+    return "src_" + file_digest(scene["structure"])[:12]
+
+
+def scene_code(scene):
+    """Python code that sets up and renders one scene inside PyMOL."""
+    source = structure_object(scene)
+    view = scene["view"]
+    if isinstance(view, (list, tuple)):
+        view_code = f"cmd.set_view({list(map(float, view))!r})"
+    elif view:
+        view_code = f"cmd.orient({view!r})"
+    else:
+        view_code = "cmd.orient(obj)"
+    render_code = (
+        f"cmd.ray({int(scene['width'])}, {int(scene['height'])})"
+        if scene["ray"]
+        else f"cmd.draw({int(scene['width'])}, {int(scene['height'])})"
+    )
+    return f"""
+if {source!r} not in cmd.get_names("objects"):
+    cmd.load({scene["structure"]!r}, {source!r})
+cmd.delete({SCENE_OBJECT!r})
+cmd.reinitialize("settings")
+cmd.create({SCENE_OBJECT!r}, {source!r})
+cmd.disable("all")
+cmd.enable({SCENE_OBJECT!r})
+obj = {SCENE_OBJECT!r}
+{scene["recipe"]}
+{view_code}
+{render_code}
+cmd.png({scene["output"]!r})
+"""
+
+
+class RenderState:
+    """Hashes of rendered outputs, persisted as JSON for resumable runs."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            self.done = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError):
+            self.done = {}
+
+    def is_current(self, scene, digest):
+        return (
+            os.path.exists(scene["output"]) and self.done.get(scene["output"]) == digest
+        )
+
+    def mark(self, scene, digest):
+        with self._lock:
+            self.done[scene["output"]] = digest
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(self.done, indent=2, sort_keys=True) + "\n")
+            os.replace(tmp, self.path)
+
+
+def _render_worker(port, groups, state, results, log):
+    """Render scene groups from a shared queue on one PyMOL instance."""
+    # Checkpoints of render scenes would never be used
+    session = PyMOLSession(port=port, checkpoint_interval=None)
+    try:
+        session.start()
+    except Exception as e:
+        log(f"[{port}] cannot start PyMOL: {e}")
+        # Leave the work to other workers
+        return
+    try:
+        while True:
+            try:
+                group = groups.get_nowait()
+            except queue.Empty:
+                return
+            for scene, digest in group:
+                output = Path(scene["output"])
+                output.parent.mkdir(parents=True, exist_ok=True)
+                # A stale image must not pass for a fresh one
+                output.unlink(missing_ok=True)
+                start = time.perf_counter()
+                try:
+                    # Interactive requests from other clients go first
+                    session.execute(scene_code(scene), priority="batch")
+                    if not os.path.exists(scene["output"]):
+                        raise RuntimeError("image was not written")
+                except Exception as e:
+                    results["failed"].append((scene["output"], str(e)))
+                    log(f"[{port}] FAILED {scene['output']}: {e}")
+                    continue
+                state.mark(scene, digest)
+                results["rendered"].append(scene["output"])
+                elapsed = time.perf_counter() - start
+                log(f"[{port}] rendered {scene['output']} ({elapsed:.2f}s)")
+    finally:
+        session.stop()
+
+
+def render_manifest(
+    manifest, ports=(DEFAULT_PORT,), state_path=None, force=False, log=print
+):
+    """
+    Render every scene in a manifest.
+
+    Args:
+        manifest: Path to a .jsonl/.json/.yaml manifest
+        ports: PyMOL ports to render on; instances that are not running are
+            launched (and stopped again when done)
+        state_path: Where to keep scene hashes (default: <manifest>.state.json)
+        force: Re-render scenes even if their output is up to date
+        log: Progress callback taking one string
+
+    Returns:
+        {"rendered": [...], "skipped": [...], "failed": [(output, error), ...]}
+    """
+    scenes = load_manifest(manifest)
+    state = RenderState(state_path or f"{manifest}.state.json")
+    results = {"rendered": [], "skipped": [], "failed": []}
+
+    # Group pending scenes by structure so each is loaded on one instance
+    by_structure = defaultdict(list)
+    for scene in scenes:
+        digest = scene_hash(scene)
+        if not force and state.is_current(scene, digest):
+            results["skipped"].append(scene["output"])
+            continue
+        by_structure[scene["structure"]].append((scene, digest))
+    if results["skipped"]:
+        log(f"Skipping {len(results['skipped'])} up-to-date scene(s)")
+    if not by_structure:
+        return results
+
+    groups = queue.Queue()
+    # Largest groups first so the tail of the run stays balanced
+    for group in sorted(by_structure.values(), key=len, reverse=True):
+        groups.put(group)
+
+    workers = [
+        threading.Thread(
+            target=_render_worker, args=(port, groups, state, results, log)
+        )
+        for port in list(ports)[: groups.qsize()]
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Work left over means every worker failed to start
+    while not groups.empty():
+        for scene, _ in groups.get_nowait():
+            results["failed"].append((scene["output"], "no PyMOL instance available"))
+    return results
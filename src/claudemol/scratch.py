@@ -0,0 +1,223 @@
+"""
+Scratch Image Store
+
+Feedback images land in one scratch directory, shared by every session on
+the host. This module gives each image a unique name (its name or "view",
+a timestamp and a random suffix), keeps an index of what is there, and
+bounds the directory by total size and age, evicting the least recently
+used images first. Identical images are hard-linked so they take the space
+of one.
+
+Usage:
+    from claudemol.scratch import ScratchStore
+
+    store = ScratchStore()
+    path = store.new_path("ubq_cartoon")      # ubq_cartoon_20260101-120000_3fa2c1d4.png
+    ...                                       # PyMOL writes the image
+    store.add(path)                           # index, deduplicate, evict
+
+Limits default to 512 MB and 7 days, or CLAUDEMOL_SCRATCH_MAX_MB and
+CLAUDEMOL_SCRATCH_MAX_AGE_DAYS. Files are only ever replaced, never written
+in place, so a hard-linked twin is not changed when one of them is.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: the index is updated without a lock
+    fcntl = None
+
+DEFAULT_DIR = Path.home() / ".claudemol" / "scratch"
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+MAX_BYTES = int(float(os.environ.get("CLAUDEMOL_SCRATCH_MAX_MB", 512)) * 1024 * 1024)
+MAX_AGE_S = float(os.environ.get("CLAUDEMOL_SCRATCH_MAX_AGE_DAYS", 7)) * 86400
+# Files being written by PyMOL, not yet images
+TEMPORARY_MARKERS = (".partial", ".render.", ".link")
+
+
+def _digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ScratchStore:
+    """
+    A size- and age-bounded directory of images with an LRU index.
+
+    The index (``index.json``) maps file names to their "digest", "bytes",
+    "created" and "used" times. Files found in the directory without an
+    entry (older images, or ones written by other tools) are adopted with
+    their modification time as last use.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, max_bytes=MAX_BYTES, max_age_s=MAX_AGE_S):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+
+    def new_path(self, name=None, extension="png"):
+        """A path no other image has, for PyMOL to write to."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        stem = "".join(c if c.isalnum() or c in "-_" else "_" for c in name or "view")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return self.root / f"{stem}_{stamp}_{uuid.uuid4().hex[:8]}.{extension}"
+
+    def add(self, path):
+        """
+        Index an image that has landed, hard-link it to an identical one
+        already stored, then enforce the limits (never evicting it).
+
+        Returns:
+            The path, for chaining
+        """
+        path = Path(path)
+        with self._locked() as index:
+            entry = self._entry(path)
+            twin = next(
+                (
+                    name
+                    for name, other in index.items()
+                    if other["digest"] == entry["digest"]
+                    and name != path.name
+                    and (self.root / name).exists()
+                ),
+                None,
+            )
+            if twin is not None:
+                self._link(self.root / twin, path)
+            index[path.name] = entry
+            self._evict(index, keep=path.name)
+        return path
+
+    def touch(self, path):
+        """Mark an image as used now, so it is evicted later."""
+        with self._locked() as index:
+            entry = index.get(Path(path).name)
+            if entry is not None:
+                entry["used"] = time.time()
+
+    def entries(self):
+        """Index entries, least recently used first, with their "name"."""
+        with self._locked() as index:
+            self._evict(index)
+            return [
+                dict(entry, name=name)
+                for name, entry in sorted(index.items(), key=lambda e: e[1]["used"])
+            ]
+
+    def evict(self):
+        """Enforce the limits; returns the names of the images removed."""
+        with self._locked() as index:
+            return self._evict(index)
+
+    @contextmanager
+    def _locked(self):
+        """The index, locked against other processes, saved afterwards."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_NAME, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self._load()
+                yield index
+                self._save(index)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.root / INDEX_NAME) as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, index):
+        partial = self.root / f"{INDEX_NAME}.partial"
+        with open(partial, "w") as f:
+            json.dump({"version": 1, "entries": index}, f)
+        os.replace(partial, self.root / INDEX_NAME)
+
+    def _entry(self, path, used=None):
+        now = time.time()
+        return {
+            "digest": _digest(path),
+            "bytes": path.stat().st_size,
+            "created": now,
+            "used": used or now,
+        }
+
+    @staticmethod
+    def _link(source, path):
+        """Replace path with a hard link to the identical source."""
+        if os.path.samefile(source, path):
+            return
+        link = path.with_name(f"{path.name}.link")
+        try:
+            os.link(source, link)
+            os.replace(link, path)
+        except OSError:
+            # No hard links on this filesystem; keep the copy
+            if link.exists():
+                link.unlink()
+
+    def _evict(self, index, keep=None):
+        """Drop missing files, adopt unindexed ones, then remove images
+        past the age limit and least recently used ones past the size
+        limit. Returns the names removed."""
+        for name in [name for name in index if not (self.root / name).exists()]:
+            del index[name]
+        for path in self.root.iterdir():
+            name = path.name
+            if (
+                name in index
+                or name in (INDEX_NAME, LOCK_NAME)
+                or name.startswith(INDEX_NAME)
+                or any(marker in name for marker in TEMPORARY_MARKERS)
+                or not path.is_file()
+            ):
+                continue
+            index[name] = self._entry(path, used=path.stat().st_mtime)
+
+        now = time.time()
+        removed = []
+
+        def remove(name):
+            try:
+                (self.root / name).unlink()
+            except FileNotFoundError:
+                pass
+            del index[name]
+            removed.append(name)
+
+        for name in [
+            name
+            for name, entry in index.items()
+            if name != keep and now - entry["used"] > self.max_age_s
+        ]:
+            remove(name)
+
+        # Hard-linked twins share their bytes
+        sizes = {entry["digest"]: entry["bytes"] for entry in index.values()}
+        total = sum(sizes.values())
+        for name in sorted(index, key=lambda name: index[name]["used"]):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            digest = index[name]["digest"]
+            remove(name)
+            if not any(entry["digest"] == digest for entry in index.values()):
+                total -= sizes[digest]
+        return removed
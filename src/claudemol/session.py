@@ -5,22 +5,33 @@ Provides reliable session lifecycle management:
 - Launch PyMOL with plugin
 - Health checks
 - Graceful and forced termination
-- Crash detection and recovery
+- Crash detection and recovery, restoring the scene from checkpoints
 """
 
 import os
 import signal
 import subprocess
+import threading
 import time
+import uuid
 from pathlib import Path
 
+from claudemol.checkpoint import Checkpoint, CheckpointStore
 from claudemol.connection import (
     DEFAULT_HOST,
     DEFAULT_PORT,
+    ConnectionPool,
     PyMOLConnection,
     find_pymol_command,
     get_plugin_path,
 )
+from claudemol.sessioncache import SessionCache
+
+# Minimum seconds between automatic checkpoints
+CHECKPOINT_INTERVAL = 5.0
+# Automatic checkpoints wait at least this many times their own cost, so
+# snapshotting a large scene stays a small fraction of session time
+CHECKPOINT_COST_FACTOR = 20
 
 
 class PyMOLSession:
@@ -40,14 +51,54 @@ class PyMOLSession:
 
         # Clean up
         session.stop()
+
+    After a command changes the scene, ``execute`` snapshots it into
+    ``self.checkpoints`` on a background thread (at most every
+    ``checkpoint_interval`` seconds; None disables this), and ``recover``
+    loads the latest snapshot into the new PyMOL. ``last_restore`` reports
+    how long that took. Code that only reads the scene (cmd.count_atoms,
+    cmd.get_names and the like) does not count as a change.
+
+    ``memory_budget_mb`` caps PyMOL's resident memory by evicting the least
+    recently used objects, saving them to ``spill_dir`` (if given) for
+    reloading when a command names them again; see
+    ``PyMOLConnection.get_memory``.
+
+    ``execute`` and ``checkpoint`` can be called from several threads at
+    once: each thread borrows a connection of its own from ``self.pool``.
+    ``self.connection`` serves start, recovery and restores, and callers
+    using it directly must not share it across threads.
     """
 
-    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    def __init__(
+        self,
+        host=DEFAULT_HOST,
+        port=DEFAULT_PORT,
+        checkpoints=None,
+        checkpoint_interval=CHECKPOINT_INTERVAL,
+        memory_budget_mb=None,
+        spill_dir=None,
+    ):
         self.host = host
         self.port = port
         self.process = None
         self.connection = None
         self._we_launched = False  # Track if we started PyMOL
+        self.checkpoints = checkpoints if checkpoints is not None else CheckpointStore()
+        self.checkpoint_interval = checkpoint_interval
+        self.memory_budget_mb = memory_budget_mb
+        self.spill_dir = spill_dir
+        self.last_restore = None
+        self._checkpoint_serial = None
+        self._next_checkpoint = 0.0
+        self.pool = ConnectionPool(host, port)
+        # Serializes recovery across threads; _generation counts recoveries
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._checkpoint_lock = threading.RLock()
+        # Held from scheduling an automatic checkpoint until it is taken
+        self._checkpoint_pending = threading.Lock()
+        self._checkpoint_thread = None
 
     @property
     def is_running(self):
@@ -86,11 +137,13 @@ class PyMOLSession:
             True if connected successfully
         """
         self.connection = PyMOLConnection(self.host, self.port)
+        self._checkpoint_serial = None
 
         # Try connecting to existing instance first
         try:
             self.connection.connect(timeout=2.0)
             self._we_launched = False
+            self._apply_memory_budget()
             return True
         except ConnectionError:
             pass
@@ -118,11 +171,12 @@ class PyMOLSession:
                 raise RuntimeError(f"Plugin not found: {plugin_path}")
             cmd_args += ["-d", f"run {plugin_path}"]
 
-        # Launch PyMOL
+        # Launch PyMOL; the plugin reads its port from the environment
         self.process = subprocess.Popen(
             cmd_args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            env=dict(os.environ, CLAUDEMOL_PORT=str(self.port)),
         )
         self._we_launched = True
 
@@ -131,6 +185,7 @@ class PyMOLSession:
         while time.time() - start < timeout:
             try:
                 self.connection.connect(timeout=1.0)
+                self._apply_memory_budget()
                 return True
             except ConnectionError:
                 if not self.is_running:
@@ -147,6 +202,12 @@ class PyMOLSession:
         self._kill_process()
         raise TimeoutError(f"PyMOL socket not available after {timeout}s")
 
+    def _apply_memory_budget(self):
+        if self.memory_budget_mb is not None:
+            self.connection.get_memory(
+                budget_mb=self.memory_budget_mb, spill_dir=self.spill_dir or ""
+            )
+
     def stop(self, graceful_timeout=5.0):
         """
         Stop PyMOL session.
@@ -154,10 +215,12 @@ class PyMOLSession:
         Args:
             graceful_timeout: Time to wait for graceful shutdown before force kill
         """
-        # Disconnect socket
+        self.wait_for_checkpoint(graceful_timeout)
+        # Disconnect sockets
         if self.connection:
             self.connection.disconnect()
             self.connection = None
+        self.pool.clear()
 
         # Only kill process if we launched it
         if self._we_launched and self.process:
@@ -182,7 +245,7 @@ class PyMOLSession:
         self.process = None
         self._we_launched = False
 
-    def recover(self, timeout=15.0):
+    def recover(self, timeout=15.0, restore=True):
         """
         Recover from a crashed or unresponsive PyMOL.
 
@@ -190,6 +253,10 @@ class PyMOLSession:
         1. Kill any stale process
         2. Disconnect stale socket
         3. Start fresh
+        4. Restore the latest checkpoint, if any (unless restore=False)
+
+        A failed restore leaves the fresh PyMOL running and is reported in
+        ``self.last_restore["error"]``.
 
         Returns:
             True if recovery successful
@@ -198,6 +265,8 @@ class PyMOLSession:
         if self.connection:
             self.connection.disconnect()
             self.connection = None
+        self.pool.clear()
+        self._generation += 1
 
         if self._we_launched:
             self._kill_process(graceful_timeout=2.0)
@@ -209,7 +278,183 @@ class PyMOLSession:
         time.sleep(0.5)
 
         # Start fresh
-        return self.start(timeout=timeout)
+        started = self.start(timeout=timeout)
+        if restore and self.checkpoints.latest() is not None:
+            try:
+                self.restore()
+            except Exception as e:
+                self.last_restore = {"error": str(e)}
+        return started
+
+    def checkpoint(self, force=False):
+        """
+        Snapshot the current scene into ``self.checkpoints``.
+
+        Args:
+            force: Snapshot even if no code has run since the last one
+
+        Returns:
+            The new Checkpoint, or None if the scene is unchanged or the
+            plugin does not support checkpoints
+        """
+        if self.connection is None:
+            return None
+        with self._checkpoint_lock, self.pool.connection() as conn:
+            if "checkpoint" not in conn.capabilities:
+                return None
+            start = time.perf_counter()
+            result = conn.request(
+                {
+                    "type": "checkpoint",
+                    "since": None if force else self._checkpoint_serial,
+                }
+            )
+            if result.get("status") != "success":
+                raise RuntimeError(result.get("error", "Unknown error"))
+            if result.get("unchanged"):
+                return None
+            checkpoint = Checkpoint(
+                result["_blob"],
+                result["codec"],
+                serial=result["serial"],
+                raw_bytes=result.get("bytes", 0),
+            )
+            self.checkpoints.add(checkpoint)
+            self._checkpoint_serial = checkpoint.serial
+            cost = time.perf_counter() - start
+            self._next_checkpoint = time.monotonic() + max(
+                self.checkpoint_interval or 0.0, CHECKPOINT_COST_FACTOR * cost
+            )
+            return checkpoint
+
+    def restore(self, checkpoint=None):
+        """
+        Load a checkpoint (default: the latest) into PyMOL, replacing the
+        current scene.
+
+        Returns:
+            Dict with restore_ms (client round trip), server_restore_ms,
+            bytes and age_s of the checkpoint, also kept in
+            ``self.last_restore``; None if there is no checkpoint
+        """
+        checkpoint = checkpoint or self.checkpoints.latest()
+        if checkpoint is None:
+            return None
+        if not self.is_connected:
+            raise ConnectionError("Not connected to PyMOL")
+        start = time.perf_counter()
+        result = self.connection.request(
+            {"type": "restore", "codec": checkpoint.codec}, blob=checkpoint.data
+        )
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        # The scene now matches the checkpoint
+        self._checkpoint_serial = result.get("serial")
+        self.last_restore = {
+            "restore_ms": (time.perf_counter() - start) * 1000,
+            "server_restore_ms": result.get("timings", {}).get("restore_ms", 0.0),
+            "bytes": checkpoint.size,
+            "age_s": time.time() - checkpoint.created_at,
+        }
+        return self.last_restore
+
+    def prepare(self, recipe, inputs=(), cache=None):
+        """
+        Run a preparation recipe, or load the objects it made last time.
+
+        The objects a recipe creates, and the view it leaves, are cached on
+        disk under a hash of the recipe and of the contents of ``inputs``,
+        the files it reads. A later call with the same key adds them to the
+        scene instead of running the recipe. Surfaces are stored as
+        computed, so they are not computed again either. Objects already in
+        the scene are left alone and not cached, so recipes should act on
+        the objects they create, and set settings per object.
+
+        Args:
+            recipe: Python code, or a list of lines, run in PyMOL on a miss
+            inputs: Paths of the structure files the recipe loads
+            cache: SessionCache to use (default: ``~/.claudemol/sessions``)
+
+        Returns:
+            Dict with "cached" (whether the objects were loaded), "key" and
+            "ms" (time taken, including storing them on a miss)
+        """
+        cache = cache or SessionCache()
+        key = cache.key(recipe, inputs)
+        start = time.perf_counter()
+        if not self.is_connected:
+            self.recover()
+        # Not execute(): these snapshots are not of the whole scene, and its
+        # automatic checkpoint would be wasted
+        with self.pool.connection() as conn:
+            checkpoint = cache.get(key)
+            if checkpoint is not None:
+                result = conn.request(
+                    {"type": "restore", "codec": checkpoint.codec, "partial": True},
+                    blob=checkpoint.data,
+                )
+                if result.get("status") == "success":
+                    return {
+                        "cached": True,
+                        "key": key,
+                        "ms": (time.perf_counter() - start) * 1000,
+                    }
+                # Stored by a PyMOL this one cannot load; prepare it afresh
+                cache.discard(key)
+
+            if isinstance(recipe, (list, tuple)):
+                recipe = "\n".join(recipe)
+            before = set(_object_names(conn))
+            conn.execute(recipe)
+            names = [name for name in _object_names(conn) if name not in before]
+            if names and "checkpoint" in conn.capabilities:
+                result = conn.request(
+                    {"type": "checkpoint", "names": names, "surfaces": True}
+                )
+                if result.get("status") != "success":
+                    raise RuntimeError(result.get("error", "Unknown error"))
+                checkpoint = Checkpoint(
+                    result["_blob"],
+                    result["codec"],
+                    serial=result["serial"],
+                    raw_bytes=result.get("bytes", 0),
+                )
+                cache.put(key, checkpoint)
+        return {"cached": False, "key": key, "ms": (time.perf_counter() - start) * 1000}
+
+    def _maybe_checkpoint(self, conn):
+        """Start an automatic checkpoint in the background if the scene
+        changed and one is due, so the command that triggered it returns
+        without waiting for the snapshot."""
+        if self.checkpoint_interval is None:
+            return
+        serial = conn.scene_serial
+        if serial is None or serial == self._checkpoint_serial:
+            return
+        if time.monotonic() < self._next_checkpoint:
+            return
+        # One is already scheduled or being taken
+        if not self._checkpoint_pending.acquire(blocking=False):
+            return
+        self._checkpoint_thread = threading.Thread(
+            target=self._auto_checkpoint, name="claudemol-checkpoint", daemon=True
+        )
+        self._checkpoint_thread.start()
+
+    def _auto_checkpoint(self):
+        try:
+            self.checkpoint()
+        except (ConnectionError, TimeoutError, RuntimeError):
+            # A failed snapshot is retried after the next scene change
+            pass
+        finally:
+            self._checkpoint_pending.release()
+
+    def wait_for_checkpoint(self, timeout=None):
+        """Wait for an automatic checkpoint in progress, if any, to finish."""
+        thread = self._checkpoint_thread
+        if thread is not None:
+            thread.join(timeout)
 
     def _kill_processes_on_port(self):
         """Kill any processes listening on our port (Linux/macOS)."""
@@ -231,32 +476,65 @@ class PyMOLSession:
         except (subprocess.TimeoutExpired, FileNotFoundError):
             pass
 
-    def execute(self, code, auto_recover=True):
+    def execute(self, code, auto_recover=True, priority=None):
         """
         Execute code in PyMOL with optional auto-recovery.
 
         Args:
             code: Python code to execute in PyMOL
             auto_recover: If True, attempt recovery on failure
+            priority: Scheduling class in PyMOL, "interactive" (default)
+                or "batch"
 
         Returns:
             Output from PyMOL
         """
+        # One id for every attempt, so a retry after recovery is answered
+        # from the plugin's replay cache if the code already ran there
+        request_id = uuid.uuid4().hex
+        generation = self._generation
         try:
-            if not self.is_connected:
+            if self.connection is None:
                 if auto_recover:
-                    self.recover()
+                    self._recover_after(generation)
                 else:
                     raise ConnectionError("Not connected to PyMOL")
 
-            return self.connection.execute(code)
+            return self._execute(code, request_id, priority)
 
         except (ConnectionError, TimeoutError):
             if auto_recover:
-                self.recover()
-                return self.connection.execute(code)
+                self._recover_after(generation)
+                return self._execute(code, request_id, priority)
             raise
 
+    def _execute(self, code, request_id, priority):
+        with self.pool.connection() as conn:
+            output = conn.execute(code, request_id, priority=priority)
+            self._maybe_checkpoint(conn)
+        return output
+
+    def _recover_after(self, generation):
+        """Recover, unless another thread already has since generation."""
+        with self._lock:
+            if self._generation == generation:
+                self.recover()
+
+    def batch(self, timeout=None):
+        """
+        Context manager suspending PyMOL's scene updates for the commands
+        in the block, which are applied once at its end::
+
+            with session.batch():
+                for command in recipe:
+                    session.execute(command)
+
+        See ``PyMOLConnection.batch``.
+        """
+        if not self.is_connected:
+            self.recover()
+        return self.connection.batch(timeout)
+
     def __enter__(self):
         """Context manager entry."""
         self.start()
@@ -267,12 +545,18 @@ class PyMOLSession:
         self.stop()
 
 
+def _object_names(conn):
+    """Names of the objects in PyMOL."""
+    return conn.execute("_result = ' '.join(cmd.get_names('objects'))").split()
+
+
 # Convenience: global session instance
 _session = None
 
 
 def get_session():
-    """Get or create the global PyMOL session."""
+    """Get or create the global PyMOL session (its ``execute`` is safe to
+    call from several threads)."""
     global _session
     if _session is None:
         _session = PyMOLSession()
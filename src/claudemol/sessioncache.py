@@ -0,0 +1,161 @@
+"""
+Prepared Session Cache
+
+Figure pipelines run the same preparation recipes (load, remove solvent,
+compute a surface, colour, orient) on the same structures again and
+again. This cache stores a session of the objects a recipe created,
+keyed by a hash of the recipe and of its input files, so a later run with
+the same key loads them instead of re-running the recipe.
+
+Usage:
+    from claudemol.sessioncache import SessionCache
+
+    cache = SessionCache()
+    key = cache.key(recipe, inputs=["1hpv.pdb"])
+    checkpoint = cache.get(key)               # None on a miss
+    ...
+    cache.put(key, checkpoint)
+
+``PyMOLSession.prepare`` does this around a recipe. Sessions are stored as
+compressed checkpoints, one file per key (a JSON header line followed by
+the compressed session), under ``~/.claudemol/sessions``. The directory is
+bounded by total size, evicting the least recently used sessions first;
+the limit defaults to 1 GB, or CLAUDEMOL_SESSION_CACHE_MAX_MB.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+from claudemol.checkpoint import Checkpoint
+
+DEFAULT_DIR = Path.home() / ".claudemol" / "sessions"
+MAX_BYTES = int(
+    float(os.environ.get("CLAUDEMOL_SESSION_CACHE_MAX_MB", 1024)) * 1024 * 1024
+)
+SUFFIX = ".session"
+# Bump when cached sessions stop matching what their recipe would produce
+CACHE_VERSION = 1
+
+_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents (memoized per path, size and mtime)."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _digests[key] = h.hexdigest()
+    return _digests[key]
+
+
+class SessionCache:
+    """
+    A size-bounded directory of prepared sessions with LRU eviction.
+
+    A session's modification time is its last use: ``get`` touches it, and
+    eviction removes the oldest first. Files are written under a temporary
+    name and renamed into place, so concurrent readers see a whole session
+    or none.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, max_bytes=MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(recipe, inputs=()):
+        """
+        Cache key for a recipe run on some input files.
+
+        Args:
+            recipe: Python code, or a list of lines
+            inputs: Paths of the files the recipe reads; their contents,
+                not their names, go into the key
+
+        Returns:
+            Hex digest
+        """
+        if isinstance(recipe, (list, tuple)):
+            recipe = "\n".join(recipe)
+        key = {
+            "version": CACHE_VERSION,
+            "recipe": recipe,
+            "inputs": [file_digest(str(path)) for path in inputs],
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        """The cached session for a key, marked as used (None on a miss)."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                data = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return Checkpoint(data, **meta)
+
+    def put(self, key, checkpoint):
+        """Store a session under a key, then enforce the size limit (never
+        evicting it)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(checkpoint.meta()).encode("utf-8") + b"\n")
+            f.write(checkpoint.data)
+        os.replace(tmp, path)
+        self.evict(keep=path.name)
+
+    def discard(self, key):
+        """Remove a key's session, e.g. one that no longer loads."""
+        self._path(key).unlink(missing_ok=True)
+
+    def entries(self):
+        """Cached sessions, least recently used first, as dicts with "key",
+        "bytes" and "used"."""
+        entries = []
+        for path in self.root.glob(f"*{SUFFIX}"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append(
+                {
+                    "key": path.name[: -len(SUFFIX)],
+                    "bytes": st.st_size,
+                    "used": st.st_mtime,
+                }
+            )
+        return sorted(entries, key=lambda entry: entry["used"])
+
+    def evict(self, keep=None):
+        """Remove the least recently used sessions past the size limit;
+        returns the keys removed."""
+        entries = self.entries()
+        total = sum(entry["bytes"] for entry in entries)
+        removed = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry["key"] + SUFFIX == keep:
+                continue
+            self.discard(entry["key"])
+            total -= entry["bytes"]
+            removed.append(entry["key"])
+        return removed
+
+    def clear(self):
+        for entry in self.entries():
+            self.discard(entry["key"])
+
+    def _path(self, key):
+        return self.root / f"{key}{SUFFIX}"
@@ -0,0 +1,130 @@
+"""
+Latency Statistics
+
+Aggregates per-command timing samples (from the client and from the PyMOL
+plugin) into percentile summaries, exportable as JSON or Prometheus text.
+"""
+
+import json
+import math
+import threading
+from collections import defaultdict, deque
+
+DEFAULT_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    """Summarize a list of numbers as count/mean/p50/p95/p99/max."""
+    ordered = sorted(values)
+    count = len(ordered)
+    summary = {
+        "count": count,
+        "mean": sum(ordered) / count if count else 0.0,
+        "max": ordered[-1] if ordered else 0.0,
+    }
+    for q in QUANTILES:
+        summary[f"p{round(q * 100)}"] = percentile(ordered, q)
+    return summary
+
+
+class LatencyStats:
+    """
+    Thread-safe rolling window of timing samples, keyed by command kind.
+
+    Each sample is a flat dict of numeric fields, e.g.
+    ``{"send_ms": 0.1, "wait_ms": 4.2, "bytes_in": 512}``.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, kind, timings):
+        """Add one sample for a command kind. Non-numeric fields are dropped."""
+        sample = {
+            k: v
+            for k, v in timings.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+        }
+        with self._lock:
+            self._samples[kind].append(sample)
+
+    def extend(self, samples_by_kind):
+        """Add many samples, e.g. the ``samples`` dict returned by the plugin."""
+        for kind, samples in samples_by_kind.items():
+            for sample in samples:
+                self.record(kind, sample)
+
+    def reset(self):
+        """Drop all samples."""
+        with self._lock:
+            self._samples.clear()
+
+    def kinds(self):
+        with self._lock:
+            return sorted(self._samples)
+
+    def summary(self):
+        """
+        Percentile summary of every field, per kind.
+
+        Returns:
+            {kind: {field: {"count", "mean", "max", "p50", "p95", "p99"}}}
+        """
+        with self._lock:
+            snapshot = {kind: list(s) for kind, s in self._samples.items()}
+        result = {}
+        for kind, samples in sorted(snapshot.items()):
+            fields = defaultdict(list)
+            for sample in samples:
+                for field, value in sample.items():
+                    fields[field].append(value)
+            result[kind] = {
+                field: summarize(values) for field, values in sorted(fields.items())
+            }
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.summary(), indent=indent)
+
+    def to_prometheus(self, prefix="claudemol"):
+        """
+        Render the summary in the Prometheus text exposition format.
+
+        Millisecond fields are exported in seconds (``exec_ms`` becomes
+        ``<prefix>_exec_seconds``); other fields keep their unit.
+        """
+        by_metric = defaultdict(list)
+        for kind, fields in self.summary().items():
+            for field, s in fields.items():
+                if field.endswith("_ms"):
+                    name, scale = f"{prefix}_{field[:-3]}_seconds", 0.001
+                else:
+                    name, scale = f"{prefix}_{field}", 1.0
+                by_metric[name].append((kind, s, scale))
+
+        lines = []
+        for name, entries in sorted(by_metric.items()):
+            lines.append(f"# TYPE {name} summary")
+            for kind, s, scale in entries:
+                for q in QUANTILES:
+                    value = s[f"p{round(q * 100)}"] * scale
+                    lines.append(f'{name}{{kind="{kind}",quantile="{q}"}} {value:g}')
+                total = s["mean"] * s["count"] * scale
+                lines.append(f'{name}_sum{{kind="{kind}"}} {total:g}')
+                lines.append(f'{name}_count{{kind="{kind}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide client-side timings, recorded by PyMOLConnection
+CLIENT_STATS = LatencyStats()
@@ -0,0 +1,362 @@
+"""
+Stand-in PyMOL for tests, benchmarks and load tests.
+
+Runs the real socket plugin (``claudemol.plugin.SocketServer``) in-process
+against a small in-memory fake of ``pymol.cmd``, so protocol and session code
+can be exercised on machines without PyMOL.
+
+Usage:
+    from claudemol.testing import stub_server
+
+    with stub_server() as server:
+        conn = PyMOLConnection(port=server.port)
+        conn.connect()
+        conn.execute("cmd.fragment('ala')")
+"""
+
+import copy
+import importlib
+import os
+import struct
+import sys
+import time
+import types
+import zlib
+from contextlib import contextmanager
+
+
+def _png_bytes(width, height, rgb=(255, 255, 255)):
+    """Encode a solid-colour RGB image as PNG using only the stdlib."""
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    row = b"\x00" + bytes(rgb) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(row * height, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FakeCmd:
+    """
+    Minimal in-memory stand-in for ``pymol.cmd``.
+
+    Objects are stored as ``{"states": [[(x, y, z), ...], ...]}``. Rendering
+    produces a blank PNG of the requested size; ``ray_seconds_per_mpixel``
+    adds an artificial per-megapixel delay (per antialias pass) so render
+    paths have a cost.
+    """
+
+    def __init__(self, ray_seconds_per_mpixel=0.0):
+        self.ray_seconds_per_mpixel = ray_seconds_per_mpixel
+        self.objects = {}
+        self.settings = {}
+        self.commands = {}
+        self.view = [0.0] * 18
+        self._image_size = (640, 480)
+
+    # -- registry --------------------------------------------------------
+
+    def extend(self, name, function=None):
+        self.commands[name] = function
+        return function
+
+    def get_version(self):
+        return ("3.0.0-fake", 3.0, 3000000, 0, "", 0)
+
+    # -- objects ---------------------------------------------------------
+
+    def reinitialize(self, what="everything", object=""):
+        if what in ("everything", "objects"):
+            self.objects.clear()
+        if what in ("everything", "settings"):
+            self.settings.clear()
+
+    def get_names(self, type="objects", enabled_only=0, selection=""):
+        return list(self.objects)
+
+    def delete(self, name):
+        if name in ("all", "*"):
+            self.objects.clear()
+        else:
+            self.objects.pop(name, None)
+
+    def fragment(self, name, object=None, origin=1, zoom=0, quiet=1):
+        coords = [(float(i), 0.0, 0.0) for i in range(10)]
+        self.objects[object or name] = {"states": [coords]}
+
+    def pseudoatom(self, object, selection="", name="PS1", pos=None, **kwargs):
+        pos = tuple(pos) if pos else (0.0, 0.0, 0.0)
+        self.objects.setdefault(object, {"states": [[]]})["states"][0].append(pos)
+
+    def load_raw(self, content, format="", object="", state=0, **kwargs):
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", "replace")
+        coords = [
+            (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            for line in content.splitlines()
+            if line.startswith(("ATOM", "HETATM")) and len(line) >= 54
+        ]
+        # As in PyMOL, loading into an existing object adds a state
+        states = self.objects.setdefault(object or "obj01", {"states": []})["states"]
+        if state and state <= len(states):
+            states[state - 1] = coords
+        else:
+            states.append(coords)
+
+    def load(self, filename, object="", state=0, format="", **kwargs):
+        with open(filename, "rb") as f:
+            content = f.read()
+        if not object:
+            object = os.path.splitext(os.path.basename(filename))[0]
+        self.load_raw(content, format or filename.rsplit(".", 1)[-1], object, state)
+
+    def load_coordset(self, coords, object, state=0, quiet=1):
+        frame = [tuple(map(float, xyz)) for xyz in coords]
+        states = self.objects[object]["states"]
+        if len(frame) != len(states[0]):
+            raise ValueError("atom count mismatch")
+        if state and state <= len(states):
+            states[state - 1] = frame
+        else:
+            states.append(frame)
+
+    def _selected(self, selection):
+        """Object names a selection covers: "all" or one object name
+        (optionally as "%name")."""
+        if selection in ("all", "(all)"):
+            return list(self.objects)
+        selection = selection.lstrip("%")
+        return [selection] if selection in self.objects else []
+
+    def get_coords(self, selection="all", state=1, quiet=1):
+        import numpy
+
+        names = self._selected(selection)
+        # State 0: all states, one after the other, like PyMOL
+        states = range(self.count_states(selection)) if state == 0 else [state - 1]
+        coords = [
+            xyz
+            for i in states
+            for name in names
+            if i < len(self.objects[name]["states"])
+            for xyz in self.objects[name]["states"][i]
+        ]
+        if not coords:
+            return None
+        return numpy.array(coords, dtype=numpy.float32)
+
+    def iterate(self, selection, expression, quiet=1, space=None):
+        """Atoms are carbons, one residue each: resi 1, 2, ... in chain A."""
+        self._iterate(selection, expression, space)
+
+    def alter(self, selection, expression, quiet=1, space=None):
+        """Like iterate; changes to "b" are kept (in the object's "b")."""
+        self._iterate(selection, expression, space, alter=True)
+
+    def _iterate(self, selection, expression, space, alter=False):
+        space = space if space is not None else {}
+        for name in self._selected(selection):
+            obj = self.objects[name]
+            for i in range(len(obj["states"][0])):
+                atom = {
+                    "model": name,
+                    "index": i + 1,
+                    "chain": "A",
+                    "resi": str(i + 1),
+                    "resn": "UNK",
+                    "name": "C",
+                    "b": obj["b"][i] if "b" in obj else 0.0,
+                }
+                exec(expression, space, atom)
+                if alter:
+                    b = obj.setdefault("b", [0.0] * len(obj["states"][0]))
+                    b[i] = float(atom["b"])
+
+    def create(self, name, selection, source_state=0, target_state=0, **kwargs):
+        self.objects[name] = copy.deepcopy(self.objects[selection])
+
+    def enable(self, name="all", parents=0):
+        pass
+
+    def disable(self, name="all", parents=0):
+        pass
+
+    def count_atoms(self, selection="all", quiet=1, state=0):
+        return sum(
+            len(self.objects[name]["states"][max(state, 1) - 1])
+            for name in self._selected(selection)
+        )
+
+    def count_states(self, selection="all", quiet=1):
+        counts = [
+            len(self.objects[name]["states"]) for name in self._selected(selection)
+        ]
+        return max(counts, default=0)
+
+    # -- settings and view -----------------------------------------------
+
+    def set(self, name, value=1, selection="", state=0, quiet=1, **kwargs):
+        self.settings[name] = value
+
+    def get(self, name, selection="", state=0, quiet=1):
+        return self.settings.get(name, 0)
+
+    def get_view(self, output=1, quiet=1):
+        return tuple(self.view)
+
+    def set_view(self, view, quiet=1, animate=0, hand=1):
+        self.view = list(view)
+
+    def orient(self, selection="all", state=0, animate=0):
+        pass
+
+    def zoom(self, selection="all", buffer=0.0, state=0, complete=0, animate=0):
+        pass
+
+    def show(self, representation="", selection="", state=0):
+        pass
+
+    def hide(self, representation="", selection="", state=0):
+        pass
+
+    def color(self, color, selection="(all)", quiet=1, flags=0):
+        pass
+
+    def refresh(self):
+        pass
+
+    def rebuild(self, selection="all", representation="everything"):
+        pass
+
+    def cache(self, action="optimize", scenes="", state=-1, quiet=1):
+        if action != "clear":
+            self.settings["cache_mode"] = {"disable": 0, "read_only": 1}.get(action, 2)
+
+    # -- rendering -------------------------------------------------------
+
+    def ray(
+        self,
+        width=0,
+        height=0,
+        antialias=-1,
+        angle=0.0,
+        shift=0.0,
+        renderer=-1,
+        quiet=1,
+        async_=0,
+        **kwargs,
+    ):
+        width, height = int(width) or 640, int(height) or 480
+        if self.ray_seconds_per_mpixel:
+            passes = 1 + max(int(antialias), 0)
+            time.sleep(self.ray_seconds_per_mpixel * width * height * passes / 1e6)
+        self._image_size = (width, height)
+
+    def draw(self, width=0, height=0, antialias=-1, quiet=1):
+        self._image_size = (int(width) or 640, int(height) or 480)
+
+    def png(
+        self, filename, width=0, height=0, dpi=-1.0, ray=0, quiet=1, prior=0, format=0
+    ):
+        if width or height:
+            self._image_size = (int(width) or 640, int(height) or 480)
+        with open(filename, "wb") as f:
+            f.write(_png_bytes(*self._image_size))
+        return 1
+
+    # -- sessions --------------------------------------------------------
+
+    def get_session(self, names="", partial=0, quiet=1, compress=-1, cache=-1):
+        objects = self.objects
+        if names:
+            objects = {k: v for k, v in objects.items() if k in names.split()}
+        return {
+            "objects": copy.deepcopy(objects),
+            "settings": dict(self.settings),
+            "view": list(self.view),
+        }
+
+    def set_session(self, session, partial=0, quiet=1, cache=1, steal=-1):
+        if not partial:
+            self.objects.clear()
+        self.objects.update(copy.deepcopy(session.get("objects", {})))
+        if not partial:
+            self.settings.update(session.get("settings", {}))
+        self.view = list(session.get("view", self.view))
+        return 1
+
+
+def install_fake_pymol(fake_cmd=None, force=True):
+    """
+    Register a fake ``pymol`` package in ``sys.modules``.
+
+    Args:
+        fake_cmd: FakeCmd instance to use (a new one is created if None)
+        force: Replace a real PyMOL if one is importable
+
+    Returns:
+        The ``cmd`` object now served by ``from pymol import cmd``
+    """
+    if not force:
+        try:
+            from pymol import cmd
+
+            return cmd
+        except ImportError:
+            pass
+    fake_cmd = fake_cmd or FakeCmd()
+    module = types.ModuleType("pymol")
+    module.cmd = fake_cmd
+    module.__path__ = []
+    sys.modules["pymol"] = module
+    sys.modules["pymol.cmd"] = fake_cmd
+    return fake_cmd
+
+
+def load_plugin(fake_cmd=None):
+    """
+    Import ``claudemol.plugin`` against a fake ``pymol.cmd`` without
+    auto-starting its listener.
+
+    Returns:
+        The plugin module, with ``plugin.cmd`` bound to the fake
+    """
+    cmd = install_fake_pymol(fake_cmd)
+    # Only for the import: PyMOLs launched later inherit the environment
+    previous = os.environ.get("CLAUDEMOL_NO_AUTOSTART")
+    os.environ["CLAUDEMOL_NO_AUTOSTART"] = "1"
+    try:
+        plugin = importlib.import_module("claudemol.plugin")
+    finally:
+        if previous is None:
+            del os.environ["CLAUDEMOL_NO_AUTOSTART"]
+        else:
+            os.environ["CLAUDEMOL_NO_AUTOSTART"] = previous
+    plugin.cmd = cmd
+    return plugin
+
+
+@contextmanager
+def stub_server(fake_cmd=None, host="localhost", port=0):
+    """
+    Run a real plugin ``SocketServer`` against a fake ``pymol.cmd``.
+
+    Yields the running server; ``server.port`` is the bound port and
+    ``server.fake_cmd`` the FakeCmd it executes against.
+    """
+    plugin = load_plugin(fake_cmd)
+    server = plugin.SocketServer(host=host, port=port)
+    server.fake_cmd = plugin.cmd
+    server.start()
+    if not server.ready.wait(5.0) or not server.running:
+        raise RuntimeError("Stub PyMOL server failed to start")
+    try:
+        yield server
+    finally:
+        server.stop()
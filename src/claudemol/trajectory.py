@@ -0,0 +1,383 @@
+"""
+Trajectory Streaming
+
+Streams coordinate frames into an existing PyMOL object as new states, in
+chunks over the framed protocol's binary channel, so large trajectories never
+have to be written to a temporary file or spelled out as code.
+
+Usage:
+    from claudemol.connection import PyMOLConnection
+    from claudemol.trajectory import read_trajectory, stream_trajectory
+
+    conn = PyMOLConnection()
+    conn.connect()
+    conn.execute("cmd.load('system.pdb', 'md')")
+
+    # From a NumPy array of shape (frames, atoms, 3), in Angstrom
+    stream_trajectory(conn, "md", coords)
+
+    # From a DCD/XTC/... file (needs MDAnalysis or mdtraj)
+    stream_trajectory(conn, "md", read_trajectory("run.xtc", "system.pdb"))
+
+    # Live updates from a running simulation; never blocks the caller
+    for step in simulation:
+        push_coords("md", step.positions)
+
+Coordinates must be in the object's atom order as loaded (the order of the
+topology file), which is what ``cmd.load_coordset`` expects.
+"""
+
+import math
+import threading
+import time
+
+from claudemol.connection import DEFAULT_HOST, DEFAULT_PORT, PyMOLConnection
+
+# Coordinates per request; large enough to amortize the round trip
+CHUNK_BYTES = 16 * 1024 * 1024
+# Ceiling on coordinates held in PyMOL (raw float32 xyz, not counting
+# PyMOL's own per-state overhead)
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Trajectory streaming needs NumPy: pip install numpy")
+    return numpy
+
+
+def read_trajectory(path, topology=None):
+    """
+    Iterate over the frames of a trajectory file as (atoms, 3) float32
+    arrays in Angstrom.
+
+    Uses MDAnalysis if installed, else mdtraj. The returned iterator has a
+    length when the reader knows its frame count, which lets
+    ``stream_trajectory`` stride instead of dropping frames.
+
+    Args:
+        path: Trajectory file (DCD, XTC, TRR, ...)
+        topology: Topology file matching the object loaded in PyMOL
+    """
+    np = _numpy()
+    try:
+        import MDAnalysis
+    except ImportError:
+        MDAnalysis = None
+    if MDAnalysis is not None:
+        universe = (
+            MDAnalysis.Universe(topology, path)
+            if topology
+            else MDAnalysis.Universe(path)
+        )
+        trajectory = universe.trajectory
+        return _SizedFrames(
+            (ts.positions.astype(np.float32) for ts in trajectory), len(trajectory)
+        )
+    try:
+        import mdtraj
+    except ImportError:
+        raise RuntimeError(
+            "Reading trajectory files needs MDAnalysis or mdtraj: "
+            "pip install MDAnalysis"
+        )
+    # mdtraj works in nanometres
+    chunks = mdtraj.iterload(path, top=topology, chunk=100)
+    return (
+        (frame * 10.0).astype(np.float32) for chunk in chunks for frame in chunk.xyz
+    )
+
+
+class _SizedFrames:
+    """An iterator over frames that also knows how many there are."""
+
+    def __init__(self, frames, length):
+        self._frames = frames
+        self._length = length
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def __len__(self):
+        return self._length
+
+
+def _chunks(frames, frames_per_chunk, stride, limit, progress):
+    """Group strided frames into float32 arrays, stopping after limit."""
+    np = _numpy()
+    batch = []
+    kept = 0
+    for i, frame in enumerate(frames):
+        if i % stride:
+            continue
+        if kept >= limit:
+            progress["truncated"] = True
+            break
+        batch.append(np.asarray(frame, dtype=np.float32))
+        kept += 1
+        if len(batch) == frames_per_chunk:
+            yield np.stack(batch)
+            batch = []
+    if batch:
+        yield np.stack(batch)
+
+
+def stream_trajectory(
+    conn,
+    object,
+    frames,
+    state=0,
+    chunk_bytes=CHUNK_BYTES,
+    max_bytes=MAX_BYTES,
+    on_limit="stride",
+):
+    """
+    Append frames to an existing PyMOL object as new states.
+
+    Args:
+        conn: Connected PyMOLConnection (or a PyMOLSession)
+        object: Name of a loaded object whose atoms match the frames
+        frames: Array of shape (frames, atoms, 3), or an iterable of
+            (atoms, 3) arrays such as ``read_trajectory``
+        state: First state to overwrite (1-based), or 0 to append
+        chunk_bytes: Coordinate bytes sent per request
+        max_bytes: Ceiling on streamed coordinate bytes. Past it, frames
+            are strided evenly ("stride", needs len(frames)) or the rest
+            are dropped ("drop")
+        on_limit: "stride" or "drop"
+
+    Returns:
+        Dict with frames_sent, frames_dropped, stride, states (the object's
+        state count afterwards), bytes and seconds. frames_dropped is
+        None when frames were cut off at max_bytes from an iterable of
+        unknown length (the rest is not read just to count it).
+    """
+    np = _numpy()
+    conn = getattr(conn, "connection", conn)
+    if on_limit not in ("stride", "drop"):
+        raise ValueError(f"on_limit must be 'stride' or 'drop', not {on_limit!r}")
+    if not conn.framed:
+        raise RuntimeError("Trajectory streaming needs a newer PyMOL plugin")
+
+    frames_iter = iter(frames)
+    first = next(frames_iter, None)
+    if first is None:
+        return {
+            "frames_sent": 0,
+            "frames_dropped": 0,
+            "stride": 1,
+            "states": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
+    first = np.asarray(first, dtype=np.float32)
+    n_atoms = first.shape[0]
+    frame_bytes = n_atoms * 3 * 4
+    limit = max(1, max_bytes // frame_bytes)
+
+    try:
+        total = len(frames)
+    except TypeError:
+        total = None
+    stride = 1
+    if total is not None and total > limit and on_limit == "stride":
+        stride = math.ceil(total / limit)
+
+    def all_frames():
+        yield first
+        yield from frames_iter
+
+    frames_per_chunk = max(1, chunk_bytes // frame_bytes)
+    start = time.perf_counter()
+    sent = 0
+    seen_states = 0
+    progress = {"truncated": False}
+    chunks = _chunks(all_frames(), frames_per_chunk, stride, limit, progress)
+    for chunk in chunks:
+        if chunk.shape[1:] != (n_atoms, 3):
+            raise ValueError(
+                f"Frame shape {chunk.shape[1:]} does not match ({n_atoms}, 3)"
+            )
+        result = conn.request(
+            {
+                "type": "coordsets",
+                "object": object,
+                "atoms": n_atoms,
+                "state": state + sent if state else 0,
+            },
+            blob=chunk.astype("<f4", copy=False).tobytes(),
+        )
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+        sent += len(chunk)
+        seen_states = result.get("states", seen_states)
+
+    # Frames the stride skipped over are not "dropped"
+    if total is not None:
+        dropped = max(0, math.ceil(total / stride) - sent)
+    else:
+        dropped = None if progress["truncated"] else 0
+    return {
+        "frames_sent": sent,
+        "frames_dropped": dropped,
+        "stride": stride,
+        "states": seen_states,
+        "bytes": sent * frame_bytes,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class CoordinatePusher:
+    """
+    Pushes live coordinates to PyMOL from a background thread.
+
+    One frame is in flight at a time. A frame pushed for an (object, state)
+    while an earlier one is still waiting replaces it, so when PyMOL falls
+    behind it skips straight to the newest frame instead of queueing.
+
+    Attributes:
+        pushed: Frames handed to ``push``
+        sent: Frames applied in PyMOL
+        coalesced: Frames replaced by a newer one before being sent
+        last_latency_ms: Time from ``push`` to PyMOL applying the last frame
+
+    By default the pusher opens a connection of its own. Pushes run at
+    interactive priority, ahead of batch work queued by other clients.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, connection=None):
+        # A connection of its own by default; one passed in must not be
+        # used by other threads while the pusher is open
+        self.connection = connection or PyMOLConnection(host, port)
+        self._owns_connection = connection is None
+        self.pushed = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.last_latency_ms = 0.0
+        self._pending = {}  # (object, state) -> (frame, pushed_at)
+        self._busy = False
+        self._closed = False
+        self._error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def push(self, object, coords, state=1):
+        """
+        Queue coordinates for an object's state without waiting.
+
+        Args:
+            object: Name of a loaded object
+            coords: (atoms, 3) array in the object's loaded atom order
+            state: State to overwrite (1-based)
+        """
+        np = _numpy()
+        frame = np.ascontiguousarray(coords, dtype="<f4")
+        if frame.ndim != 2 or frame.shape[1] != 3:
+            raise ValueError(f"Expected an (atoms, 3) array, got {frame.shape}")
+        with self._cond:
+            if self._error:
+                error, self._error = self._error, None
+                raise error
+            if self._closed:
+                raise RuntimeError("CoordinatePusher is closed")
+            if (object, state) in self._pending:
+                self.coalesced += 1
+            self._pending[(object, state)] = (frame, time.perf_counter())
+            self.pushed += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Wait until every pushed frame has been applied (or coalesced)."""
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            ):
+                raise TimeoutError("Coordinates not applied in time")
+            if self._error:
+                error, self._error = self._error, None
+                raise error
+
+    def close(self, timeout=10.0):
+        """Send what is pending, then stop the sender thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._owns_connection:
+            self.connection.disconnect()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                key = next(iter(self._pending))
+                frame, pushed_at = self._pending.pop(key)
+                self._busy = True
+            try:
+                self._send(key, frame)
+                error = None
+            except Exception as e:
+                error = e
+            with self._cond:
+                self._busy = False
+                if error is None:
+                    self.sent += 1
+                    self.last_latency_ms = (time.perf_counter() - pushed_at) * 1000
+                else:
+                    self._error = error
+                self._cond.notify_all()
+
+    def _send(self, key, frame):
+        if not self.connection.is_connected():
+            self.connection.connect()
+        object, state = key
+        result = self.connection.request(
+            {
+                "type": "coordsets",
+                "kind": "push",
+                "object": object,
+                "atoms": len(frame),
+                "state": state,
+            },
+            blob=frame.tobytes(),
+        )
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("error", "Unknown error"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_pushers = {}
+_pushers_lock = threading.Lock()
+
+
+def push_coords(object, coords, state=1, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Update an object's coordinates in place, without waiting for PyMOL.
+
+    Frames go through a shared CoordinatePusher per PyMOL instance, so a
+    fast producer (simulation, optimizer) is never slowed down by rendering;
+    frames PyMOL cannot keep up with are coalesced to the newest.
+
+    Returns:
+        The CoordinatePusher, for ``flush()`` and its counters
+    """
+    with _pushers_lock:
+        pusher = _pushers.get((host, port))
+        if pusher is None or pusher.closed:
+            pusher = _pushers[(host, port)] = CoordinatePusher(host, port)
+    pusher.push(object, coords, state)
+    return pusher
@@ -11,17 +11,27 @@ Usage:
 
     # Or with auto-naming
     path = pymol_view("cmd.color('red', 'all')")
+
+    # Get a preview in well under a second; refinements replace it later
+    path = pymol_view("cmd.show('surface')", ray=True, progressive=True, budget=5)
+
+    # Let PyMOL pick antialias, shadows and size to finish in about 2 s
+    result = render_image("cmd.show('surface')", target=2.0)
+    result["plan"]["predicted_s"], result["plan"]["actual_s"]
+
+    # A compact 512-px WebP preview instead of a full-size PNG
+    path = pymol_view("cmd.show('cartoon')", format="webp", max_dim=512)
 """
 
-import json
-import socket
-import time
-from datetime import datetime
+import threading
 from pathlib import Path
 
+from claudemol.connection import PyMOLConnection, get_pool
+from claudemol.scratch import DEFAULT_DIR, ScratchStore
+
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 9880
-SCRATCH_DIR = Path.home() / ".claudemol" / "scratch"
+SCRATCH_DIR = DEFAULT_DIR
 
 
 def ensure_scratch_dir():
@@ -30,42 +40,174 @@ def ensure_scratch_dir():
     return SCRATCH_DIR
 
 
-def send_command(code: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 120.0) -> dict:
-    """Send a command to PyMOL and return the result."""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(timeout)
+def send_command(
+    code: str,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    timeout: float = 120.0,
+) -> dict:
+    """Send a command to PyMOL and return the result.
+
+    The connection is borrowed from a pool shared by every call (and
+    thread) in this process rather than opened for each command. Raises
+    ConnectionError if PyMOL cannot be reached; if it closes the connection
+    without answering, the result is an error dict.
+    """
+    sent = False
     try:
-        s.connect((host, port))
-        msg = json.dumps({"type": "execute", "code": code})
-        s.sendall(msg.encode())
-
-        response = b""
-        while True:
-            chunk = s.recv(4096)
-            if not chunk:
-                break
-            response += chunk
-            try:
-                return json.loads(response.decode())
-            except json.JSONDecodeError:
-                continue
-    finally:
-        s.close()
-    return {"status": "error", "error": "No response received"}
+        with get_pool(host, port, timeout).connection() as conn:
+            sent = True
+            return conn.request({"type": "execute", "code": code})
+    except ConnectionError:
+        if not sent:
+            raise
+        return {"status": "error", "error": "No response received"}
+
+
+def scratch_store() -> ScratchStore:
+    """The bounded store that rendered images are kept in."""
+    return ScratchStore(SCRATCH_DIR)
 
 
 def generate_filename(name: str | None = None, extension: str = "png") -> Path:
-    """Generate a unique filename in the scratch directory."""
-    ensure_scratch_dir()
+    """Generate a unique filename in the scratch directory.
 
-    if name:
-        # Clean the name
-        clean_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
-        return SCRATCH_DIR / f"{clean_name}.{extension}"
-    else:
-        # Auto-generate with timestamp
-        timestamp = datetime.now().strftime("%H%M%S")
-        return SCRATCH_DIR / f"view_{timestamp}.{extension}"
+    Names are the given name (or "view") plus a timestamp and a random
+    suffix, so snapshots never overwrite each other.
+    """
+    return scratch_store().new_path(name, extension)
+
+
+def _image_file(name, format, max_dim, image_quality):
+    """Output path and render parameters for the requested image format."""
+    extension = {"jpeg": "jpg"}.get(format.lower(), format.lower())
+    params = {"format": format, "max_dim": max_dim, "image_quality": image_quality}
+    return generate_filename(name, extension), params
+
+
+def _render_request(
+    commands, output_path, width, height, ray, progressive, budget, **params
+):
+    return {
+        "type": "render",
+        "code": commands,
+        "path": str(output_path),
+        "width": width,
+        "height": height,
+        "ray": ray,
+        "progressive": progressive,
+        "budget_s": budget,
+        **params,
+    }
+
+
+def render_progressive(
+    commands: str,
+    name: str | None = None,
+    width: int = 800,
+    height: int = 600,
+    ray: bool = True,
+    budget: float | None = None,
+    port: int = DEFAULT_PORT,
+    format: str = "png",
+    max_dim: int | None = None,
+    image_quality: int | str | None = None,
+    host: str = DEFAULT_HOST,
+):
+    """
+    Execute PyMOL commands and yield each stage of a progressive render.
+
+    The first result is a quick preview (OpenGL, or a small ray trace when
+    PyMOL is headless); full-size and antialiased refinements follow while
+    they are predicted to fit in ``budget`` seconds (no limit if None). Every
+    stage overwrites the same image file atomically. format, max_dim and
+    image_quality are as for ``pymol_view``.
+
+    Yields:
+        Result dicts with "stage", "path", "width", "height" and "final"
+    """
+    output_path, params = _image_file(name, format, max_dim, image_quality)
+    # A connection of its own: the generator may be finished by another
+    # thread (pymol_view drains refinements in the background)
+    conn = PyMOLConnection(host=host, port=port, recv_timeout=120.0)
+    conn.connect()
+    try:
+        request = _render_request(
+            commands, output_path, width, height, ray, True, budget, **params
+        )
+        for result in conn.request_stream(request):
+            if result.get("status") != "success":
+                raise RuntimeError(
+                    f"PyMOL error: {result.get('error', 'Unknown error')}"
+                )
+            if result.get("final", True):
+                scratch_store().add(result["path"])
+            yield result
+    finally:
+        conn.disconnect()
+
+
+def render_image(
+    commands: str,
+    name: str | None = None,
+    width: int = 800,
+    height: int = 600,
+    quality: str | None = None,
+    target: float | None = None,
+    calibrate: bool = False,
+    port: int = DEFAULT_PORT,
+    format: str = "png",
+    max_dim: int | None = None,
+    image_quality: int | str | None = None,
+    host: str = DEFAULT_HOST,
+) -> dict:
+    """
+    Execute PyMOL commands and ray-trace with settings PyMOL plans itself.
+
+    Antialias, shadows, resolution and ray threads come from either a
+    quality level ("high", "normal" or "draft") or the best quality
+    predicted to finish within ``target`` seconds. Predictions use a
+    per-host calibration (run on first use, or again with calibrate=True)
+    refined by the timings of earlier renders of scenes of similar size.
+    format, max_dim and image_quality are as for ``pymol_view``.
+
+    Returns:
+        Result dict with "path" and "plan": the chosen "antialias",
+        "ray_shadow", "max_threads", "width" and "height", plus
+        "predicted_s" and "actual_s"
+    """
+    if quality is None and target is None:
+        raise ValueError("Give a quality level or a target time")
+    output_path, params = _image_file(name, format, max_dim, image_quality)
+    with get_pool(host, port, 120.0).connection() as conn:
+        result = conn.request(
+            _render_request(
+                commands,
+                output_path,
+                width,
+                height,
+                True,
+                False,
+                None,
+                quality=quality,
+                target_s=target,
+                calibrate=calibrate,
+                **params,
+            )
+        )
+    if result.get("status") != "success":
+        raise RuntimeError(f"PyMOL error: {result.get('error', 'Unknown error')}")
+    scratch_store().add(result["path"])
+    return result
+
+
+def _drain(stages):
+    """Let the remaining refinements of a progressive render land."""
+    try:
+        for _ in stages:
+            pass
+    except (RuntimeError, ConnectionError, TimeoutError):
+        pass
 
 
 def pymol_view(
@@ -75,6 +217,14 @@ def pymol_view(
     height: int = 600,
     ray: bool = False,
     port: int = DEFAULT_PORT,
+    progressive: bool = False,
+    budget: float | None = None,
+    quality: str | None = None,
+    target: float | None = None,
+    format: str = "png",
+    max_dim: int | None = None,
+    image_quality: int | str | None = None,
+    host: str = DEFAULT_HOST,
 ) -> str:
     """
     Execute PyMOL commands and save a snapshot.
@@ -84,54 +234,74 @@ def pymol_view(
         name: Optional name for the output file (auto-generated if None)
         width: Image width in pixels
         height: Image height in pixels
-        ray: Whether to ray-trace (slower but prettier)
-        port: PyMOL socket port
+        ray: Whether to ray-trace (slower but prettier). Without ray tracing
+            the image is drawn with OpenGL; headless PyMOL always ray-traces.
+        port: PyMOL socket port (on ``host``)
+        progressive: Return as soon as a quick preview is saved; refinements
+            keep replacing the same file in the background
+        budget: Latency budget in seconds for progressive refinements
+        quality: Ray-trace at a quality level ("high", "normal", "draft"),
+            see ``render_image``
+        target: Ray-trace with the best settings predicted to take at most
+            this many seconds, see ``render_image``
+        format: "png", or "jpeg"/"webp" for much smaller files (re-encoded
+            in PyMOL with Pillow; a PNG is saved if it is missing there)
+        max_dim: Cap on the longer side in pixels; the scene is rendered at
+            that size, e.g. 512 for a cheap preview
+        image_quality: JPEG/WebP quality, 1-100 or "low", "medium", "high"
+        host: Host PyMOL runs on
 
     Returns:
         Path to the saved image file
     """
-    output_path = generate_filename(name)
-
-    # Build the full command sequence
-    # IMPORTANT: cmd.png() with width/height parameters causes a PyMOL bug where
-    # the view matrix Z-distance becomes corrupted after multiple cycles of
-    # reinitialize + fetch + png. The Z-distance grows exponentially from ~120 to
-    # ~50000+ after just 3-4 cycles, causing the view to zoom out into invisibility.
-    #
-    # The fix: ALWAYS use cmd.ray(width, height) before cmd.png(path) WITHOUT
-    # dimensions in the png call. The ray() command renders to an offscreen buffer
-    # without touching the viewport, preventing the corruption.
-
-    render_cmd = f"cmd.ray({width}, {height})"
-    png_cmd = f'cmd.png(r"{output_path}")'
-
-    full_code = f"""
-{commands}
-
-# Render and save the image
-{render_cmd}
-{png_cmd}
-print(f"Saved: {output_path}")
-"""
+    image = {"format": format, "max_dim": max_dim, "image_quality": image_quality}
+    if quality is not None or target is not None:
+        return render_image(
+            commands,
+            name,
+            width,
+            height,
+            quality=quality,
+            target=target,
+            port=port,
+            host=host,
+            **image,
+        )["path"]
+
+    if progressive:
+        stages = render_progressive(
+            commands, name, width, height, ray, budget, port, host=host, **image
+        )
+        preview = next(stages)
+        if not preview.get("final", True):
+            threading.Thread(target=_drain, args=(stages,), daemon=True).start()
+        return preview["path"]
 
-    result = send_command(full_code, port=port, timeout=120.0)
+    output_path, params = _image_file(name, format, max_dim, image_quality)
+    with get_pool(host, port, 120.0).connection() as conn:
+        result = conn.request(
+            _render_request(
+                commands, output_path, width, height, ray, False, None, **params
+            )
+        )
 
     if result.get("status") == "success":
-        # Wait briefly for file to be written
-        time.sleep(0.2)
-        if output_path.exists():
-            return str(output_path)
+        # The plugin saves a PNG instead when it cannot encode the format
+        saved = Path(result.get("path", output_path))
+        if saved.exists():
+            scratch_store().add(saved)
+            return str(saved)
         else:
-            raise RuntimeError(f"Image was not saved to {output_path}")
+            raise RuntimeError(f"Image was not saved to {saved}")
     else:
         raise RuntimeError(f"PyMOL error: {result.get('error', 'Unknown error')}")
 
 
-def quick_view(port: int = DEFAULT_PORT) -> str:
+def quick_view(port: int = DEFAULT_PORT, host: str = DEFAULT_HOST) -> str:
     """
     Take a quick snapshot of the current PyMOL view.
 
     Returns:
         Path to the saved image
     """
-    return pymol_view("pass", name=None, port=port)
+    return pymol_view("pass", name=None, port=port, host=host)
@@ -0,0 +1,49 @@
+"""
+Fixtures shared by the tests that run against the stub PyMOL server.
+
+Modules seed the scene they need by overriding ``server``, e.g.
+
+    @pytest.fixture
+    def server(server):
+        server.fake_cmd.fragment("ala")
+        return server
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.connection import PyMOLConnection  # noqa: E402
+from claudemol.session import PyMOLSession  # noqa: E402
+from claudemol.testing import FakeCmd, stub_server  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """Run a stub PyMOL server on a free port."""
+    with stub_server(FakeCmd()) as s:
+        yield s
+
+
+@pytest.fixture
+def conn(server):
+    """Connection to the stub server."""
+    c = PyMOLConnection(port=server.port)
+    c.connect()
+    yield c
+    c.disconnect()
+
+
+@pytest.fixture
+def session(server):
+    """PyMOLSession attached to the stub server."""
+    s = PyMOLSession(port=server.port)
+    s.start()
+    yield s
+    s.stop()
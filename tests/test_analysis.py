@@ -0,0 +1,196 @@
+"""
+Tests for the analysis handlers, run against the stub PyMOL server.
+
+Run with: python -m pytest tests/test_analysis.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+np = pytest.importorskip("numpy")
+
+from claudemol.analysis import (  # noqa: E402
+    ensemble,
+    interface,
+    nearest,
+    residue_contacts,
+    within,
+)
+
+RNG = np.random.default_rng(0)
+PROTEIN = RNG.uniform(0, 40, size=(2000, 3)).astype(np.float32)
+LIGANDS = [RNG.uniform(10, 30, size=(12, 3)).astype(np.float32) for _ in range(3)]
+
+
+@pytest.fixture
+def server(server):
+    server.fake_cmd.objects["prot"] = {"states": [[tuple(x) for x in PROTEIN]]}
+    for i, ligand in enumerate(LIGANDS):
+        server.fake_cmd.objects[f"lig{i}"] = {"states": [[tuple(x) for x in ligand]]}
+    return server
+
+
+def brute_force(points, radius):
+    d = np.linalg.norm(PROTEIN[:, None, :] - points[None, :, :], axis=2)
+    return np.nonzero(d.min(axis=1) <= radius)[0] + 1, d
+
+
+class TestSpatialQueries:
+    """Test the cached spatial index."""
+
+    def test_within_matches_brute_force(self, conn):
+        hits = within(conn, "lig0", target="prot", radius=4.0)
+        expected, _ = brute_force(LIGANDS[0], 4.0)
+        assert hits["index"].tolist() == expected.tolist()
+        assert set(hits["model"]) == {"prot"}
+        assert (hits["distance"] <= 4.0).all()
+
+    def test_large_radius_spans_several_cells(self, conn):
+        hits = within(conn, "lig1", target="prot", radius=12.0)
+        expected, _ = brute_force(LIGANDS[1], 12.0)
+        assert hits["index"].tolist() == expected.tolist()
+
+    def test_batched_queries(self, conn):
+        results = within(conn, ["lig0", "lig1", "lig2"], target="prot", radius=5.0)
+        for hits, ligand in zip(results, LIGANDS):
+            expected, _ = brute_force(ligand, 5.0)
+            assert hits["index"].tolist() == expected.tolist()
+
+    def test_nearest(self, conn):
+        result = nearest(conn, "lig2", target="prot", k=3)
+        _, d = brute_force(LIGANDS[2], 0.0)
+        expected = np.sort(d, axis=0)[:3].T
+        assert result["index"].shape == (12, 3)
+        np.testing.assert_allclose(result["distance"], expected, rtol=1e-5)
+
+    def test_residue_contacts(self, conn):
+        residues = residue_contacts(conn, "lig0", target="prot", radius=4.0)
+        expected, _ = brute_force(LIGANDS[0], 4.0)
+        assert sorted(int(r["resi"]) for r in residues) == expected.tolist()
+        assert {r["chain"] for r in residues} == {"A"}
+
+    def test_index_is_cached_until_coordinates_change(self, conn, server):
+        within(conn, "lig0", target="prot")
+        assert "index_build_ms" in conn.last_timings["server"]
+        within(conn, "lig1", target="prot")
+        assert "index_build_ms" not in conn.last_timings["server"]
+
+        states = server.fake_cmd.objects["prot"]["states"]
+        states[0] = [(x + 100.0, y, z) for x, y, z in states[0]]
+        assert within(conn, "lig0", target="prot")["index"].size == 0
+        assert "index_build_ms" in conn.last_timings["server"]
+
+    def test_empty_selection_is_an_error(self, conn):
+        with pytest.raises(RuntimeError, match="No atoms"):
+            within(conn, "missing", target="prot")
+
+
+class TestInterface:
+    """Test interface analysis."""
+
+    def test_contact_map(self, conn):
+        result = interface(conn, "lig0", "prot", cutoff=4.0, area=False)
+        expected, d = brute_force(LIGANDS[0], 4.0)
+        assert [int(r["resi"]) for r in result["residues2"]] == expected.tolist()
+        assert result["counts"].shape == (
+            len(result["residues1"]),
+            len(result["residues2"]),
+        )
+        assert result["counts"].sum() == result["atom_contacts"]
+        assert result["atom_contacts"] == int((d <= 4.0).sum())
+        np.testing.assert_allclose(
+            result["min_distance"].min(axis=0), d[expected - 1].min(axis=1), rtol=1e-5
+        )
+
+    def test_result_is_cached_per_coordinates(self, conn, server):
+        interface(conn, "lig0", "prot", area=False)
+        assert "cache_hit" not in conn.last_timings["server"]
+        interface(conn, "lig0", "prot", area=False)
+        assert conn.last_timings["server"]["cache_hit"] == 1
+
+        states = server.fake_cmd.objects["lig0"]["states"]
+        states[0] = [(x, y, z + 0.5) for x, y, z in states[0]]
+        interface(conn, "lig0", "prot", area=False)
+        assert "cache_hit" not in conn.last_timings["server"]
+
+
+def rotation(rng):
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    return q if np.linalg.det(q) > 0 else -q
+
+
+def models(server, name, states):
+    server.fake_cmd.objects[name] = {
+        "states": [[tuple(map(float, x)) for x in state] for state in states]
+    }
+
+
+class TestEnsemble:
+    """Test RMSD, RMSF and clustering over object states."""
+
+    # Two conformations, the second with atoms 0-9 moved; five noisy,
+    # randomly placed copies of each
+    BASE = PROTEIN[:50].astype(np.float64)
+    OTHER = BASE + np.where(np.arange(50)[:, None] < 10, 3.0, 0.0)
+
+    def ensemble_states(self, noise=0.1):
+        rng = np.random.default_rng(1)
+        return [
+            (conformation + rng.normal(scale=noise, size=(50, 3))) @ rotation(rng)
+            + rng.uniform(-20, 20, 3)
+            for conformation in [self.BASE] * 5 + [self.OTHER] * 5
+        ]
+
+    def test_superposition_removes_rigid_motion(self, conn, server):
+        rng = np.random.default_rng(2)
+        models(server, "rigid", [self.BASE @ rotation(rng) + 5 for _ in range(4)])
+        result = ensemble(conn, "rigid")
+        assert result["states"] == 4 and result["atoms"] == 50
+        np.testing.assert_allclose(result["rmsd"], 0, atol=1e-3)
+        np.testing.assert_allclose(result["rmsf"], 0, atol=1e-3)
+        assert (ensemble(conn, "rigid", fit=False)["rmsd"][1:] > 1).all()
+
+    def test_rmsd_and_rmsf(self, conn, server):
+        models(server, "nmr", self.ensemble_states())
+        result = ensemble(conn, "nmr", reference=2)
+        assert result["rmsd"][1] == pytest.approx(0, abs=1e-3)
+        assert result["rmsd"][:5].max() < 0.3 < 1.0 < result["rmsd"][5:].min()
+        # The moved atoms fluctuate most
+        assert result["rmsf"][:10].min() > 2 * result["rmsf"][10:].max()
+        assert result["model"].tolist() == ["nmr"] * 50
+        assert result["index"].tolist() == list(range(1, 51))
+
+    def test_clusters(self, conn, server):
+        models(server, "nmr", self.ensemble_states())
+        result = ensemble(conn, "nmr", cluster=1.0)
+        assert result["clusters"].tolist() in ([0] * 5 + [1] * 5, [1] * 5 + [0] * 5)
+        assert sorted(c > 5 for c in result["centers"]) == [False, True]
+        pairwise = result["pairwise"]
+        assert pairwise.shape == (10, 10)
+        np.testing.assert_allclose(pairwise, pairwise.T, atol=1e-3)
+        np.testing.assert_allclose(pairwise[0], result["rmsd"], atol=1e-3)
+
+    def test_b_factors_and_cache(self, conn, server):
+        models(server, "nmr", self.ensemble_states())
+        result = ensemble(conn, "nmr", b_factors=True)
+        np.testing.assert_allclose(
+            server.fake_cmd.objects["nmr"]["b"], result["rmsf"], rtol=1e-6
+        )
+        ensemble(conn, "nmr")
+        assert conn.last_timings["server"]["cache_hit"] == 1
+
+    def test_states_must_match(self, conn, server):
+        models(server, "a", [self.BASE, self.BASE])
+        models(server, "b", [self.BASE])
+        with pytest.raises(RuntimeError, match="same atoms"):
+            ensemble(conn, "all")
+        with pytest.raises(RuntimeError, match="Reference state"):
+            ensemble(conn, "a", reference=3)
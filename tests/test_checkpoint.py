@@ -0,0 +1,86 @@
+"""
+Tests for session checkpoints, run against the stub PyMOL server.
+
+Run with: python -m pytest tests/test_checkpoint.py -v
+"""
+
+import os
+import sys
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.checkpoint import Checkpoint, CheckpointStore
+
+
+class TestCheckpointStore:
+    """Test the bounded checkpoint store."""
+
+    def test_keeps_most_recent(self):
+        store = CheckpointStore(keep=2)
+        for i in range(4):
+            store.add(Checkpoint(b"x", "zlib", serial=i))
+        assert len(store) == 2
+        assert store.latest().serial == 3
+
+    def test_byte_budget_keeps_newest(self):
+        store = CheckpointStore(keep=10, max_bytes=100)
+        store.add(Checkpoint(b"x" * 60, "zlib", serial=1))
+        store.add(Checkpoint(b"x" * 200, "zlib", serial=2))
+        assert len(store) == 1
+        assert store.latest().serial == 2
+
+    def test_latest_survives_on_disk(self, tmp_path):
+        path = tmp_path / "scene.ckpt"
+        CheckpointStore(path=path).add(Checkpoint(b"data", "zlib", serial=7))
+        latest = CheckpointStore(path=path).latest()
+        assert latest.data == b"data"
+        assert latest.serial == 7
+
+
+class TestSessionCheckpoints:
+    """Test checkpoint and restore through a session."""
+
+    def test_execute_takes_checkpoint(self, session):
+        session.execute("cmd.fragment('ala')")
+        session.wait_for_checkpoint()
+        assert len(session.checkpoints) == 1
+
+    def test_queries_take_no_checkpoint(self, session):
+        session.checkpoint_interval = 0.0
+        session.execute("cmd.fragment('ala')")
+        session.wait_for_checkpoint()
+        session.execute("print(cmd.count_atoms('all'))")
+        assert session.is_healthy()
+        session.wait_for_checkpoint()
+        assert len(session.checkpoints) == 1
+
+    def test_unchanged_scene_is_not_snapshotted(self, session):
+        session.execute("cmd.fragment('ala')")
+        session.wait_for_checkpoint()
+        assert session.checkpoint() is None
+        assert session.checkpoint(force=True) is not None
+
+    def test_interval_limits_checkpoints(self, session):
+        session.checkpoint_interval = 60.0
+        session.execute("cmd.fragment('ala')")
+        session.wait_for_checkpoint()
+        session.execute("cmd.fragment('gly')")
+        session.wait_for_checkpoint()
+        assert len(session.checkpoints) == 1
+
+    def test_restore_brings_scene_back(self, session, server):
+        session.execute("cmd.fragment('ala')\ncmd.set('cartoon_color', 'red')")
+        session.wait_for_checkpoint()
+        server.fake_cmd.reinitialize()
+        assert server.fake_cmd.get_names() == []
+
+        report = session.restore()
+        assert server.fake_cmd.get_names() == ["ala"]
+        assert server.fake_cmd.get("cartoon_color") == "red"
+        assert report["restore_ms"] > 0
+        assert session.last_restore is report
+        # The restored scene is what the checkpoint holds
+        assert session.checkpoint() is None
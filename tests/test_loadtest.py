@@ -0,0 +1,48 @@
+"""
+Tests for the load-test harness, run against the stub PyMOL server.
+
+Run with: python -m pytest tests/test_loadtest.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+pytest.importorskip("numpy")
+
+from claudemol.loadtest import parse_mix, run_loadtest  # noqa: E402
+
+
+class TestLoadTest:
+    """Test concurrent clients against the stub plugin."""
+
+    def test_report(self):
+        report = run_loadtest(
+            stub=True, clients=4, duration=1.0, interval=0.5, atoms=200
+        )
+        assert report["requests"] > 0
+        assert report["errors"] == 0 and report["dropped"] == 0
+        assert set(report["latency"]) <= {"tiny", "query", "render"}
+        assert report["latency"]["tiny"]["count"] > 0
+        assert "interactive" in report["server"]
+        assert [row["t"] for row in report["timeline"]] == [0.5, 1.0]
+        assert report["timeline"][-1]["rss_mb"] > 0
+
+    def test_mix_selects_request_kinds(self):
+        report = run_loadtest(
+            stub=True, clients=2, duration=0.5, mix={"query": 1}, atoms=50
+        )
+        assert list(report["latency"]) == ["query"]
+
+    def test_parse_mix(self):
+        assert parse_mix("tiny=3, render") == {"tiny": 3.0, "render": 1.0}
+        with pytest.raises(ValueError, match="Unknown"):
+            parse_mix("huge=1")
+        with pytest.raises(ValueError, match="positive"):
+            parse_mix("tiny=0")
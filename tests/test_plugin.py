@@ -0,0 +1,818 @@
+"""
+Tests for the socket plugin, run against a fake pymol.cmd.
+
+These do not need PyMOL installed.
+
+Run with: python -m pytest tests/test_plugin.py -v
+"""
+
+import gzip
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.connection import ConnectionPool, PyMOLConnection, get_pool
+
+
+class TestExecute:
+    """Test code execution through the plugin."""
+
+    def test_print_output(self, conn):
+        assert conn.execute("print('hello')") == "hello\n"
+
+    def test_result_variable(self, conn):
+        assert conn.execute("_result = 6 * 7") == "42"
+
+    def test_runs_against_cmd(self, conn, server):
+        conn.execute("cmd.fragment('ala')")
+        assert server.fake_cmd.get_names() == ["ala"]
+
+    def test_error_is_raised(self, conn):
+        with pytest.raises(RuntimeError, match="boom"):
+            conn.execute("raise ValueError('boom')")
+
+    def test_only_scene_changes_bump_serial(self, conn, server):
+        conn.execute("cmd.fragment('ala')")
+        serial = server.scene_serial
+        conn.execute("print('ping')")
+        conn.execute("_result = [cmd.count_atoms(n) for n in cmd.get_names()]")
+        assert server.scene_serial == serial
+        for code in (
+            "cmd.color('red', 'ala')",
+            "f = getattr(cmd, 'delete')",
+            "from pymol import cmd as c",
+            "exec('x = 1')",
+        ):
+            conn.execute(code)
+            assert server.scene_serial == serial + 1, code
+            serial = server.scene_serial
+
+    def test_unknown_type(self, conn):
+        result = conn.request({"type": "nonsense"})
+        assert result["status"] == "error"
+        assert "Unknown command type" in result["error"]
+
+
+class TestTimings:
+    """Test server and client timing instrumentation."""
+
+    def test_response_carries_server_timings(self, conn):
+        conn.execute("x = 1")
+        server = conn.last_timings["server"]
+        for field in ("queue_ms", "compile_ms", "exec_ms", "serialize_ms"):
+            assert server[field] >= 0
+        assert server["bytes_in"] > 0
+        assert server["bytes_out"] > 0
+
+    def test_client_timings(self, conn):
+        conn.execute("x = 1")
+        for field in ("send_ms", "wait_ms", "decode_ms", "total_ms"):
+            assert conn.last_timings[field] >= 0
+
+    def test_server_stats(self, conn):
+        for _ in range(3):
+            conn.execute("pass")
+        result = conn.get_server_stats(reset=True)
+        assert len(result["samples"]["execute"]) == 3
+        assert "execute" not in conn.get_server_stats()["samples"]
+
+
+class TestProtocol:
+    """Test framed protocol negotiation and compression."""
+
+    def test_negotiates_framed_protocol(self, conn):
+        assert conn.framed
+        assert "execute" in conn.capabilities
+        assert conn.codec == "none"  # loopback: no compression by default
+
+    def test_legacy_client_still_works(self, server):
+        with socket.create_connection(("localhost", server.port)) as s:
+            s.sendall(json.dumps({"type": "execute", "code": "print(1)"}).encode())
+            response = json.loads(s.recv(65536).decode())
+        assert response["status"] == "success"
+        assert response["output"] == "1\n"
+
+    def test_large_payloads_are_compressed(self, server):
+        conn = PyMOLConnection(
+            port=server.port, compression="zlib", compress_threshold=1024
+        )
+        conn.connect()
+        try:
+            code = "_result = 'x' * 200000  # " + "y" * 5000
+            assert len(conn.execute(code)) == 200000
+            timings = conn.last_timings
+            assert timings["codec"] == "zlib"
+            assert timings["wire_bytes_in"] < timings["bytes_in"] / 10
+            assert timings["wire_bytes_out"] < timings["bytes_out"]
+            sample = conn.get_server_stats()["samples"]["execute"][-1]
+            assert sample["wire_bytes_out"] < sample["bytes_out"]
+            assert sample["compress_ms"] >= 0
+        finally:
+            conn.disconnect()
+
+    def test_small_payloads_are_not_compressed(self, server):
+        conn = PyMOLConnection(port=server.port, compression="zlib")
+        conn.connect()
+        try:
+            conn.execute("_result = 'x' * 100")
+            assert conn.last_timings["wire_bytes_in"] > conn.last_timings["bytes_in"]
+        finally:
+            conn.disconnect()
+
+
+class TestSharedMemory:
+    """Test the same-host shared memory fast path for large blobs."""
+
+    @pytest.fixture
+    def shm_dir(self, tmp_path, monkeypatch):
+        import claudemol.connection
+
+        monkeypatch.setattr(claudemol.connection, "SHM_DIR", str(tmp_path))
+        return tmp_path
+
+    @pytest.fixture
+    def shm_conn(self, server, shm_dir):
+        c = PyMOLConnection(port=server.port)
+        c.connect()
+        yield c
+        c.disconnect()
+
+    def test_negotiated_on_loopback(self, shm_conn, shm_dir):
+        assert shm_conn.shm_dir == str(shm_dir)
+        assert list(shm_dir.iterdir()) == []  # probe removed
+
+    def test_off(self, server, shm_dir):
+        conn = PyMOLConnection(port=server.port, shared_memory="off")
+        conn.connect()
+        try:
+            assert conn.shm_dir is None
+        finally:
+            conn.disconnect()
+
+    def test_large_request_skips_socket(self, shm_conn, server, shm_dir):
+        pdb = "".join(PDB.splitlines(keepends=True)[:1] * 20000)
+        assert shm_conn.load_bytes("big", pdb.encode(), "pdb")["atoms"] == 20000
+        assert shm_conn.last_timings["bytes_out"] > len(pdb)
+        assert shm_conn.last_timings["wire_bytes_out"] < 4096
+        assert list(shm_dir.iterdir()) == []
+
+    def test_large_response_is_mapped(self, shm_conn, server, shm_dir):
+        import mmap
+        import random
+
+        rng = random.Random(0)
+        coords = [(rng.random(), rng.random(), rng.random()) for _ in range(100000)]
+        server.fake_cmd.objects["big"] = {"states": [coords]}
+        result = shm_conn.request({"type": "checkpoint"})
+        assert isinstance(result["_blob"], mmap.mmap)
+        assert shm_conn.last_timings["wire_bytes_in"] < 4096
+        # Receiver unlinked it on arrival; restoring reads the mapping
+        assert list(shm_dir.iterdir()) == []
+        restored = shm_conn.request(
+            {"type": "restore", "codec": result["codec"]}, blob=result["_blob"]
+        )
+        assert restored["status"] == "success"
+        assert server.fake_cmd.objects["big"]["states"][0] == coords
+
+    def test_segment_outside_protocol_is_rejected(self, shm_conn, shm_dir):
+        victim = shm_dir / "victim"
+        victim.write_bytes(b"keep")
+        with pytest.raises((ConnectionError, OSError)):
+            shm_conn.request(
+                {"type": "upload", "files": [], "_shm": {"name": "victim", "size": 4}}
+            )
+        assert victim.read_bytes() == b"keep"
+
+
+class TestRender:
+    """Test the render endpoint and progressive rendering."""
+
+    def test_render_writes_image(self, conn, server, tmp_path):
+        path = tmp_path / "out.png"
+        result = conn.request(
+            {
+                "type": "render",
+                "code": "cmd.fragment('ala')",
+                "path": str(path),
+                "width": 64,
+                "height": 48,
+            }
+        )
+        assert result["status"] == "success"
+        assert result["stage"] == "final"
+        assert path.read_bytes().startswith(b"\x89PNG")
+        assert server.fake_cmd.get_names() == ["ala"]
+
+    def test_progressive_streams_preview_first(self, conn, tmp_path):
+        path = tmp_path / "out.png"
+        request = {
+            "type": "render",
+            "path": str(path),
+            "width": 800,
+            "height": 600,
+            "progressive": True,
+        }
+        results = list(conn.request_stream(request))
+        assert [r["stage"] for r in results[:-1]] == ["preview", "full"]
+        assert results[0]["width"] < 800
+        assert not results[0]["final"]
+        assert results[-1]["final"]
+        assert [s["stage"] for s in results[-1]["stages"]] == [
+            "preview",
+            "full",
+            "antialiased",
+        ]
+        assert path.exists()
+        assert not list(tmp_path.glob("*.partial*"))
+
+    def test_budget_limits_refinement(self, server, conn, tmp_path):
+        server.fake_cmd.ray_seconds_per_mpixel = 2.0
+        request = {
+            "type": "render",
+            "path": str(tmp_path / "out.png"),
+            "width": 800,
+            "height": 600,
+            "progressive": True,
+            "budget_s": 0.5,
+        }
+        final = list(conn.request_stream(request))[-1]
+        assert [s["stage"] for s in final["stages"]] == ["preview"]
+
+    def test_budget_checked_after_drawn_preview(
+        self, server, conn, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr("claudemol.plugin._has_gui", lambda: True)
+        monkeypatch.setenv("CLAUDEMOL_RENDER_MODEL", str(tmp_path / "model.json"))
+        server.fake_cmd.ray_seconds_per_mpixel = 2.0
+        request = {
+            "type": "render",
+            "path": str(tmp_path / "out.png"),
+            "width": 800,
+            "height": 600,
+            "progressive": True,
+            "budget_s": 0.5,
+        }
+        final = list(conn.request_stream(request))[-1]
+        assert [(s["stage"], s["mode"]) for s in final["stages"]] == [
+            ("preview", "draw")
+        ]
+        assert final["timings"]["probe_ms"] > 0
+
+        # A calibrated host predicts from its render model instead
+        server.fake_cmd.ray_seconds_per_mpixel = 0.0
+        server.render_model.calibration = {
+            "setup": 0.0,
+            "per_pixel": 1e-9,
+            "antialias": {"0": 1.0},
+            "no_shadow": 1.0,
+        }
+        final = list(conn.request_stream(request))[-1]
+        assert len(final["stages"]) == 3
+        assert "probe_ms" not in final["timings"]
+
+    def test_legacy_client_gets_final_result(self, server, tmp_path):
+        path = tmp_path / "out.png"
+        request = {
+            "type": "render",
+            "path": str(path),
+            "progressive": True,
+            "width": 64,
+            "height": 48,
+        }
+        with socket.create_connection(("localhost", server.port)) as s:
+            s.sendall(json.dumps(request).encode())
+            response = json.loads(s.recv(65536).decode())
+        assert response["final"]
+        assert response["stage"] == "antialiased"
+
+    def test_quality_level_sets_and_restores_settings(
+        self, server, conn, tmp_path, monkeypatch
+    ):
+        model = tmp_path / "render_model.json"
+        monkeypatch.setenv("CLAUDEMOL_RENDER_MODEL", str(model))
+        server.fake_cmd.set("ray_shadow", "on")
+        request = {
+            "type": "render",
+            "path": str(tmp_path / "out.png"),
+            "width": 64,
+            "height": 48,
+            "quality": "draft",
+        }
+        result = conn.request(request)
+        assert result["status"] == "success"
+        plan = result["plan"]
+        assert (plan["antialias"], plan["ray_shadow"]) == (0, False)
+        assert plan["max_threads"] >= 1
+        assert "actual_s" in plan and "predicted_s" in plan
+        assert server.fake_cmd.get("ray_shadow") == "on"
+        assert "calibration" in next(iter(json.loads(model.read_text()).values()))
+
+    def test_target_picks_best_quality_that_fits(
+        self, server, conn, tmp_path, monkeypatch
+    ):
+        monkeypatch.setenv("CLAUDEMOL_RENDER_MODEL", str(tmp_path / "model.json"))
+        server.fake_cmd.ray_seconds_per_mpixel = 1.0
+        request = {
+            "type": "render",
+            "path": str(tmp_path / "out.png"),
+            "width": 400,
+            "height": 300,
+            "target_s": 0.2,
+        }
+        plan = conn.request(request)["plan"]
+        # 0.12 s per pass: only the single-pass settings fit
+        assert plan["antialias"] == 0 and plan["ray_shadow"]
+        assert plan["predicted_s"] == pytest.approx(plan["actual_s"], abs=0.05)
+        assert "calibrate_ms" in conn.last_timings["server"]
+
+        plan = conn.request(dict(request, target_s=1.0))["plan"]
+        assert plan["antialias"] == 2
+        assert "calibrate_ms" not in conn.last_timings["server"]
+
+    def test_compact_image(self, conn, tmp_path):
+        pytest.importorskip("PIL")
+        path = tmp_path / "out.webp"
+        request = {
+            "type": "render",
+            "path": str(path),
+            "width": 800,
+            "height": 600,
+            "format": "webp",
+            "max_dim": 512,
+            "image_quality": "low",
+        }
+        result = conn.request(request)
+        assert result["status"] == "success"
+        assert (result["stages"][-1]["width"], result["stages"][-1]["height"]) == (
+            512,
+            384,
+        )
+        assert result["format"] == "webp"
+        assert path.read_bytes()[:4] == b"RIFF"
+        assert result["bytes"] == path.stat().st_size
+        assert "encode_ms" in conn.last_timings["server"]
+        assert [p.name for p in tmp_path.iterdir()] == ["out.webp"]
+
+    def test_encoding_runs_off_the_executor(self, conn, server, tmp_path, monkeypatch):
+        pytest.importorskip("PIL")
+        plugin = sys.modules[type(server).__module__]
+        encode = plugin._encode_image
+
+        def slow_encode(*args):
+            time.sleep(0.5)
+            return encode(*args)
+
+        monkeypatch.setattr(plugin, "_encode_image", slow_encode)
+        request = {"type": "render", "path": str(tmp_path / "a.jpg"), "format": "jpeg"}
+        render = threading.Thread(target=conn.request, args=(request,))
+        render.start()
+        time.sleep(0.1)
+        other = PyMOLConnection(port=server.port)
+        other.connect()
+        try:
+            start = time.perf_counter()
+            other.execute("print(1)")
+            assert time.perf_counter() - start < 0.3
+        finally:
+            other.disconnect()
+        render.join()
+        assert (tmp_path / "a.jpg").read_bytes()[:2] == b"\xff\xd8"
+
+
+PDB = "".join(
+    f"ATOM  {i:5d}  CA  ALA A{i:4d}    {i:8.3f}{0:8.3f}{0:8.3f}"
+    "  1.00  0.00           C\n"
+    for i in range(1, 6)
+)
+
+
+class TestUpload:
+    """Test loading structures from bytes."""
+
+    def test_load_bytes(self, conn, server):
+        loaded = conn.load_bytes("model", PDB.encode(), "pdb")
+        assert loaded == {"name": "model", "atoms": 5, "states": 1}
+        assert server.fake_cmd.objects["model"]["states"][0][4] == (5.0, 0.0, 0.0)
+
+    def test_batch_with_gzip(self, conn, server):
+        loaded = conn.load_many(
+            [("plain", PDB, "pdb"), ("packed", gzip.compress(PDB.encode()), "pdb")]
+        )
+        assert [entry["name"] for entry in loaded] == ["plain", "packed"]
+        assert server.fake_cmd.count_atoms("packed") == 5
+
+    def test_size_mismatch_is_an_error(self, conn):
+        result = conn.request(
+            {"type": "upload", "files": [{"name": "x", "size": 10}]}, blob=b"abc"
+        )
+        assert result["status"] == "error"
+
+
+class TestCursors:
+    """Test paged results through cursors."""
+
+    def test_pages_through_rows(self, conn):
+        rows = list(conn.iter_rows("_cursor = ((i, i * i) for i in range(2500))"))
+        assert len(rows) == 2500
+        assert rows[-1] == [2499, 2499 * 2499]
+        assert conn.stats.summary()["fetch"]["total_ms"]["count"] == 3
+
+    def test_early_exit_closes_cursor(self, conn, server):
+        rows = conn.iter_rows("_cursor = iter(range(10**9))", page_size=10)
+        assert next(rows) == 0
+        rows.close()
+        assert server.cursors == {}
+
+    def test_rows_are_generated_lazily(self, conn):
+        result = conn.request(
+            {"type": "execute", "code": "_cursor = (i for i in range(10**9))"}
+        )
+        page = conn.request({"type": "fetch", "cursor": result["cursor"], "size": 5})
+        assert page["rows"] == [0, 1, 2, 3, 4]
+        assert page["done"] is False
+
+    def test_idle_cursor_expires(self, conn, server, monkeypatch):
+        result = conn.request({"type": "execute", "code": "_cursor = range(10)"})
+        monkeypatch.setattr("claudemol.plugin.CURSOR_TTL", 0.0)
+        page = conn.request({"type": "fetch", "cursor": result["cursor"]})
+        assert page["status"] == "error"
+        assert "expired" in page["error"]
+
+    def test_code_without_cursor(self, conn):
+        with pytest.raises(RuntimeError, match="No cursor"):
+            list(conn.iter_rows("x = 1"))
+
+
+class TestReplay:
+    """Test that retried request ids are answered without running again."""
+
+    def test_same_id_is_replayed(self, conn, server):
+        message = {"type": "execute", "code": "print('hi')", "request_id": "abc"}
+        first = conn.request(dict(message))
+        serial = server.scene_serial
+        second = conn.request(dict(message))
+        assert second["output"] == first["output"]
+        assert server.scene_serial == serial
+        assert conn.last_timings["server"]["replayed"] == 1
+
+    def test_retry_after_lost_reply_runs_once(self, conn, server, monkeypatch):
+        request = conn.request
+        calls = []
+
+        def drop_first_reply(message, blob=None):
+            result = request(message, blob)
+            calls.append(message["request_id"])
+            if len(calls) == 1:
+                conn.disconnect()
+                raise ConnectionError("reply lost")
+            return result
+
+        monkeypatch.setattr(conn, "request", drop_first_reply)
+        serial = server.scene_serial
+        assert conn.execute("cmd.fragment('ala')\nprint('once')") == "once\n"
+        assert server.scene_serial == serial + 1
+        assert calls[0] == calls[1]
+
+    def test_large_output_is_not_kept(self, conn, server, monkeypatch):
+        monkeypatch.setattr("claudemol.plugin.REPLAY_MAX_ENTRY", 1000)
+        message = {"type": "execute", "code": "_result = 'x' * 5000"}
+        assert len(conn.request(dict(message, request_id="big"))["output"]) == 5000
+        retry = conn.request(dict(message, request_id="big"))
+        assert retry["status"] == "error"
+        assert "too large" in retry["error"]
+        assert server._reply_bytes < 1000
+
+    def test_bounded_by_total_bytes(self, conn, server, monkeypatch):
+        monkeypatch.setattr("claudemol.plugin.REPLAY_MAX_BYTES", 2500)
+        for i in range(5):
+            conn.request(
+                {"type": "execute", "code": "_result = 'x' * 1000", "request_id": i}
+            )
+        assert list(server.replies) == [3, 4]
+        assert server._reply_bytes <= 2500
+
+
+class TestProfile:
+    """Test profiling of executed code."""
+
+    CODE = "def work():\n    return sum(range(10000))\nwork()"
+
+    def test_off_by_default(self, conn):
+        conn.execute(self.CODE)
+        assert conn.get_profile()["keys"] == []
+
+    def test_profile_per_procedure(self, conn):
+        conn.execute(self.CODE, profile="summing")
+        conn.execute(self.CODE, profile="summing")
+        report = conn.get_profile(top=5)
+        assert [(k["key"], k["runs"]) for k in report["keys"]] == [("summing", 2)]
+        assert any("(work)" in row["function"] for row in report["functions"])
+        assert len(report["functions"]) <= 5
+
+    def test_enable_profiles_by_code_hash(self, conn):
+        conn.get_profile(enable=True)
+        conn.execute(self.CODE)
+        conn.execute("print('other')")
+        report = conn.get_profile(reset=True)
+        assert report["enabled"] is True
+        assert len(report["keys"]) == 2
+        assert report["keys"][0]["key"].startswith("code:")
+        assert report["keys"][0]["label"] == "def work():"
+        assert conn.get_profile()["keys"] == []
+
+
+class TestMemory:
+    """Test memory reports and LRU eviction."""
+
+    @pytest.fixture
+    def over_budget(self, conn, monkeypatch):
+        """Three 10-atom objects, then RSS just over a 1 MB budget: enough
+        excess to evict two of them."""
+        for name in ("ala", "gly", "ser"):
+            conn.execute(f"cmd.fragment('{name}')")
+        budget = 1024 * 1024
+        monkeypatch.setattr("claudemol.plugin._rss_bytes", lambda: budget + 20000)
+        return budget
+
+    def test_report(self, conn):
+        conn.execute("cmd.fragment('ala')")
+        report = conn.get_memory()
+        assert report["rss_bytes"] > 0
+        assert report["budget_bytes"] is None
+        assert [(o["name"], o["atoms"], o["states"]) for o in report["objects"]] == [
+            ("ala", 10, 1)
+        ]
+
+    def test_evicts_least_recently_used(self, conn, server, over_budget):
+        conn.execute("cmd.count_atoms('ala')")
+        report = conn.get_memory(budget_mb=1)
+        assert conn.last_timings["server"]["evicted"] == 2
+        assert server.fake_cmd.get_names() == ["ala"]
+        assert [o["name"] for o in report["objects"]] == ["ala"]
+        assert [o["name"] for o in report["evicted"]] == ["gly", "ser"]
+        assert not any(o["saved"] for o in report["evicted"])
+
+    def test_spilled_object_reloads_on_use(self, conn, server, over_budget, tmp_path):
+        conn.get_memory(budget_mb=1, spill_dir=tmp_path)
+        assert server.fake_cmd.get_names() == ["ser"]
+        assert len(list(tmp_path.iterdir())) == 2
+
+        assert conn.execute("print(cmd.count_atoms('ala'))") == "10\n"
+        assert "reload_ms" in conn.last_timings["server"]
+        assert sorted(server.fake_cmd.get_names()) == ["ala", "ser"]
+        assert [o["name"] for o in conn.get_memory()["evicted"]] == ["gly"]
+
+    def test_replaced_object_is_not_reloaded(self, conn, server, over_budget, tmp_path):
+        spill = tmp_path / "spill"
+        conn.get_memory(budget_mb=1, spill_dir=spill)
+        structure = tmp_path / "new.pdb"
+        structure.write_text(PDB)
+
+        # Loading into an existing object appends a state; the evicted ala
+        # must not be brought back underneath the new one
+        conn.execute(f"cmd.load({str(structure)!r}, 'ala')\ncmd.delete('gly')")
+        assert "reload_ms" not in conn.last_timings["server"]
+        assert len(server.fake_cmd.objects["ala"]["states"]) == 1
+        assert sorted(server.fake_cmd.get_names()) == ["ala", "ser"]
+        assert conn.get_memory()["evicted"] == []
+        assert list(spill.iterdir()) == []
+
+    def test_reload_does_not_evict_others(self, conn, server, monkeypatch, tmp_path):
+        for name in ("ala", "gly", "ser", "cys"):
+            conn.execute(f"cmd.fragment('{name}')")
+        budget = 1024 * 1024
+        rss = [budget + 20000]
+        monkeypatch.setattr("claudemol.plugin._rss_bytes", lambda: rss[0])
+        conn.get_memory(budget_mb=1, spill_dir=tmp_path)
+        assert server.fake_cmd.get_names() == ["ser", "cys"]
+
+        # The reload grows RSS a little; ser and cys stay
+        rss[0] += 5000
+        conn.execute("print(cmd.count_atoms('ala'))")
+        assert sorted(server.fake_cmd.get_names()) == ["ala", "cys", "ser"]
+
+        # New work evicts only for its own growth
+        rss[0] += 10000
+        conn.execute("cmd.fragment('thr')")
+        assert conn.last_timings["server"]["evicted"] == 1
+        assert sorted(server.fake_cmd.get_names()) == ["ala", "cys", "thr"]
+
+
+class TestScheduling:
+    """Test concurrent clients and priority classes."""
+
+    def test_clients_are_served_concurrently(self, conn, server):
+        other = PyMOLConnection(port=server.port)
+        other.connect()
+        try:
+            assert other.execute("print('other')") == "other\n"
+            assert conn.execute("print('first')") == "first\n"
+        finally:
+            other.disconnect()
+
+    def test_execute_many(self, conn):
+        outputs = conn.execute_many([f"print({i})" for i in range(3)])
+        assert outputs == ["0\n", "1\n", "2\n"]
+        with pytest.raises(RuntimeError, match="Unit 1"):
+            conn.execute_many(["print(0)", "1 / 0", "print(2)"])
+
+    def test_interactive_runs_between_batch_units(self, conn, server):
+        server.fake_cmd.order = []
+        unit = "import time\ntime.sleep(0.1)\ncmd.order.append('batch')"
+        batch = threading.Thread(target=conn.execute_many, args=([unit] * 6,))
+        batch.start()
+        time.sleep(0.15)
+        other = PyMOLConnection(port=server.port)
+        other.connect()
+        try:
+            start = time.perf_counter()
+            other.execute("cmd.order.append('interactive')")
+            latency = time.perf_counter() - start
+        finally:
+            other.disconnect()
+        batch.join()
+        order = server.fake_cmd.order
+        assert len(order) == 7
+        assert order.index("interactive") < 4
+        assert latency < 0.3
+
+    def test_queue_metrics_per_class(self, conn):
+        conn.execute_many(["print(0)", "print(1)"])
+        conn.execute("print(2)")
+        samples = conn.get_server_stats()["samples"]
+        assert len(samples["queue.batch"]) == 2
+        assert {"queue_ms", "depth"} <= set(samples["queue.interactive"][0])
+
+    def test_unknown_priority(self, conn):
+        result = conn.request({"type": "execute", "code": "1", "priority": "urgent"})
+        assert result["status"] == "error"
+        assert "priority" in result["error"]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+class TestBatch:
+    """Test suspending scene updates for a block of commands."""
+
+    def test_updates_suspended_for_the_block(self, conn, server):
+        settings = server.fake_cmd.settings
+        settings["suspend_updates"] = "off"
+        with conn.batch() as info:
+            conn.execute("cmd.show('surface')")
+            assert settings["suspend_updates"] == 1
+        assert settings["suspend_updates"] == "off"
+        assert info["suspended_ms"] > 0
+
+    def test_nested_across_clients(self, conn, server):
+        settings = server.fake_cmd.settings
+        other = PyMOLConnection(port=server.port)
+        other.connect()
+        try:
+            with conn.batch():
+                with other.batch() as info:
+                    pass
+                assert "suspended_ms" not in info
+                assert settings["suspend_updates"] == 1
+            assert settings["suspend_updates"] == 0
+        finally:
+            other.disconnect()
+
+    def test_ended_when_client_disconnects(self, server):
+        settings = server.fake_cmd.settings
+        other = PyMOLConnection(port=server.port)
+        other.connect()
+        other.request({"type": "suspend", "action": "begin", "id": "abc"})
+        assert settings["suspend_updates"] == 1
+        other.disconnect()
+        assert wait_for(lambda: settings["suspend_updates"] == 0)
+
+    def test_ended_after_timeout(self, conn, server):
+        settings = server.fake_cmd.settings
+        conn.request(
+            {"type": "suspend", "action": "begin", "id": "abc", "timeout": 0.1}
+        )
+        assert settings["suspend_updates"] == 1
+        # Expired by the idle executor, without another request
+        assert wait_for(lambda: settings["suspend_updates"] == 0)
+
+
+class TestConnectionPool:
+    """Test the thread-safe connection pool."""
+
+    def test_threads_get_their_own_connections(self, server):
+        pool = ConnectionPool(port=server.port, max_size=4)
+        outputs = {}
+
+        def work(i):
+            for j in range(20):
+                with pool.connection() as conn:
+                    outputs[(i, j)] = conn.execute(f"_result = {i} * 100 + {j}")
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert outputs == {
+            (i, j): str(i * 100 + j) for i in range(8) for j in range(20)
+        }
+        assert 1 <= pool.size <= 4
+        pool.close()
+        assert pool.size == 0
+
+    def test_same_thread_borrows_the_same_connection(self, server):
+        pool = ConnectionPool(port=server.port)
+        with pool.connection() as outer:
+            with pool.connection() as inner:
+                assert inner is outer
+            assert pool.size == 1 and pool.idle == 0
+        with pool.connection() as again:
+            assert again is outer
+
+    def test_bounded(self, server):
+        pool = ConnectionPool(port=server.port, max_size=1)
+        errors = []
+
+        def borrow():
+            try:
+                with pool.connection(timeout=0.1):
+                    pass
+            except TimeoutError as e:
+                errors.append(e)
+
+        with pool.connection():
+            thread = threading.Thread(target=borrow)
+            thread.start()
+            thread.join()
+        assert len(errors) == 1
+        with pool.connection(timeout=0.1):
+            pass
+
+    def test_broken_connections_are_replaced(self, server):
+        from claudemol.protocol import encode_frame
+
+        pool = ConnectionPool(port=server.port)
+        with pool.connection() as conn:
+            # A request whose response is never read
+            conn.socket.sendall(encode_frame({"type": "execute", "code": "1"})[0])
+            time.sleep(0.2)
+        assert pool.size == 0
+        with pytest.raises(ConnectionError):
+            with pool.connection() as conn:
+                raise ConnectionError("lost")
+        assert pool.size == 0
+        with pool.connection() as conn:
+            first = conn
+            conn.socket.close()
+        assert pool.size == 0
+        with pool.connection() as conn:
+            assert conn is not first
+            assert conn.execute("_result = 1") == "1"
+
+    def test_idle_connections_are_reaped(self, server):
+        pool = ConnectionPool(port=server.port, idle_timeout=0.05)
+        with pool.connection():
+            pass
+        assert pool.idle == 1
+        time.sleep(0.1)
+        pool.reap()
+        assert pool.size == 0
+
+    def test_send_command_reuses_connections(self, server):
+        from claudemol.view import send_command
+
+        for i in range(3):
+            assert send_command(f"_result = {i}", port=server.port)["output"] == str(i)
+        assert get_pool(port=server.port, recv_timeout=120.0).size == 1
+
+    def test_send_command_lost_reply_is_an_error_result(self, server, monkeypatch):
+        from claudemol.view import send_command
+
+        def lose_reply(self, message, blob=None):
+            raise ConnectionError("Communication error: connection reset")
+
+        monkeypatch.setattr(PyMOLConnection, "request", lose_reply)
+        result = send_command("print(1)", port=server.port)
+        assert result == {"status": "error", "error": "No response received"}
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            free_port = s.getsockname()[1]
+        with pytest.raises(ConnectionError):
+            send_command("print(1)", port=free_port)
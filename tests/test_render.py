@@ -0,0 +1,92 @@
+"""
+Tests for manifest-driven batch rendering, run against a fake pymol.cmd.
+
+Run with: python -m pytest tests/test_render.py -v
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.render import load_manifest, render_manifest, scene_hash
+
+PDB = (
+    "ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N\n"
+    "ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00  0.00           C\n"
+    "END\n"
+)
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    """A two-scene manifest sharing one structure."""
+    (tmp_path / "ala.pdb").write_text(PDB)
+    scenes = [
+        {
+            "structure": "ala.pdb",
+            "recipe": "cmd.show('sticks', obj)",
+            "output": "out/a.png",
+            "width": 64,
+            "height": 48,
+        },
+        {
+            "structure": "ala.pdb",
+            "recipe": ["cmd.color('red', obj)"],
+            "output": "out/b.png",
+            "ray": False,
+        },
+    ]
+    path = tmp_path / "scenes.jsonl"
+    path.write_text("\n".join(json.dumps(s) for s in scenes) + "\n")
+    return path
+
+
+class TestManifest:
+    """Test manifest parsing and hashing."""
+
+    def test_paths_resolved_and_defaults_filled(self, manifest):
+        scenes = load_manifest(manifest)
+        assert scenes[0]["structure"] == str(manifest.parent / "ala.pdb")
+        assert scenes[1]["width"] == 800
+        assert scenes[1]["recipe"] == "cmd.color('red', obj)"
+
+    def test_missing_fields(self, tmp_path):
+        path = tmp_path / "bad.jsonl"
+        path.write_text('{"structure": "x.pdb"}\n')
+        with pytest.raises(ValueError, match="output"):
+            load_manifest(path)
+
+    def test_hash_tracks_recipe_and_structure(self, manifest):
+        scene = load_manifest(manifest)[0]
+        digest = scene_hash(scene)
+        assert scene_hash(dict(scene, width=65)) != digest
+        (manifest.parent / "ala.pdb").write_text(PDB.replace("ALA", "GLY"))
+        assert scene_hash(scene) != digest
+
+
+class TestRenderManifest:
+    """Test batch rendering against the stub server."""
+
+    def test_render_then_resume(self, manifest, server):
+        logs = []
+        results = render_manifest(manifest, ports=[server.port], log=logs.append)
+        assert len(results["rendered"]) == 2
+        assert (manifest.parent / "out" / "a.png").exists()
+        # The structure was loaded once and copied per scene
+        assert sum(n.startswith("src_") for n in server.fake_cmd.objects) == 1
+
+        results = render_manifest(manifest, ports=[server.port], log=logs.append)
+        assert results["rendered"] == []
+        assert len(results["skipped"]) == 2
+
+        results = render_manifest(
+            manifest, ports=[server.port], force=True, log=logs.append
+        )
+        assert len(results["rendered"]) == 2
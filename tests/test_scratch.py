@@ -0,0 +1,88 @@
+"""
+Tests for the scratch image store.
+
+Run with: python -m pytest tests/test_scratch.py -v
+"""
+
+import os
+import sys
+import time
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.scratch import ScratchStore  # noqa: E402
+
+
+def write(store, name, content, used=None):
+    path = store.new_path(name)
+    path.write_bytes(content)
+    store.add(path)
+    if used is not None:
+        entries = store._load()
+        entries[path.name]["used"] = used
+        store._save(entries)
+    return path
+
+
+class TestScratchStore:
+    """Test naming, deduplication and eviction."""
+
+    def test_names_are_unique(self, tmp_path):
+        store = ScratchStore(tmp_path)
+        paths = {store.new_path() for _ in range(100)}
+        paths |= {store.new_path("ubq view") for _ in range(100)}
+        assert len(paths) == 200
+        assert all(p.name.startswith(("view_", "ubq_view_")) for p in paths)
+
+    def test_identical_images_are_hard_linked(self, tmp_path):
+        store = ScratchStore(tmp_path)
+        first = write(store, "a", b"same image")
+        second = write(store, "b", b"same image")
+        third = write(store, "c", b"other image")
+        assert os.path.samefile(first, second)
+        assert not os.path.samefile(first, third)
+        assert [e["name"] for e in store.entries()] == [
+            first.name,
+            second.name,
+            third.name,
+        ]
+
+    def test_least_recently_used_evicted_past_size(self, tmp_path):
+        store = ScratchStore(tmp_path, max_bytes=250)
+        now = time.time()
+        old = write(store, "old", b"a" * 100, used=now - 30)
+        recent = write(store, "recent", b"b" * 100, used=now - 10)
+        store.touch(old)
+        newest = write(store, "newest", b"c" * 100)
+        assert old.exists() and newest.exists()
+        assert not recent.exists()
+
+    def test_twins_count_once(self, tmp_path):
+        store = ScratchStore(tmp_path, max_bytes=250)
+        images = [write(store, f"same{i}", b"a" * 100) for i in range(5)]
+        write(store, "other", b"b" * 100)
+        assert all(path.exists() for path in images)
+
+    def test_old_images_expire(self, tmp_path):
+        store = ScratchStore(tmp_path, max_age_s=60)
+        stale = write(store, "stale", b"x", used=time.time() - 120)
+        fresh = write(store, "fresh", b"y")
+        assert store.evict() == []
+        assert not stale.exists() and fresh.exists()
+
+    def test_newest_image_is_kept_even_when_too_large(self, tmp_path):
+        store = ScratchStore(tmp_path, max_bytes=10)
+        big = write(store, "big", b"z" * 100)
+        assert big.exists()
+
+    def test_unindexed_files_are_adopted(self, tmp_path):
+        legacy = tmp_path / "view_120000.png"
+        legacy.write_bytes(b"legacy")
+        os.utime(legacy, (time.time() - 100, time.time() - 100))
+        (tmp_path / "x.partial.png").write_bytes(b"being written")
+        store = ScratchStore(tmp_path)
+        names = [e["name"] for e in store.entries()]
+        assert names == ["view_120000.png"]
@@ -8,12 +8,15 @@ import os
 import signal
 import subprocess
 import sys
+import threading
 import time
 
 import pytest
 
 # Add src directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
 
 from claudemol.session import PyMOLSession
 
@@ -94,6 +97,34 @@ class TestCommandExecution:
         # reinitialize doesn't print anything, but shouldn't error
         assert result is not None
 
+    def test_batch_suspends_updates(self, session):
+        """Updates are suspended inside a batch and resumed after it."""
+        session.start(timeout=20.0)
+
+        with session.batch() as info:
+            session.execute("cmd.fragment('trp'); cmd.show('surface')")
+            assert session.execute("print(cmd.get('suspend_updates'))") == "on\n"
+
+        assert session.execute("print(cmd.get('suspend_updates'))") == "off\n"
+        assert info["suspended_ms"] > 0
+
+    def test_execute_from_threads(self, session):
+        """Threads sharing a session each get their own connection."""
+        session.start(timeout=20.0)
+        results = {}
+
+        def work(i):
+            results[i] = session.execute(f"print({i} * 2)")
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == {i: f"{i * 2}\n" for i in range(8)}
+        assert 1 <= session.pool.size <= 8
+
 
 class TestRecovery:
     """Test crash detection and recovery."""
@@ -130,6 +161,20 @@ class TestRecovery:
             result = session.execute("print('recovered')", auto_recover=True)
             assert "recovered" in result
 
+    def test_recover_restores_checkpoint(self, session):
+        """Recovery should bring back the scene from the last checkpoint."""
+        session.start(timeout=20.0)
+        session.execute("cmd.reinitialize()\ncmd.fragment('ala')")
+        session.wait_for_checkpoint()
+
+        if session.process and session._we_launched:
+            os.kill(session.process.pid, signal.SIGKILL)
+            time.sleep(1)
+
+            session.recover(timeout=20.0)
+            assert "ala" in session.execute("print(cmd.get_names())")
+            assert session.last_restore["restore_ms"] > 0
+
 
 class TestConnectToExisting:
     """Test connecting to an already-running PyMOL."""
@@ -0,0 +1,112 @@
+"""
+Tests for the prepared session cache, run against the stub PyMOL server.
+
+Run with: python -m pytest tests/test_sessioncache.py -v
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.checkpoint import Checkpoint  # noqa: E402
+from claudemol.sessioncache import SessionCache  # noqa: E402
+
+RECIPE = ["cmd.fragment('ala')", "cmd.set_view([float(i) for i in range(18)])"]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SessionCache(tmp_path / "sessions")
+
+
+class TestSessionCache:
+    """Test keys, storage and eviction."""
+
+    def test_key_covers_recipe_and_input_contents(self, tmp_path):
+        a = tmp_path / "a.pdb"
+        b = tmp_path / "b.pdb"
+        a.write_text("ATOM")
+        b.write_text("ATOM")
+        key = SessionCache.key(RECIPE, [a])
+        assert key == SessionCache.key("\n".join(RECIPE), [b])
+        assert key != SessionCache.key(RECIPE[:1], [a])
+        b.write_text("HETATM")
+        assert key != SessionCache.key(RECIPE, [b])
+
+    def test_round_trip(self, cache):
+        assert cache.get("k") is None
+        cache.put("k", Checkpoint(b"session", "zlib", serial=3, raw_bytes=70))
+        checkpoint = cache.get("k")
+        assert checkpoint.data == b"session"
+        assert (checkpoint.codec, checkpoint.raw_bytes) == ("zlib", 70)
+
+    def test_least_recently_used_evicted_past_size(self, cache):
+        cache.max_bytes = 700  # two sessions with their headers
+        for i, key in enumerate(["old", "recent"]):
+            cache.put(key, Checkpoint(b"x" * 200, "zlib"))
+            used = time.time() - 30 + 10 * i
+            os.utime(cache._path(key), (used, used))
+        cache.get("old")
+        cache.put("newest", Checkpoint(b"x" * 200, "zlib"))
+        assert [e["key"] for e in cache.entries()] == ["old", "newest"]
+
+    def test_newest_session_is_kept_even_when_too_large(self, cache):
+        cache.max_bytes = 10
+        cache.put("big", Checkpoint(b"x" * 100, "zlib"))
+        assert cache.get("big") is not None
+
+    def test_damaged_session_is_a_miss(self, cache):
+        cache.root.mkdir(parents=True)
+        cache._path("k").write_bytes(b"not a header\n")
+        assert cache.get("k") is None
+
+
+class TestPrepare:
+    """Test recipes run once, then loaded from the cache."""
+
+    def test_second_run_loads_objects(self, session, server, cache, tmp_path):
+        structure = tmp_path / "ala.pdb"
+        structure.write_text("ATOM")
+        first = session.prepare(RECIPE, [structure], cache=cache)
+        assert first["cached"] is False
+        server.fake_cmd.delete("ala")
+        server.fake_cmd.set_view([0.0] * 18)
+
+        second = session.prepare(RECIPE, [structure], cache=cache)
+        assert second["cached"] is True and second["key"] == first["key"]
+        assert server.fake_cmd.get_names() == ["ala"]
+        assert server.fake_cmd.view == [float(i) for i in range(18)]
+
+        structure.write_text("HETATM")
+        assert session.prepare(RECIPE, [structure], cache=cache)["cached"] is False
+
+    def test_other_objects_are_left_alone(self, session, server, cache):
+        server.fake_cmd.fragment("gly", "unrelated")
+        assert session.prepare(RECIPE, cache=cache)["cached"] is False
+        assert server.fake_cmd.get_names() == ["unrelated", "ala"]
+
+        server.fake_cmd.delete("all")
+        server.fake_cmd.fragment("ser", "other")
+        assert session.prepare(RECIPE, cache=cache)["cached"] is True
+        assert server.fake_cmd.get_names() == ["other", "ala"]
+
+    def test_unloadable_session_is_prepared_again(self, session, server, cache):
+        key = cache.key(RECIPE)
+        cache.put(key, Checkpoint(b"x", "no-such-codec"))
+        assert session.prepare(RECIPE, cache=cache)["cached"] is False
+        assert server.fake_cmd.get_names() == ["ala"]
+        assert cache.get(key).codec != "no-such-codec"
+
+    def test_stored_surfaces_are_rekeyed(self, server):
+        plugin = sys.modules[type(server).__module__]
+        # Keyed in another process, whose string hashes differ
+        entry = [8, (123, 1, 2147483647), ("SurfaceJob", 1, [0.0]), "data", 0, 0.0]
+        plugin._rekey_cache([entry])
+        assert entry[1] == (hash("SurfaceJob") & 0x7FFFFFFF, 1, 2147483647)
@@ -0,0 +1,66 @@
+"""
+Tests for latency statistics aggregation.
+
+Run with: python -m pytest tests/test_stats.py -v
+"""
+
+import json
+import os
+import sys
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from claudemol.stats import LatencyStats, percentile, summarize
+
+
+class TestPercentiles:
+    """Test percentile math."""
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.95) == 95
+        assert percentile(values, 0.99) == 99
+
+    def test_empty(self):
+        assert percentile([], 0.5) == 0.0
+        assert summarize([])["count"] == 0
+
+
+class TestLatencyStats:
+    """Test per-kind aggregation and export."""
+
+    def test_summary_per_kind(self):
+        stats = LatencyStats()
+        for i in range(10):
+            stats.record("execute", {"exec_ms": float(i), "bytes_in": 10})
+        stats.record("render", {"exec_ms": 500.0, "label": "ignored"})
+
+        summary = stats.summary()
+        assert summary["execute"]["exec_ms"]["count"] == 10
+        assert summary["execute"]["exec_ms"]["p50"] == 4.0
+        assert "label" not in summary["render"]
+
+    def test_window_is_bounded(self):
+        stats = LatencyStats(window=5)
+        for i in range(20):
+            stats.record("execute", {"exec_ms": float(i)})
+        assert stats.summary()["execute"]["exec_ms"]["count"] == 5
+
+    def test_json_export(self):
+        stats = LatencyStats()
+        stats.extend({"execute": [{"total_ms": 1.0}, {"total_ms": 3.0}]})
+        data = json.loads(stats.to_json())
+        assert data["execute"]["total_ms"]["max"] == 3.0
+
+    def test_prometheus_export(self):
+        stats = LatencyStats()
+        stats.record("execute", {"exec_ms": 2.0, "bytes_out": 100})
+        text = stats.to_prometheus(prefix="test")
+
+        assert "# TYPE test_exec_seconds summary" in text
+        assert 'test_exec_seconds{kind="execute",quantile="0.5"} 0.002' in text
+        assert 'test_bytes_out_count{kind="execute"} 1' in text
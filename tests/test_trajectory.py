@@ -0,0 +1,122 @@
+"""
+Tests for trajectory streaming, run against the stub PyMOL server.
+
+Run with: python -m pytest tests/test_trajectory.py -v
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+np = pytest.importorskip("numpy")
+
+from claudemol.trajectory import (  # noqa: E402
+    CoordinatePusher,
+    push_coords,
+    stream_trajectory,
+)
+
+
+@pytest.fixture
+def server(server):
+    server.fake_cmd.fragment("ala")  # 10 atoms, 1 state
+    return server
+
+
+def frames(n, atoms=10):
+    return np.arange(n * atoms * 3, dtype=np.float32).reshape(n, atoms, 3)
+
+
+class TestStreamTrajectory:
+    """Test chunked coordinate-set streaming."""
+
+    def test_appends_states_in_chunks(self, conn, server):
+        # 120 bytes per frame: 4 frames per request
+        result = stream_trajectory(conn, "ala", frames(10), chunk_bytes=480)
+        assert result["frames_sent"] == 10
+        assert result["states"] == 11
+        assert conn.stats.summary()["coordsets"]["total_ms"]["count"] >= 3
+        last = server.fake_cmd.objects["ala"]["states"][-1]
+        assert last[0] == (270.0, 271.0, 272.0)
+
+    def test_overwrites_from_state(self, conn, server):
+        stream_trajectory(conn, "ala", frames(3))
+        stream_trajectory(conn, "ala", frames(2) + 1000, state=2)
+        states = server.fake_cmd.objects["ala"]["states"]
+        assert len(states) == 4
+        assert states[1][0] == (1000.0, 1001.0, 1002.0)
+
+    def test_memory_ceiling_strides(self, conn):
+        result = stream_trajectory(conn, "ala", frames(100), max_bytes=120 * 25)
+        assert result["stride"] == 4
+        assert result["frames_sent"] == 25
+        assert result["frames_dropped"] == 0
+
+    def test_memory_ceiling_drops_from_iterator(self, conn):
+        result = stream_trajectory(
+            conn, "ala", iter(frames(100)), max_bytes=120 * 25, on_limit="drop"
+        )
+        assert result["frames_sent"] == 25
+        assert result["frames_dropped"] is None
+
+    def test_atom_mismatch_is_an_error(self, conn):
+        with pytest.raises(RuntimeError, match="mismatch"):
+            stream_trajectory(conn, "ala", frames(2, atoms=7))
+
+    def test_without_numpy_is_an_error(self, conn, server, monkeypatch):
+        plugin = sys.modules[type(server).__module__]
+        monkeypatch.setattr(plugin, "numpy", None)
+        with pytest.raises(RuntimeError, match="NumPy"):
+            stream_trajectory(conn, "ala", frames(2))
+        assert conn.execute("_result = 1") == "1"
+
+
+class TestPushCoords:
+    """Test live coordinate pushes."""
+
+    def test_push_updates_state_in_place(self, server):
+        with CoordinatePusher(port=server.port) as pusher:
+            pusher.push("ala", frames(1)[0] + 5)
+            pusher.flush()
+            assert pusher.sent == 1
+        states = server.fake_cmd.objects["ala"]["states"]
+        assert len(states) == 1
+        assert states[0][0] == (5.0, 6.0, 7.0)
+
+    def test_slow_pymol_coalesces_to_latest(self, server, monkeypatch):
+        fake = server.fake_cmd
+        original = fake.load_coordset
+
+        def slow_load_coordset(*args, **kwargs):
+            time.sleep(0.05)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(fake, "load_coordset", slow_load_coordset)
+        with CoordinatePusher(port=server.port) as pusher:
+            for i in range(20):
+                pusher.push("ala", frames(1)[0] + i)
+            pusher.flush()
+            assert pusher.coalesced > 0
+            assert pusher.sent + pusher.coalesced == 20
+        assert fake.objects["ala"]["states"][0][0] == (19.0, 20.0, 21.0)
+
+    def test_errors_surface_on_next_call(self, server):
+        with CoordinatePusher(port=server.port) as pusher:
+            pusher.push("missing", frames(1)[0])
+            with pytest.raises(RuntimeError):
+                pusher.flush()
+
+    def test_push_coords_shares_a_pusher(self, server):
+        pusher = push_coords("ala", frames(1)[0], port=server.port)
+        try:
+            assert push_coords("ala", frames(1)[0], port=server.port) is pusher
+            pusher.flush()
+        finally:
+            pusher.close()